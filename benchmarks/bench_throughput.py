@@ -0,0 +1,140 @@
+"""Measures the throughput of download, activate and load_providers against local stand-ins of the Mod Providers' servers.
+
+Every benchmark runs for synthetic profiles of each --bench-sizes mod count (see standin.synthetic_profile) without
+touching the network, so the numbers only change when mcmm (or the machine) does. See conftest.py for the options.
+"""
+
+import os
+from json import dump
+from pathlib import Path
+from shutil import rmtree as shutil_rmtree
+
+import pytest
+
+from standin import redirect_session, synthetic_profile
+
+@pytest.fixture
+def provider_runner(bench_home, standin):
+	from mcmm import aggregate_mod_provider_list
+	from mcmm.cache import ResponseCache
+	from mcmm.dirs import gen_cache_dir
+	from mcmm.plugin_internal import load_providers
+	from mcmm.session import ProviderSession
+
+	session = ProviderSession(cache=ResponseCache(gen_cache_dir() / "http"))
+	redirect_session(session, standin)
+
+	runner = load_providers(aggregate_mod_provider_list({"mod_providers": []}), session=session)
+	yield runner
+	runner.close()
+
+@pytest.fixture
+def profile(bench_home, mod_count) -> str:
+	from mcmm.dirs import gen_config_dir
+
+	name = f"bench{mod_count}"
+	profile_file = gen_config_dir() / f"profiles/{name}.json"
+	profile_file.parent.mkdir(parents=True, exist_ok=True)
+	with profile_file.open("w") as f:
+		dump(synthetic_profile(mod_count), f)
+
+	return name
+
+def _clear_downloads(home: Path) -> None:
+	"""Removes the jar store and every cache except the provider registry, like on a machine that never downloaded anything.
+	"""
+	shutil_rmtree(str(home / ".mcmm"), ignore_errors=True)
+	for path in (home / ".cache/mcmm").glob("*"):
+		if path.name != "providers.json":
+			shutil_rmtree(str(path), ignore_errors=True)
+
+def _clear_mods_folder(home: Path) -> None:
+	for file in (home / ".minecraft/mods").glob("*.jar"):
+		os.chmod(str(file), 0o644)
+		file.unlink()
+
+def _ensure_downloaded(profile: str, provider_runner) -> None:
+	from mcmm.commands import _jar_store, download
+
+	if _jar_store().load_manifest(profile) is None:
+		download(profile, provider_runner)
+
+def _round_stats(benchmark, standin, mod_count: int, target):
+	"""Runs target and records the number of mods and the requests and bytes the stand-in servers answered with in benchmark.extra_info.
+	"""
+	def measured():
+		standin.reset_stats()
+		target()
+		benchmark.extra_info.update({"mods": mod_count, "requests": standin.requests, "bytes": standin.bytes_sent})
+	return measured
+
+def test_load_providers_rescan(benchmark, bench_home, bench_rounds):
+	"""Loads the providers without a registry manifest, so every provider module is scanned again.
+
+	The modules stay imported between rounds, so this is the cost of scanning them, not of importing them (see import_time.py).
+	"""
+	from mcmm import aggregate_mod_provider_list
+	from mcmm.dirs import gen_cache_dir
+	from mcmm.plugin_internal import load_providers
+
+	def setup():
+		manifest = gen_cache_dir() / "providers.json"
+		if manifest.exists():
+			manifest.unlink()
+
+	benchmark.pedantic(lambda: load_providers(aggregate_mod_provider_list({"mod_providers": []})).close(), setup=setup, rounds=bench_rounds)
+
+def test_load_providers_warm(benchmark, bench_home, bench_rounds):
+	from mcmm import aggregate_mod_provider_list
+	from mcmm.plugin_internal import load_providers
+
+	providers = aggregate_mod_provider_list({"mod_providers": []})
+	load_providers(providers).close()
+	benchmark.pedantic(lambda: load_providers(providers).close(), rounds=bench_rounds)
+
+def test_download_cold(benchmark, bench_home, standin, provider_runner, profile, mod_count, bench_rounds):
+	from mcmm.commands import download
+
+	benchmark.pedantic(
+		_round_stats(benchmark, standin, mod_count, lambda: download(profile, provider_runner)),
+		setup=lambda: _clear_downloads(bench_home),
+		rounds=bench_rounds,
+	)
+	assert benchmark.extra_info["requests"] != 0
+
+def test_download_unchanged(benchmark, standin, provider_runner, profile, mod_count, bench_rounds):
+	"""Downloads a profile whose jars are all in the store and whose API responses are all cached and fresh.
+	"""
+	from mcmm.commands import download
+
+	_ensure_downloaded(profile, provider_runner)
+	benchmark.pedantic(_round_stats(benchmark, standin, mod_count, lambda: download(profile, provider_runner)), rounds=bench_rounds)
+
+def test_download_revalidate(benchmark, standin, provider_runner, profile, mod_count, bench_rounds):
+	"""Same as test_download_unchanged, but with --refresh, so every cached API response is revalidated with a conditional request.
+	"""
+	from mcmm.commands import download
+
+	_ensure_downloaded(profile, provider_runner)
+	provider_runner.session.refresh_cache = True
+	benchmark.pedantic(_round_stats(benchmark, standin, mod_count, lambda: download(profile, provider_runner)), rounds=bench_rounds)
+
+def test_activate_empty(benchmark, bench_home, provider_runner, profile, mod_count, bench_rounds):
+	"""Activates a profile into an empty mods folder, so every jar is linked.
+	"""
+	from mcmm.commands import activate
+
+	_ensure_downloaded(profile, provider_runner)
+	benchmark.extra_info["mods"] = mod_count
+	benchmark.pedantic(lambda: activate(profile), setup=lambda: _clear_mods_folder(bench_home), rounds=bench_rounds)
+	assert len(list((bench_home / ".minecraft/mods").glob("*.jar"))) != 0
+
+def test_activate_unchanged(benchmark, bench_home, provider_runner, profile, mod_count, bench_rounds):
+	"""Activates a profile that is already active, so every jar only has to be compared.
+	"""
+	from mcmm.commands import activate
+
+	_ensure_downloaded(profile, provider_runner)
+	activate(profile)
+	benchmark.extra_info["mods"] = mod_count
+	benchmark.pedantic(lambda: activate(profile), rounds=bench_rounds)
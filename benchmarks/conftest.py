@@ -0,0 +1,121 @@
+"""Fixtures of the throughput benchmarks (bench_*.py), which pytest only runs when they are named on the command line:
+
+	python -m pytest benchmarks/bench_throughput.py [--bench-sizes 10,100,1000] [--bench-latency-ms MS] [--bench-jar-size BYTES]
+
+The benchmarks use the benchmark fixture of pytest-benchmark if it is installed. Otherwise a minimal fixture with the
+same call and pedantic methods times each benchmark and prints the results at the end of the run.
+"""
+
+import os, statistics, time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import pytest
+
+from standin import DEFAULT_JAR_SIZE, StandInServer
+
+DEFAULT_SIZES = "10,100,1000"
+DEFAULT_ROUNDS = 3
+
+try:
+	import pytest_benchmark # noqa: F401
+	HAS_PYTEST_BENCHMARK = True
+except ImportError:
+	HAS_PYTEST_BENCHMARK = False
+
+def pytest_addoption(parser) -> None:
+	group = parser.getgroup("mcmm benchmarks")
+	group.addoption("--bench-sizes", default=DEFAULT_SIZES, help=f"Comma separated mod counts of the synthetic profiles (default: {DEFAULT_SIZES})")
+	group.addoption("--bench-latency-ms", type=float, default=0.0, help="Delay of every response of the stand-in servers (default: 0)")
+	group.addoption("--bench-jar-size", type=int, default=DEFAULT_JAR_SIZE, help=f"Size of every served jar in bytes (default: {DEFAULT_JAR_SIZE})")
+	group.addoption("--bench-rounds", type=int, default=DEFAULT_ROUNDS, help=f"Rounds of every benchmark (default: {DEFAULT_ROUNDS})")
+
+def pytest_generate_tests(metafunc) -> None:
+	if "mod_count" in metafunc.fixturenames:
+		sizes = [int(size) for size in metafunc.config.getoption("--bench-sizes").split(",")]
+		metafunc.parametrize("mod_count", sizes, ids=[f"{size}mods" for size in sizes])
+
+class _Benchmark:
+	"""The subset of pytest-benchmark's fixture that the benchmarks use.
+	"""
+
+	def __init__(self, name: str, results: List):
+		self.name: str = name
+		self.extra_info: Dict = {}
+		self._results: List = results
+
+	def __call__(self, target: Callable, *args, **kwargs):
+		return self.pedantic(target, args=args, kwargs=kwargs, rounds=DEFAULT_ROUNDS)
+
+	def pedantic(self, target: Callable, args=(), kwargs=None, setup: Callable = None, rounds: int = 1, iterations: int = 1, warmup_rounds: int = 0):
+		kwargs = kwargs or {}
+
+		for _ in range(warmup_rounds):
+			if setup is not None:
+				setup()
+			target(*args, **kwargs)
+
+		samples = []
+		for _ in range(rounds):
+			if setup is not None:
+				setup()
+			start = time.perf_counter()
+			for _ in range(iterations):
+				result = target(*args, **kwargs)
+			samples.append((time.perf_counter() - start) / iterations)
+
+		self._results.append((self.name, samples, self.extra_info))
+		return result
+
+_results: List = []
+
+if not HAS_PYTEST_BENCHMARK:
+	@pytest.fixture
+	def benchmark(request) -> _Benchmark:
+		return _Benchmark(request.node.name, _results)
+
+	def pytest_terminal_summary(terminalreporter) -> None:
+		if len(_results) == 0:
+			return
+
+		terminalreporter.section("benchmarks (install pytest-benchmark for more statistics)")
+		for name, samples, extra_info in _results:
+			median = statistics.median(samples)
+			line = f"{name:<44} median {median * 1000:9.1f} ms, min {min(samples) * 1000:9.1f} ms, max {max(samples) * 1000:9.1f} ms"
+			if "mods" in extra_info:
+				line += f", {extra_info['mods'] / median:8.1f} mods/s"
+			terminalreporter.write_line(line)
+
+@pytest.fixture(scope="session")
+def bench_home(tmp_path_factory) -> Path:
+	"""An empty home folder with a .minecraft/mods folder, which stays HOME (and LOCALAPPDATA/APPDATA) for the whole run.
+
+	mcmm must only be imported after this fixture, because some Mod Providers read HOME when they are imported.
+	"""
+	home = tmp_path_factory.mktemp("home")
+	(home / ".minecraft/mods").mkdir(parents=True)
+
+	previous = {var: os.environ.get(var) for var in ("HOME", "LOCALAPPDATA", "APPDATA")}
+	for var in previous:
+		os.environ[var] = str(home)
+
+	yield home
+
+	for var, value in previous.items():
+		if value is None:
+			del os.environ[var]
+		else:
+			os.environ[var] = value
+
+@pytest.fixture(scope="session")
+def standin(request) -> StandInServer:
+	server = StandInServer(
+		latency=request.config.getoption("--bench-latency-ms") / 1000,
+		jar_size=request.config.getoption("--bench-jar-size"),
+	).start()
+	yield server
+	server.stop()
+
+@pytest.fixture
+def bench_rounds(request) -> int:
+	return request.config.getoption("--bench-rounds")
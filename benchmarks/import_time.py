@@ -0,0 +1,72 @@
+"""Measures the cold start latency of cheap mcmm commands.
+
+Every sample is a new interpreter, so the numbers include interpreter startup and all imports, like a
+scripted `mcmm list` does. The commands run with HOME pointing at an empty temporary folder.
+
+Usage: python benchmarks/import_time.py [--runs N] [--max-ms MS] [--profile]
+
+--max-ms makes the script exit with an error if the median of any command exceeds MS milliseconds.
+--profile prints the slowest imports of `mcmm list` according to `python -X importtime`.
+"""
+
+import argparse, statistics, subprocess, sys, tempfile, time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+COMMANDS = {
+	"import mcmm": "import mcmm",
+	"mcmm --version": "import sys; sys.argv = ['mcmm', '--version']; from mcmm import cli; cli()",
+	"mcmm list": "import sys; sys.argv = ['mcmm', 'list']; from mcmm import cli; cli()",
+}
+
+def _env(home: str) -> dict:
+	return {"HOME": home, "LOCALAPPDATA": home, "APPDATA": home, "PATH": ""}
+
+def sample(code: str, home: str) -> float:
+	start = time.perf_counter()
+	subprocess.run([sys.executable, "-c", code], cwd=str(REPO_DIR), env=_env(home), stdout=subprocess.DEVNULL, check=True)
+	return (time.perf_counter() - start) * 1000
+
+def slowest_imports(code: str, home: str, count: int = 10) -> list:
+	p = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=str(REPO_DIR), env=_env(home), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+	imports = []
+	for line in p.stderr.splitlines():
+		if not line.startswith("import time:") or "self [us]" in line:
+			continue
+		_, cumulative, name = line[len("import time:"):].split("|")
+		imports.append((int(cumulative), name.strip()))
+
+	return sorted(imports, reverse=True)[:count]
+
+def main() -> int:
+	parser = argparse.ArgumentParser(description="Measures the cold start latency of cheap mcmm commands.")
+	parser.add_argument("--runs", type=int, default=20)
+	parser.add_argument("--max-ms", type=float, default=None)
+	parser.add_argument("--profile", action="store_true")
+	args = parser.parse_args()
+
+	failed = False
+	with tempfile.TemporaryDirectory() as home:
+		python_ms = statistics.median(sample("pass", home) for _ in range(args.runs))
+		print(f"{'python -c pass':<16} median {python_ms:7.1f} ms (interpreter startup only)")
+
+		for name, code in COMMANDS.items():
+			samples = [sample(code, home) for _ in range(args.runs)]
+			median = statistics.median(samples)
+			print(f"{name:<16} median {median:7.1f} ms, min {min(samples):7.1f} ms, max {max(samples):7.1f} ms")
+
+			if args.max_ms is not None and median > args.max_ms:
+				print(f"  over the budget of {args.max_ms:.1f} ms")
+				failed = True
+
+		if args.profile:
+			print("\nSlowest imports of mcmm list (cumulative):")
+			for cumulative, module in slowest_imports(COMMANDS["mcmm list"], home):
+				print(f"{cumulative / 1000:8.1f} ms  {module}")
+
+	return 1 if failed else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
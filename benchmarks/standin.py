@@ -0,0 +1,395 @@
+"""standin.py contains a local HTTP server that stands in for the endpoints the internal Mod Providers use.
+
+The server answers the Modrinth, CurseForge, GitHub and OptiFine requests made while resolving and fetching the
+entries of a synthetic profile (see synthetic_profile), and serves a deterministic jar for every download link
+it hands out. Each response can be delayed by a fixed latency to imitate the round trip to the real servers.
+
+Mod Providers request the real URLs, so redirect_session mounts an adapter on a ProviderSession that sends
+every request for one of the stood-in hosts to the local server instead.
+
+The server also serves the folder in its mirror_dir (if set) at <server url>/mirror, like a static HTTP server
+that a mirror made with `mcmm mirror` was copied to, and jars at <server url>/faults/<file name> that honor
+Range/If-Range and fail in the ways queued in its faults list, for testing how downloads recover.
+"""
+
+import hashlib, threading, time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import dumps, loads
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+MC_VERSION = "1.18.1"
+DEFAULT_JAR_SIZE = 64 * 1024
+# The highest mod number that /version_files/update looks for when matching hashes.
+MAX_MODS = 100_000
+
+HOSTS = [
+	"api.modrinth.com",
+	"cdn.modrinth.com",
+	"addons-ecs.forgesvc.net",
+	"edge.forgecdn.net",
+	"api.github.com",
+	"github.com",
+	"optifine.net",
+]
+
+PUBLISHED_AT = "2022-01-01T00:00:00Z"
+OPTIFINE_JAR = f"OptiFine_{MC_VERSION}_HD_U_H4.jar"
+
+@lru_cache(maxsize=None)
+def jar_bytes(file_name: str, size: int) -> bytes:
+	"""Returns the contents of the jar file_name, which are unique to file_name and always the same.
+	"""
+	block = hashlib.sha256(file_name.encode()).digest()
+	return (block * (size // len(block) + 1))[:size]
+
+@lru_cache(maxsize=None)
+def jar_hashes(file_name: str, size: int) -> Dict[str, str]:
+	content = jar_bytes(file_name, size)
+	return {"sha1": hashlib.sha1(content).hexdigest(), "sha512": hashlib.sha512(content).hexdigest()}
+
+def synthetic_profile(mod_count: int, mc_version: str = MC_VERSION) -> Dict:
+	"""Returns a profile of mod_count entries that the stand-in server can resolve and fetch.
+
+	Like most real profiles it is mostly Modrinth entries, with a share of CurseForge and GitHub
+	release entries and a single OptiFine entry.
+	"""
+	mods = [{"provider": "optifine", "metadata": {"allow_prerelease": False}}]
+
+	for i in range(1, mod_count):
+		if i % 10 == 0:
+			mods.append({"provider": "github", "metadata": {
+				"repo": f"bench/ghmod{i}",
+				"releases": {"latest": True, "tag": None, "must_contain": [], "must_not_contain": []},
+				"compile": None,
+			}})
+		elif i % 5 == 0:
+			mods.append({"provider": "curse_forge", "metadata": {"name": f"cfmod{i}", "id": str(i), "check_file_name": None}})
+		else:
+			mods.append({"provider": "modrinth", "metadata": {
+				"id": f"benchmod{i}",
+				"allow_prereleases": False,
+				"mod_loader": "fabric",
+				"must_contain": [],
+				"must_not_contain": [],
+			}})
+
+	return {"minecraft_version": mc_version, "mods": mods}
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+	"""The stand-in for every host in HOSTS, listening on a free port of 127.0.0.1.
+
+	Requests are expected to start with the host they were meant for, like /api.modrinth.com/v2/projects,
+	which is what redirect_session rewrites them to.
+	"""
+	daemon_threads = True
+
+	def __init__(self, latency: float = 0.0, jar_size: int = DEFAULT_JAR_SIZE, mc_version: str = MC_VERSION):
+		super().__init__(("127.0.0.1", 0), _Handler)
+		self.latency: float = latency
+		self.jar_size: int = jar_size
+		self.mc_version: str = mc_version
+		self.mirror_dir: Union[Path, None] = None
+		# Consumed one per /faults request: ("status", code, Retry-After or None) answers with that status,
+		# ("drop", n) closes the connection after n bytes of the body. The jar changes with faults_etag.
+		self.faults: List[Tuple] = []
+		self.faults_etag: str = '"1"'
+		self.faults_requests: List[Dict[str, str]] = []
+
+		self.requests = 0
+		self.bytes_sent = 0
+		self._stats_lock = threading.Lock()
+		self._thread: Union[threading.Thread, None] = None
+
+		# {sha1 of a Modrinth jar: mod number}, filled lazily by /version_files/update
+		self._modrinth_sha1s: Dict[str, int] = {}
+		self._modrinth_sha1s_lock = threading.Lock()
+
+	@property
+	def url(self) -> str:
+		return f"http://127.0.0.1:{self.server_address[1]}"
+
+	def start(self) -> "StandInServer":
+		self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self.shutdown()
+		self.server_close()
+
+	def reset_stats(self) -> None:
+		with self._stats_lock:
+			self.requests = 0
+			self.bytes_sent = 0
+
+	def _count(self, body_size: int) -> None:
+		with self._stats_lock:
+			self.requests += 1
+			self.bytes_sent += body_size
+
+	def jar(self, file_name: str) -> bytes:
+		return jar_bytes(file_name, self.jar_size)
+
+	def modrinth_version(self, i: int) -> Dict:
+		file_name = f"benchmod{i}-1.0.0.jar"
+		return {
+			"id": f"version{i}",
+			"project_id": f"project{i}",
+			"version_type": "release",
+			"loaders": ["fabric"],
+			"game_versions": [self.mc_version],
+			"date_published": PUBLISHED_AT,
+			"files": [{
+				"filename": file_name,
+				"url": f"https://cdn.modrinth.com/data/project{i}/versions/version{i}/{file_name}",
+				"size": self.jar_size,
+				"hashes": jar_hashes(file_name, self.jar_size),
+			}],
+		}
+
+	def modrinth_mods_by_sha1(self, hashes: List[str]) -> Dict[str, int]:
+		"""Returns the mod number of every Modrinth jar in hashes that the server knows about.
+
+		The synthetic jars are only told apart by their names, so the jars of mod 1, 2, ... are hashed until all hashes are known.
+		"""
+		wanted = set(hashes)
+		with self._modrinth_sha1s_lock:
+			i = len(self._modrinth_sha1s)
+			while not wanted <= self._modrinth_sha1s.keys() and i < MAX_MODS:
+				i += 1
+				self._modrinth_sha1s[self.modrinth_version(i)["files"][0]["hashes"]["sha1"]] = i
+			return {sha1: self._modrinth_sha1s[sha1] for sha1 in wanted if sha1 in self._modrinth_sha1s}
+
+class _Handler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	server: StandInServer
+
+	def log_message(self, format, *args) -> None:
+		pass
+
+	def do_GET(self) -> None:
+		self._dispatch(None)
+
+	def do_POST(self) -> None:
+		length = int(self.headers.get("Content-Length", 0))
+		self._dispatch(loads(self.rfile.read(length)) if length != 0 else None)
+
+	def _dispatch(self, json_body) -> None:
+		if self.server.latency > 0:
+			time.sleep(self.server.latency)
+
+		_, host, rest = self.path.split("/", 2)
+		url = urlsplit(f"/{rest}")
+		if host == "faults":
+			return self._serve_faults(url.path.rsplit("/", 1)[-1])
+		query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+		route = _ROUTES.get(host)
+		status, content_type, body = route(self.server, url.path, query, json_body) if route is not None else (404, "text/plain", b"")
+
+		etag = f'"{hashlib.sha1(body).hexdigest()}"'
+		if content_type != "application/java-archive" and self.headers.get("If-None-Match") == etag:
+			status, body = 304, b""
+
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		if content_type != "application/java-archive":
+			self.send_header("ETag", etag)
+		self.end_headers()
+		# Counted before the body is sent, so that the client never sees a response that is not counted yet
+		self.server._count(len(body))
+		self.wfile.write(body)
+
+	def _serve_faults(self, file_name: str) -> None:
+		server = self.server
+		server.faults_requests.append(dict(self.headers))
+		fault = server.faults.pop(0) if len(server.faults) != 0 else None
+
+		if fault is not None and fault[0] == "status":
+			self.send_response(fault[1])
+			if fault[2] is not None:
+				self.send_header("Retry-After", fault[2])
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+
+		body = server.jar(f"{file_name}{server.faults_etag}")
+		status, start = 200, 0
+		ranged = self.headers.get("Range", "")
+		if ranged.startswith("bytes=") and ranged.endswith("-") and self.headers.get("If-Range", server.faults_etag) == server.faults_etag:
+			status, start = 206, int(ranged[len("bytes="):-1])
+
+		self.send_response(status)
+		self.send_header("Content-Type", "application/java-archive")
+		self.send_header("Content-Length", str(len(body) - start))
+		self.send_header("ETag", server.faults_etag)
+		if status == 206:
+			self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+		self.end_headers()
+
+		if fault is not None and fault[0] == "drop":
+			self.wfile.write(body[start:start + fault[1]])
+			self.wfile.flush()
+			self.close_connection = True
+			return
+		self.wfile.write(body[start:])
+
+def _json(obj) -> Tuple[int, str, bytes]:
+	return (200, "application/json", dumps(obj).encode())
+
+def _not_found() -> Tuple[int, str, bytes]:
+	return (404, "application/json", b'{"error": "not_found"}')
+
+def _mod_number(name: str, prefix: str) -> Union[int, None]:
+	if not name.startswith(prefix) or not name[len(prefix):].isdigit():
+		return None
+	return int(name[len(prefix):])
+
+def _route_modrinth(server: StandInServer, path: str, query: Dict, json_body) -> Tuple[int, str, bytes]:
+	if path == "/v2/projects":
+		projects = []
+		for _id in loads(query["ids"]):
+			i = _mod_number(_id, "benchmod")
+			if i is None:
+				i = _mod_number(_id, "project")
+			if i is not None:
+				projects.append({"id": f"project{i}", "slug": f"benchmod{i}", "versions": [f"version{i}"]})
+		return _json(projects)
+
+	if path == "/v2/versions":
+		versions = []
+		for _id in loads(query["ids"]):
+			i = _mod_number(_id, "version")
+			if i is not None:
+				versions.append(server.modrinth_version(i))
+		return _json(versions)
+
+	if path.startswith("/v2/project/") and path.endswith("/version"):
+		_id = path[len("/v2/project/"):-len("/version")]
+		i = _mod_number(_id, "benchmod")
+		if i is None:
+			i = _mod_number(_id, "project")
+		if i is None:
+			return _not_found()
+		version = server.modrinth_version(i)
+		loaders, game_versions = loads(query.get("loaders", "null")), loads(query.get("game_versions", "null"))
+		if (loaders is not None and not set(loaders) & set(version["loaders"])) or (game_versions is not None and not set(game_versions) & set(version["game_versions"])):
+			return _json([])
+		return _json([version])
+
+	if path == "/v2/version_files/update":
+		mods = server.modrinth_mods_by_sha1(json_body["hashes"])
+		return _json({sha1: server.modrinth_version(i) for sha1, i in mods.items()})
+
+	return _not_found()
+
+def _route_curse_forge_api(server: StandInServer, path: str, query: Dict, json_body) -> Tuple[int, str, bytes]:
+	i = _mod_number(path, "/api/v2/addon/")
+	if i is None:
+		return _not_found()
+
+	return _json({"gameVersionLatestFiles": [{
+		"gameVersion": server.mc_version,
+		"projectFileId": 3000000 + i,
+		"projectFileName": f"cfmod{i}-1.0.0.jar",
+	}]})
+
+def _route_github_api(server: StandInServer, path: str, query: Dict, json_body) -> Tuple[int, str, bytes]:
+	parts = path.split("/") # ["", "repos", owner, repo, "releases", ...]
+	if len(parts) != 6 or parts[1] != "repos" or parts[4] != "releases" or parts[5] != "latest":
+		return _not_found()
+
+	i = _mod_number(parts[3], "ghmod")
+	if i is None:
+		return _not_found()
+
+	file_name = f"ghmod{i}-1.0.0.jar"
+	return _json({
+		"tag_name": "v1.0.0",
+		"published_at": PUBLISHED_AT,
+		"assets": [{
+			"id": i,
+			"name": file_name,
+			"browser_download_url": f"https://github.com/{parts[2]}/{parts[3]}/releases/download/v1.0.0/{file_name}",
+			"size": server.jar_size,
+		}],
+	})
+
+def _route_optifine(server: StandInServer, path: str, query: Dict, json_body) -> Tuple[int, str, bytes]:
+	if path == "/downloads":
+		# Like on optifine.net, every release has a download link followed by a link to its mirror page.
+		html = (
+			f'<html><body><table><tr>'
+			f'<td><a href="https://optifine.net/download?f={OPTIFINE_JAR}">Download</a></td>'
+			f'<td><a href="https://optifine.net/adloadx?f={OPTIFINE_JAR}">(Mirror)</a></td>'
+			f'</tr></table></body></html>'
+		)
+		return (200, "text/html", html.encode())
+
+	if path == "/adloadx":
+		return (200, "text/html", f'<html><body><a href="downloadx?f={query["f"]}&x=benchmark">Download</a></body></html>'.encode())
+
+	if path == "/downloadx":
+		return _jar(server, query["f"])
+
+	return _not_found()
+
+def _route_jars(server: StandInServer, path: str, query: Dict, json_body) -> Tuple[int, str, bytes]:
+	return _jar(server, path.rsplit("/", 1)[-1])
+
+def _route_mirror(server: StandInServer, path: str, query: Dict, json_body) -> Tuple[int, str, bytes]:
+	if server.mirror_dir is None or ".." in path:
+		return _not_found()
+
+	file = server.mirror_dir / path.lstrip("/")
+	if not file.is_file():
+		return _not_found()
+	return (200, "application/json" if file.suffix == ".json" else "application/java-archive", file.read_bytes())
+
+def _jar(server: StandInServer, file_name: str) -> Tuple[int, str, bytes]:
+	if not file_name.endswith(".jar"):
+		return _not_found()
+	return (200, "application/java-archive", server.jar(file_name))
+
+_ROUTES = {
+	"api.modrinth.com": _route_modrinth,
+	"cdn.modrinth.com": _route_jars,
+	"addons-ecs.forgesvc.net": _route_curse_forge_api,
+	"edge.forgecdn.net": _route_jars,
+	"api.github.com": _route_github_api,
+	"github.com": _route_jars,
+	"optifine.net": _route_optifine,
+	"mirror": _route_mirror,
+}
+
+class _StandInAdapter(HTTPAdapter):
+	"""Sends requests for https://<host>/<path> to <server url>/<host>/<path>, using a normal keep-alive pool.
+	"""
+
+	def __init__(self, server_url: str, **kwargs):
+		super().__init__(**kwargs)
+		self.server_url: str = server_url
+
+	def send(self, request, **kwargs):
+		url = urlsplit(request.url)
+		request.url = f"{self.server_url}/{url.hostname}{url.path}" + (f"?{url.query}" if url.query != "" else "")
+		return super().send(request, **kwargs)
+
+def redirect_session(session, server: StandInServer, hosts: List[str] = HOSTS) -> None:
+	"""Mounts adapters on session that send every request for one of hosts to server.
+
+	Every host gets its own adapter with a pool as large as the session's own, so connection reuse and the
+	per-host connection limit behave like they do against the real servers.
+	"""
+	pool_maxsize = session.get_adapter("https://").poolmanager.connection_pool_kw.get("maxsize", 10)
+	for host in hosts:
+		adapter = _StandInAdapter(server.url, pool_maxsize=pool_maxsize, pool_block=True)
+		session.mount(f"https://{host}/", adapter)
+		session.mount(f"http://{host}/", adapter)
@@ -0,0 +1,73 @@
+"""Fixtures of the tests next to this file. The tests that need servers use the stand-ins of the benchmarks (benchmarks/standin.py).
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent / "benchmarks"))
+
+from standin import MC_VERSION, StandInServer, redirect_session, synthetic_profile # noqa: E402
+
+@pytest.fixture
+def switch_home(monkeypatch):
+	"""Returns a function that makes a folder (with a .minecraft/mods folder) HOME (and LOCALAPPDATA/APPDATA) for the rest of the test.
+	"""
+	from mcmm import commands
+
+	def switch(home: Path) -> Path:
+		(home / ".minecraft/mods").mkdir(parents=True, exist_ok=True)
+		for var in ("HOME", "LOCALAPPDATA", "APPDATA"):
+			monkeypatch.setenv(var, str(home))
+		# The commands keep the folders they use for the whole process
+		commands._config_dir.cache_clear()
+		commands._jar_store.cache_clear()
+		commands._profile_store.cache_clear()
+		return home
+
+	yield switch
+	commands._config_dir.cache_clear()
+	commands._jar_store.cache_clear()
+	commands._profile_store.cache_clear()
+
+@pytest.fixture
+def home(tmp_path, switch_home) -> Path:
+	"""An empty home folder for the test, see switch_home.
+	"""
+	return switch_home(tmp_path / "home")
+
+@pytest.fixture(scope="session")
+def standin() -> StandInServer:
+	server = StandInServer(jar_size=4096).start()
+	yield server
+	server.stop()
+
+@pytest.fixture
+def provider_runner(home, standin):
+	"""A ProviderRunner of the internal Mod Providers whose requests all go to standin.
+	"""
+	from mcmm import aggregate_mod_provider_list
+	from mcmm.cache import ResponseCache
+	from mcmm.dirs import gen_cache_dir
+	from mcmm.plugin_internal import load_providers
+	from mcmm.session import ProviderSession
+
+	session = ProviderSession(cache=ResponseCache(gen_cache_dir() / "http"))
+	redirect_session(session, standin)
+
+	runner = load_providers(aggregate_mod_provider_list({"mod_providers": []}), session=session)
+	yield runner
+	runner.close()
+
+@pytest.fixture
+def profile(home) -> str:
+	"""A profile of four Modrinth entries that the stand-in server can resolve and fetch.
+	"""
+	from json import dump
+
+	profile_file = home / ".config/mcmm/profiles/standin.json"
+	profile_file.parent.mkdir(parents=True, exist_ok=True)
+	with profile_file.open("w") as f:
+		dump({"minecraft_version": MC_VERSION, "mods": synthetic_profile(5)["mods"][1:]}, f)
+	return "standin"
@@ -1,21 +1,26 @@
 from colorama import init as colorama_init
 from colorama import Fore
-from json import load
 from sys import argv
 from types import ModuleType
-from typing import List, Union
+from typing import TYPE_CHECKING, Dict, List, Union
 
-from . import curse_forge, github, optifine, modrinth, file
 from .commands import (
     _activate_dispatcher,
     _deactivate_dispatcher,
     _download_dispatcher,
     _generate_dispatcher,
     _list_dispatcher,
+    _lock_dispatcher,
+    _mirror_dispatcher,
     _modify_dispatcher,
+    _profiles_dispatcher,
+    _query_dispatcher,
+    _verify_dispatcher,
 )
-from .dirs import gen_config_dir
-from .plugin_internal import load_providers
+from .config import load_config
+
+if TYPE_CHECKING:
+    from .plugin_internal import ProviderRunner
 
 __version__ = "0.0.5"
 
@@ -45,38 +50,103 @@ def cli():
         _deactivate_dispatcher(argv[2:])
 
     elif command == "download":
-        mod_providers = load_providers(aggregate_mod_provider_list())
-        _download_dispatcher(argv[2:], mod_providers)
+        mod_providers = _load_mod_providers()
+        try:
+            _download_dispatcher(argv[2:], mod_providers)
+        finally:
+            mod_providers.close()
 
     elif command == "generate":
-        mod_providers = load_providers(aggregate_mod_provider_list())
-        _generate_dispatcher(argv[2:], mod_providers)
+        mod_providers = _load_mod_providers()
+        try:
+            _generate_dispatcher(argv[2:], mod_providers)
+        finally:
+            mod_providers.close()
 
     elif command == "list":
         _list_dispatcher(argv[2:])
 
+    elif command == "lock":
+        mod_providers = _load_mod_providers()
+        try:
+            _lock_dispatcher(argv[2:], mod_providers)
+        finally:
+            mod_providers.close()
+
+    elif command == "mirror":
+        mod_providers = _load_mod_providers()
+        try:
+            _mirror_dispatcher(argv[2:], mod_providers)
+        finally:
+            mod_providers.close()
+
     elif command == "modify":
         _modify_dispatcher(argv[2:])
 
+    elif command == "profiles":
+        _profiles_dispatcher(argv[2:])
+
+    elif command == "query":
+        _query_dispatcher(argv[2:])
+
+    elif command == "verify":
+        _verify_dispatcher(argv[2:])
+
 
 def help():
     print(
         f"""Minecraft Mod Manager (mcmm) {__version__} Help
 
 Commands:
-    - activate <profile> - Removes all existing jars from the .minecraft/mods folder and copies the jars associated with <profile> into .minecraft/mods.
+    - activate <profile> - Makes the jars in the .minecraft/mods folder match <profile>, linking (or copying) only the jars that differ from the jar store.
+        Accepts the same --stats and --cprofile options as download.
 
     - deactivate [minecraft folder] - Removes all existing jars from the default installation, or a specific installation, if one is provided.
 
-    - download <profile> - Downloads all jars defined in <profile> to a storage location.
+    - download <profile> - Downloads all jars defined in <profile> to the jar store, which shares identical jars between profiles.
+        --all                  - Downloads every profile instead of <profile>. Entries that several profiles share are resolved and fetched once.
         --mc-version <version> - Forces a download of jars for Minecraft Version <version> in all supporting Mod Providers.
+        --jobs <n>             - Downloads up to <n> mods at the same time (default: 4).
+        --build-jobs <n>       - Builds up to <n> GitHub 'compile' entries at the same time (default: 2). Each build also takes one of the --jobs slots.
+        --refresh              - Revalidates all cached provider API responses, even if they have not expired yet.
+        --no-cache             - Neither reads nor writes the provider API response cache.
+        --locked               - Downloads exactly the jars pinned by the profile's lock file, without asking any Mod Provider for updates.
+        --stats [human|json]   - Reports the time spent per phase (resolve, transfer, fetch, store) and per mod, and the HTTP requests, bytes and cache hits.
+        --mirror <folder|url>  - Downloads the jars of <profile> (or with --all, of every profile) from a mirror made by the mirror command, without asking any Mod Provider. Profiles missing from the config dir are added from the mirror.
+        --cprofile <file>      - Profiles the command with cProfile and writes the result to <file> (view it with 'python -m pstats <file>').
 
     - generate <profile> - Creates a new profile.
 
     - list               - Lists all available profiles.
+        --provider <id>        - Only lists profiles with an entry of Mod Provider <id>.
+        --mod <id>             - Only lists profiles with an entry for the mod (project id, repository, name or path) <id>.
+        --mc-version <version> - Only lists profiles for Minecraft Version <version>.
+
+    - lock <profile>     - Resolves every jar of <profile> and pins their URLs, sizes and hashes in <profile>.lock.json.
+        Accepts the same --mc-version, --jobs, --build-jobs, --refresh and --no-cache options as download.
+
+    - mirror <profile...> - Resolves each <profile> and copies its jars and resolutions into a mirror folder, which can be shared or served over HTTP for download --mirror.
+        --dir <folder> - The mirror folder (default: the "mirror" folder next to the jar store). Jars that no mirrored profile uses anymore are removed from it.
+        --all          - Mirrors every profile.
+        Accepts the same --mc-version, --jobs, --build-jobs, --refresh and --no-cache options as download.
 
     - modify <profile>   - Modify profile settings.
 
+    - profiles import [profile...] - Copies profiles (default: all of them) from profiles/*.json into the SQLite profile database, profiles.sqlite3.
+    - profiles export [profile...] - Copies profiles (default: all of them) from the SQLite profile database to profiles/*.json.
+        Set "profile_backend" to "sqlite" in config.json to keep profiles in the database, which saves each profile in a transaction and indexes the filters of list.
+
+    - query <mod>        - Lists the downloaded jars that declare the mod with id <mod> (or with <mod> in its name), the profiles using them and the Minecraft and loader versions they declare.
+        --mod-version <version>      - Only lists jars declaring <version> of the mod.
+        --jar <file name or SHA-256> - Lists what the matching jars declare instead.
+        --json                       - Prints the results as JSON.
+        Jars are indexed from their fabric.mod.json and mods.toml files the first time a query sees them.
+
+    - verify <profile...> - Checks the jars of each <profile> in the jar store against their SHA-256 and the hashes their Mod Providers published (Modrinth and GitHub).
+        --all      - Verifies every downloaded profile.
+        --jobs <n> - Hashes up to <n> jars at the same time (default: the number of CPUs).
+        --repair   - Removes corrupted jars from the jar store, so that the next download fetches them again.
+
 """
     )
 
@@ -85,16 +155,29 @@ def version():
     print(f"Minecraft Mod Manager (mcmm) Version {__version__}")
 
 
-def aggregate_mod_provider_list() -> List[Union[str, ModuleType]]:
-    internal_mps = [curse_forge, optifine, github, modrinth, file]
-    config_dir = gen_config_dir()
-    config_file = config_dir / "config.json"
+def aggregate_mod_provider_list(
+    user_conf: Union[Dict, None] = None
+) -> List[Union[str, ModuleType]]:
+    # The internal providers are referenced by module name, so that they are only imported if a profile uses them.
+    internal_mps = [
+        f"{__name__}.curse_forge",
+        f"{__name__}.optifine",
+        f"{__name__}.github",
+        f"{__name__}.modrinth",
+        f"{__name__}.file",
+    ]
+    if user_conf is None:
+        user_conf = load_config()
 
-    if not config_file.exists():
-        with config_file.open("w") as f:
-            f.write(r'{"mod_providers": []}')
+    return user_conf["mod_providers"] + internal_mps
 
-    with config_file.open("r") as f:
-        user_conf = load(f)
 
-    return user_conf["mod_providers"] + internal_mps
+def _load_mod_providers() -> "ProviderRunner":
+    # Only the commands that use Mod Providers import the plugin engine and, through it, requests
+    from .plugin_internal import load_providers
+    from .session import session_from_config
+
+    user_conf = load_config()
+    return load_providers(
+        aggregate_mod_provider_list(user_conf), session=session_from_config(user_conf)
+    )
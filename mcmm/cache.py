@@ -0,0 +1,154 @@
+"""cache.py contains the on-disk cache for provider API responses.
+
+Responses are kept for a time-to-live, after which they are revalidated with the server using their
+ETag/Last-Modified headers. The cache is bounded in size and evicts the least recently used entries first.
+"""
+
+import hashlib, os, requests, threading, time
+from base64 import b64decode, b64encode
+from json import dump, load
+from pathlib import Path
+from requests.structures import CaseInsensitiveDict
+from typing import Dict, Union
+from uuid import uuid4
+
+DEFAULT_TTL = 15 * 60
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# Only the headers that are needed to use or revalidate a cached response are stored.
+_STORED_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+
+# Eviction goes a bit below max_size, so that a full cache is not scanned again on the very next save.
+_EVICT_TO = 0.9
+
+class ResponseCache:
+	def __init__(self, cache_dir: Path, ttl: float = DEFAULT_TTL, max_size: int = DEFAULT_MAX_SIZE):
+		self.cache_dir: Path = cache_dir
+		self.ttl: float = ttl
+		self.max_size: int = max_size
+		self._evict_lock = threading.Lock()
+		# The size of the cache dir as of the last eviction plus what was saved since, so that saving does not
+		# have to scan the cache dir. None until the first save, which scans it once.
+		self._size: Union[int, None] = None
+
+	def _entry_path(self, url: str) -> Path:
+		return self.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+	def load(self, url: str) -> Union[Dict, None]:
+		"""Returns the cache entry of url, or None if there is none.
+
+		Loading an entry counts as using it, so it is moved to the back of the eviction queue.
+		"""
+		entry_file = self._entry_path(url)
+		try:
+			with entry_file.open("r") as f:
+				entry = load(f)
+			os.utime(str(entry_file))
+		except (OSError, ValueError):
+			return None
+
+		# Hash collisions are practically impossible, but a stale entry from another URL must never be returned.
+		if entry.get("url") != url:
+			return None
+
+		return entry
+
+	def is_fresh(self, entry: Dict) -> bool:
+		return time.time() - entry["stored_at"] < self.ttl
+
+	def save(self, url: str, r: requests.Response) -> None:
+		headers = {h: r.headers[h] for h in _STORED_HEADERS if h in r.headers}
+		grown = self._write(url, {
+			"url": url,
+			"stored_at": time.time(),
+			"status_code": r.status_code,
+			"encoding": r.encoding,
+			"headers": headers,
+			"body": b64encode(r.content).decode("ascii"),
+		})
+		self._grown(grown)
+
+	def revalidated(self, url: str, entry: Dict) -> None:
+		"""Restarts the time-to-live of entry after the server confirmed that it is still up-to-date.
+		"""
+		entry["stored_at"] = time.time()
+		self._grown(self._write(url, entry))
+
+	def to_response(self, entry: Dict) -> requests.Response:
+		r = requests.Response()
+		r.status_code = entry["status_code"]
+		r.reason = "OK"
+		r.url = entry["url"]
+		r.encoding = entry["encoding"]
+		r.headers = CaseInsensitiveDict(entry["headers"])
+		r._content = b64decode(entry["body"])
+		return r
+
+	def _grown(self, size: int) -> None:
+		"""Adds size bytes to the size of the cache and evicts entries once it outgrows max_size.
+		"""
+		with self._evict_lock:
+			if self._size is not None:
+				self._size += size
+			full = self._size is None or self._size > self.max_size
+		if full:
+			self.evict()
+
+	def evict(self) -> None:
+		"""Removes the least recently used entries once the cache is larger than max_size, until it is a bit smaller than that.
+
+		This scans the whole cache dir, so saving only evicts the first time and whenever the cache outgrows max_size.
+		"""
+		with self._evict_lock:
+			entries = []
+			total_size = 0
+			for entry_file in self.cache_dir.glob("*.json"):
+				try:
+					stat = entry_file.stat()
+				except OSError:
+					continue
+				entries.append((stat.st_mtime, stat.st_size, entry_file))
+				total_size += stat.st_size
+
+			if total_size > self.max_size:
+				entries.sort()
+				for _, size, entry_file in entries:
+					if total_size <= self.max_size * _EVICT_TO:
+						break
+					try:
+						entry_file.unlink()
+					except OSError:
+						pass
+					total_size -= size
+
+			self._size = total_size
+
+	def _write(self, url: str, entry: Dict) -> int:
+		"""Writes the entry of url and returns by how many bytes that grew the cache.
+		"""
+		entry_file = self._entry_path(url)
+		entry_file.parent.mkdir(parents=True, exist_ok=True)
+		try:
+			old_size = entry_file.stat().st_size
+		except OSError:
+			old_size = 0
+
+		tmp = entry_file.parent / f".{entry_file.name}.{uuid4().hex}.tmp"
+		with tmp.open("w") as f:
+			dump(entry, f)
+		size = tmp.stat().st_size
+		os.replace(str(tmp), str(entry_file))
+		return size - old_size
+
+def cache_from_config(config: Dict, cache_dir: Path) -> ResponseCache:
+	"""Creates a ResponseCache using the optional "cache" section of config.json.
+
+	Recognized keys are "ttl" (seconds) and "max_size" (bytes).
+	"""
+	cache_conf = config.get("cache", {})
+
+	return ResponseCache(
+		cache_dir,
+		ttl=float(cache_conf.get("ttl", DEFAULT_TTL)),
+		max_size=int(cache_conf.get("max_size", DEFAULT_MAX_SIZE)),
+	)
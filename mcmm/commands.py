@@ -1,22 +1,60 @@
+import os, sqlite3
 from colorama import Fore
-from json import dump, load
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from json import dump, dumps, load
 from pathlib import Path
 from shutil import copy as shutil_copy
-from shutil import move as shutil_move
-from typing import List, Union
+from shutil import rmtree as shutil_rmtree
+from typing import TYPE_CHECKING, Dict, List, Tuple, Union
 
 # Own library imports
+from .config import load_config
 from .dirs import gen_dot_minecraft
 from .dirs import gen_config_dir
 from .dirs import gen_jar_storage_dir
+from .jarindex import JarIndex
+from .lockfile import load_lock, lock_path, profile_digest, save_lock
+from .mirror import MirrorSource, write_index, write_profile
 from .plugin import HandlerType
-from .plugin_internal import ProviderRunner
+from .profiles import (
+    DEFAULT_BACKEND,
+    ProfileStore,
+    copy_profiles,
+    entry_id,
+    profile_store,
+)
+from .stats import RunStats, cprofile_to, format_bytes, format_report, mod_label
+from .store import JarStore, remove_file
+from .verify import check_download, upstream_hash, verify_jars
+
+if TYPE_CHECKING:
+    # plugin_internal pulls in requests, which commands that never talk to a Mod Provider should not have to import
+    from .plugin_internal import ProviderRunner
 
 DEFAULT_MC_VERSION = "1.18.1"
+DEFAULT_DOWNLOAD_JOBS = 4
 
-dot_minecraft: Path = gen_dot_minecraft()
-config_dir = gen_config_dir()
-jar_storage_dir = gen_jar_storage_dir()
+
+# The folders are only looked up (and created) by the commands that use them, so that importing this
+# module has no side effects and a missing .minecraft folder only fails the commands that need one.
+@lru_cache(maxsize=None)
+def _config_dir() -> Path:
+    return gen_config_dir()
+
+
+@lru_cache(maxsize=None)
+def _jar_store() -> JarStore:
+    return JarStore(gen_jar_storage_dir())
+
+
+def _dot_minecraft() -> Union[Path, None]:
+    """Returns the default .minecraft folder, or None (after printing an error) if it does not exist."""
+    try:
+        return gen_dot_minecraft()
+    except RuntimeError as e:
+        print(f"[{Fore.RED}ERROR{Fore.RESET}] {e}")
+        return None
 
 
 def _activate_dispatcher(args: List[str]) -> None:
@@ -25,51 +63,69 @@ def _activate_dispatcher(args: List[str]) -> None:
     Args:
             args (List[str]): Arguments to parse.
     """
-    return activate(args[0])
+    stats_options = _parse_stats_options(args)
+    if stats_options is None:
+        return
 
+    stats = RunStats()
+    with cprofile_to(stats_options["cprofile"]):
+        activate(args[0], stats=stats)
 
-def activate(profile: str) -> None:
-    global dot_minecraft
-    # Load profile json
-    if not (config_dir / f"profiles/{profile}.json").exists():
-        print(
-            f"[{Fore.RED}ERROR{Fore.RESET}] Could not find a profile.json for '{profile}'"
-        )
-        return
+    _print_stats(stats.report(), stats_options)
 
-    # Load profile json
-    with (config_dir / f"profiles/{profile}.json").open("r") as f:
-        profile_obj = load(f)
 
-    try:
-        mc_dir = profile_obj["minecraft_folder"]
-        if mc_dir != "" and mc_dir != None:
-            dot_minecraft = Path(mc_dir)
-    except KeyError:
-        pass
+def activate(profile: str, stats: Union[RunStats, None] = None) -> None:
+    profile_obj = _load_profile(profile)
+    if profile_obj is None:
+        return
 
-    mods_folder: Path = dot_minecraft / "mods"
+    mc_dir = profile_obj.get("minecraft_folder")
+    if mc_dir != "" and mc_dir != None:
+        dot_minecraft = Path(mc_dir)
+    else:
+        dot_minecraft = _dot_minecraft()
+        if dot_minecraft is None:
+            return
 
-    # Remove mod jars from dot_minecraft/mods
-    for file in mods_folder.glob("*.jar"):
-        file.unlink()
+    mods_folder: Path = dot_minecraft / "mods"
 
-    # Copy profile jars from jar_storage_dir to dot_minecraft/mods
-    for file in (jar_storage_dir / profile).glob("*"):
-        shutil_copy(str(file), str(mods_folder / file.name))
+    if stats is None:
+        stats = RunStats()
+
+    with stats.timed("manifest"):
+        manifest = _jar_store().load_manifest(profile)
+    legacy_dir = _jar_store().legacy_profile_dir(profile)
+    if manifest is None and legacy_dir is not None:
+        # Remove mod jars from dot_minecraft/mods
+        for file in mods_folder.glob("*.jar"):
+            remove_file(file, _jar_store())
+
+        # Profiles downloaded before the jar store existed keep a private copy of their jars in jar_storage_dir/{profile}
+        for file in legacy_dir.glob("*"):
+            shutil_copy(str(file), str(mods_folder / file.name))
+    elif manifest is not None:
+        # Link or copy only the jars that differ from what is already in dot_minecraft/mods
+        result = _jar_store().sync(mods_folder, manifest["jars"], stats=stats)
+        print(
+            f"[{Fore.GREEN}INFO{Fore.RESET}] {result.unchanged} unchanged, {result.written} written, {result.removed} removed. {format_bytes(result.bytes_written)} written to disk."
+        )
 
     print(
         f"[{Fore.GREEN}SUCCESS{Fore.RESET}] Profile '{profile}' successfully activated."
     )
 
 
-def _download_dispatcher(args: List[str], provider_runner: ProviderRunner) -> None:
-    """Parses out the command line arguments and calls download.
+def _parse_download_options(
+    args: List[str], provider_runner: "ProviderRunner"
+) -> Union[Dict, None]:
+    """Parses out the command line options shared by download and lock.
 
     Args:
             args (List[str]): Arguments to parse.
-    """
 
+    Returns:
+            Union[Dict, None]: The parsed options, or None if the arguments are invalid.
+    """
     mc_version_override = None
     if "--mc-version" in args:
         i = args.index("--mc-version")
@@ -79,51 +135,581 @@ def _download_dispatcher(args: List[str], provider_runner: ProviderRunner) -> No
             print(
                 f"[{Fore.RED}ERROR{Fore.RESET}] Expected argument after '--mc-version'"
             )
+            return None
+
+    jobs = _parse_positive_int(args, "--jobs", DEFAULT_DOWNLOAD_JOBS)
+    if jobs is None:
+        return None
+
+    if "--build-jobs" in args:
+        build_jobs = _parse_positive_int(args, "--build-jobs", None)
+        if build_jobs is None:
+            return None
+        # Builds happen inside the providers' fetch handlers, so the limit is passed to them through the runner's options.
+        provider_runner.options["build_jobs"] = build_jobs
+
+    if "--no-cache" in args:
+        provider_runner.session.cache = None
+    elif "--refresh" in args:
+        provider_runner.session.refresh_cache = True
+
+    return {"mc_version_override": mc_version_override, "jobs": jobs}
+
+
+def _parse_positive_int(args: List[str], option: str, default: int) -> Union[int, None]:
+    """Returns the positive integer after option in args, default if option is missing, or None (after printing an error) if it is invalid."""
+    if option not in args:
+        return default
+
+    i = args.index(option)
+    try:
+        value = int(args[i + 1])
+    except IndexError:
+        print(f"[{Fore.RED}ERROR{Fore.RESET}] Expected argument after '{option}'")
+        return None
+    except ValueError:
+        value = 0
+
+    if value < 1:
+        print(
+            f"[{Fore.RED}ERROR{Fore.RESET}] '{option}' must be a positive integer, got '{args[i + 1]}'"
+        )
+        return None
+
+    return value
+
+
+def _parse_stats_options(args: List[str]) -> Union[Dict, None]:
+    """Parses out the --stats [human|json] and --cprofile <file> options of download and activate.
+
+    Returns:
+            Union[Dict, None]: The parsed options, or None if the arguments are invalid.
+    """
+    stats_format = None
+    if "--stats" in args:
+        i = args.index("--stats")
+        stats_format = "human"
+        if i + 1 < len(args) and args[i + 1] in ("human", "json"):
+            stats_format = args[i + 1]
+
+    cprofile = None
+    if "--cprofile" in args:
+        i = args.index("--cprofile")
+        try:
+            cprofile = args[i + 1]
+        except IndexError:
+            print(f"[{Fore.RED}ERROR{Fore.RESET}] Expected argument after '--cprofile'")
+            return None
+
+    return {"stats": stats_format, "cprofile": cprofile}
+
+
+def _print_stats(report: Dict, stats_options: Dict) -> None:
+    if stats_options["cprofile"] is not None:
+        print(
+            f"[{Fore.GREEN}INFO{Fore.RESET}] Wrote the cProfile profile to {stats_options['cprofile']}. View it with 'python -m pstats {stats_options['cprofile']}'."
+        )
+
+    if stats_options["stats"] == "json":
+        print(dumps(report, indent=4))
+    elif stats_options["stats"] == "human":
+        lines = format_report(report)
+        print(f"[{Fore.GREEN}INFO{Fore.RESET}] {lines[0]}")
+        for line in lines[1:]:
+            print(f"    {line}")
+
+
+def _download_dispatcher(args: List[str], provider_runner: "ProviderRunner") -> None:
+    """Parses out the command line arguments and calls download.
+
+    Args:
+            args (List[str]): Arguments to parse.
+    """
+    options = _parse_download_options(args, provider_runner)
+    if options is None:
+        return
+
+    stats_options = _parse_stats_options(args)
+    if stats_options is None:
+        return
+
+    locked = "--locked" in args
+    if locked and options["mc_version_override"] is not None:
+        print(
+            f"[{Fore.RED}ERROR{Fore.RESET}] '--mc-version' can not be used with '--locked'. Use it with the lock command instead."
+        )
+        return
+
+    mirror = None
+    if "--mirror" in args:
+        i = args.index("--mirror")
+        try:
+            mirror = MirrorSource(args[i + 1], session=provider_runner.session)
+        except IndexError:
+            print(f"[{Fore.RED}ERROR{Fore.RESET}] Expected argument after '--mirror'")
+            return
+        if options["mc_version_override"] is not None:
+            print(
+                f"[{Fore.RED}ERROR{Fore.RESET}] '--mc-version' can not be used with '--mirror'. Use it with the mirror command instead."
+            )
             return
 
-    return download(args[0], provider_runner, mc_version_override=mc_version_override)
+    with cprofile_to(stats_options["cprofile"]):
+        if "--all" in args:
+            download_all(provider_runner, locked=locked, mirror=mirror, **options)
+        else:
+            download(args[0], provider_runner, locked=locked, mirror=mirror, **options)
+
+    _print_stats(
+        provider_runner.stats.report(
+            getattr(provider_runner.session, "http_stats", None),
+            getattr(provider_runner.session, "retry_stats", None),
+        ),
+        stats_options,
+    )
 
 
 def download(
-    profile: str, provider_runner: ProviderRunner, mc_version_override=None
+    profile: str,
+    provider_runner: "ProviderRunner",
+    mc_version_override=None,
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+    locked: bool = False,
+    mirror: Union[MirrorSource, None] = None,
 ) -> None:
-    # Load profile json
-    with (config_dir / f"profiles/{profile}.json").open("r") as f:
-        profile_obj = load(f)
+    if mirror is not None:
+        return _download_from_mirror(profile, provider_runner, mirror, jobs=jobs)
 
-    print(
-        f"[{Fore.GREEN}INFO{Fore.RESET}] Cleaning existing jars from jar storage of profile '{profile}'."
-    )
-    # Clean jar storage before downloading new versions (which may have different names which cause the old jars to not be overwritten).
-    for file in (jar_storage_dir / profile).glob("*"):
-        file.unlink()
+    profile_obj = _load_profile(profile)
+    if profile_obj is None:
+        return
+
+    if locked:
+        return _download_locked(profile, profile_obj, provider_runner, jobs=jobs)
+
+    mc_version = _profile_mc_version(profile, profile_obj, mc_version_override)
+    if mc_version is None:
+        return
 
     print(
         f"[{Fore.GREEN}INFO{Fore.RESET}] Downloading new jars for profile '{profile}'."
     )
-    errs = {}
-    # Download up-to-date jars
-    for mod in profile_obj["mods"]:
+
+    _download_profiles([(profile, profile_obj, mc_version)], provider_runner, jobs=jobs)
+
+
+def download_all(
+    provider_runner: "ProviderRunner",
+    mc_version_override=None,
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+    locked: bool = False,
+    mirror: Union[MirrorSource, None] = None,
+) -> None:
+    """Downloads every profile in the config dir (or in mirror), resolving and fetching each entry that several profiles share only once."""
+    if mirror is not None:
         try:
-            mc_version = (
-                mc_version_override
-                if mc_version_override is not None
-                else profile_obj["minecraft_version"]
+            profiles = mirror.profiles()
+        except (OSError, ValueError) as e:
+            print(
+                f"[{Fore.RED}ERROR{Fore.RESET}] Could not load the index of mirror {mirror}: {e}"
             )
-            file_location, err_str = provider_runner.download(
-                mod["provider"], mc_version, mod["metadata"]
+            return
+
+        # The jars of mirrored profiles are pinned and shared through the jar store, so there is nothing to resolve or share.
+        for profile in profiles:
+            download(profile, provider_runner, jobs=jobs, mirror=mirror)
+        return
+
+    profiles = _profile_names()
+
+    if locked:
+        # Locked downloads never resolve anything, and jars that are already in the store are reused, so there is nothing to share.
+        for profile in profiles:
+            download(profile, provider_runner, jobs=jobs, locked=True)
+        return
+
+    targets = []
+    for profile in profiles:
+        profile_obj = _profile_store().load(profile)
+
+        mc_version = _profile_mc_version(profile, profile_obj, mc_version_override)
+        if mc_version is not None:
+            targets.append((profile, profile_obj, mc_version))
+
+    print(
+        f"[{Fore.GREEN}INFO{Fore.RESET}] Downloading new jars for {len(targets)} profile(s): {', '.join(name for name, _, _ in targets)}."
+    )
+
+    _download_profiles(targets, provider_runner, jobs=jobs)
+
+
+def _profile_mc_version(
+    profile: str, profile_obj: Dict, mc_version_override: Union[str, None]
+) -> Union[str, None]:
+    """Returns the Minecraft version to download profile for, or None (after printing an error) if it has none."""
+    mc_version = (
+        mc_version_override
+        if mc_version_override is not None
+        else profile_obj.get("minecraft_version")
+    )
+    if mc_version is None:
+        print(
+            f"[{Fore.RED}ERROR{Fore.RESET}] Profile '{profile}' does not define a Minecraft version. Use '--mc-version' or the {Fore.CYAN}modify{Fore.RESET} command."
+        )
+
+    return mc_version
+
+
+def _download_profiles(
+    targets: List[Tuple[str, Dict, str]],
+    provider_runner: "ProviderRunner",
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+) -> None:
+    """Downloads the jars of one or more (profile name, profile, Minecraft version) targets into the jar store.
+
+    Entries are identified by _mod_key, so an entry that appears in several profiles (with the same Minecraft version)
+    is resolved and fetched once, and its jar is then added to the manifest of every profile that contains it.
+    """
+    previous_manifests = {}
+    previous_jars = {}
+    for profile, _, _ in targets:
+        previous_manifests[profile] = _jar_store().load_manifest(profile)
+        previous_jars[profile] = {}
+        if previous_manifests[profile] is not None:
+            previous_jars[profile] = {
+                jar["key"]: jar
+                for jar in previous_manifests[profile]["jars"]
+                if "key" in jar
+            }
+
+    # {key: (mod, Minecraft version, the previous jars of the entry across all profiles)}
+    unique_mods = {}
+    for profile, profile_obj, mc_version in targets:
+        for mod in profile_obj["mods"]:
+            key = _mod_key(mod, mc_version)
+            _, _, candidates = unique_mods.setdefault(key, (mod, mc_version, []))
+            if key in previous_jars[profile]:
+                candidates.append(previous_jars[profile][key])
+
+    keys = list(unique_mods.keys())
+    resolved = _resolve_mods(
+        provider_runner,
+        [
+            (
+                mod,
+                mc_version,
+                candidates[0]["resolution"] if len(candidates) != 0 else None,
             )
-            if err_str != "":
-                errs[str(mod)] = err_str
+            for mod, mc_version, candidates in unique_mods.values()
+        ],
+        jobs=jobs,
+    )
+
+    # The mods that resolved entries need are downloaded like the profile's own entries, once per profile that needs them
+    resolved_by_key = dict(zip(keys, resolved))
+    dependencies_by_key = dict(zip(keys, _split_dependencies(resolved)))
+    profile_mods = {}
+    conflicts = {}
+    for profile, profile_obj, mc_version in targets:
+        dependencies, conflicts[profile] = _dependency_entries(
+            profile_obj["mods"], dependencies_by_key, mc_version
+        )
+        profile_mods[profile] = profile_obj["mods"] + [mod for mod, _ in dependencies]
+        for mod, resolution in dependencies:
+            key = _mod_key(mod, mc_version)
+            _, _, candidates = unique_mods.setdefault(key, (mod, mc_version, []))
+            if key in previous_jars[profile]:
+                candidates.append(previous_jars[profile][key])
+            resolved_by_key.setdefault(key, (resolution, ""))
+
+    keys = list(unique_mods.keys())
+    resolved = [resolved_by_key[key] for key in keys]
+
+    def download_mod(
+        work: Tuple[str, Union[Tuple[Dict, Union[str, Exception]], None]],
+    ) -> Tuple[Union[Dict, None], Union[str, Exception]]:
+        """Fetches the jar of a resolved mod into the jar store, unless a previous download already did.
+
+        Returns:
+            Tuple[Union[Dict, None], Union[str, Exception]]: The manifest entry of the jar and the error.
+        """
+        key, resolved = work
+        mod, mc_version, candidates = unique_mods[key]
+        try:
+            if resolved is None:
+                # Providers with only a download handler can't tell what they will download, so their jars are always fetched.
+                file_location, err_str = provider_runner.download(
+                    mod["provider"], mc_version, mod["metadata"]
+                )
+                if err_str != "":
+                    return (None, err_str)
+
+                with provider_runner.stats.timed(
+                    "store", mod_label(mod["provider"], mod["metadata"]), mod["provider"]
+                ):
+                    sha256, size = _jar_store().add(file_location)
+                return (
+                    {
+                        "key": key,
+                        "file_name": file_location.name,
+                        "sha256": sha256,
+                        "size": size,
+                        "resolution": None,
+                    },
+                    "",
+                )
+
+            resolution, err = resolved
+            if err != "":
+                return (None, err)
+
+            for previous_jar in candidates:
+                if _is_unchanged(previous_jar, resolution):
+                    return (previous_jar, "")
+
+            return _fetch_into_store(provider_runner, mod["provider"], key, resolution)
+        except Exception as e:
+            return (None, e)
+
+    # Download up-to-date jars. Executor.map yields results in order, no matter which download finishes first,
+    # so the manifests are written and the errors are reported in the same order as a serial run would.
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = dict(zip(keys, executor.map(download_mod, zip(keys, resolved))))
+
+    for profile, profile_obj, mc_version in targets:
+        errs = {}
+        jars = {}
+        skipped = 0
+        updated = 0
+        for mod in profile_mods[profile]:
+            key = _mod_key(mod, mc_version)
+            jar, err = results[key]
+            if key in conflicts[profile]:
+                jar, err = (None, conflicts[profile][key])
+            previous_jar = previous_jars[profile].get(key)
+
+            if err != "":
+                jar = previous_jar
+                errs[str(mod)] = (
+                    err
+                    if jar is None
+                    else f"{err} (keeping the previously downloaded {jar['file_name']})"
+                )
+            elif jar == previous_jar:
+                skipped += 1
+            else:
+                updated += 1
+
+            if jar is None:
                 continue
+
+            # A later jar with the same file name replaces the earlier one, just like it would in the mods folder.
+            jars[jar["file_name"]] = jar
+
+        removed = 0
+        if previous_manifests[profile] is not None:
+            removed = len(
+                {jar["file_name"] for jar in previous_manifests[profile]["jars"]}
+                - set(jars.keys())
+            )
+
+        _jar_store().save_manifest(profile, list(jars.values()))
+
+        # The profile's jars are now referenced by its manifest, so the private copy from before the jar store existed can go.
+        legacy_dir = _jar_store().legacy_profile_dir(profile)
+        if legacy_dir is not None:
+            shutil_rmtree(str(legacy_dir), ignore_errors=True)
+
+        for err in errs:
+            print(
+                f"{Fore.RED}Error{Fore.RESET}: {errs[str(err)]}  on profile entry: {err}\n"
+            )
+
+        if len(targets) > 1:
+            print(f"[{Fore.GREEN}INFO{Fore.RESET}] Profile '{profile}':")
+        print(
+            f"[{Fore.GREEN}INFO{Fore.RESET}] {skipped} unchanged, {updated} updated, {removed} removed, {len(errs)} failed."
+        )
+        dependency_count = len(profile_mods[profile]) - len(profile_obj["mods"])
+        if dependency_count != 0:
+            print(
+                f"[{Fore.GREEN}INFO{Fore.RESET}] {dependency_count} of the jars are required by other mods of the profile, not listed in it."
+            )
+
+        print(
+            f"[{Fore.GREEN}SUCCESS{Fore.RESET}] Profile '{profile}' successfully downloaded. If you are currently using this profile and wish to take advantage of the newly downloaded mods, use the {Fore.CYAN}activate{Fore.RESET} command."
+        )
+
+    _print_retry_summary(provider_runner)
+
+    if len(targets) > 1:
+        shared = sum(len(mods) for mods in profile_mods.values()) - len(keys)
+        print(
+            f"[{Fore.GREEN}INFO{Fore.RESET}] {len(keys)} unique entries, {shared} shared between profiles."
+        )
+
+    collected = _gc_jar_store()
+    if collected != 0:
+        print(
+            f"[{Fore.GREEN}INFO{Fore.RESET}] Removed {collected} jar(s) from the jar store that are no longer used by any profile."
+        )
+
+
+def _gc_jar_store() -> int:
+    """Removes the jars that no profile's manifest or lock file uses anymore from the jar store and returns how many were removed."""
+    return _jar_store().gc((_config_dir() / "profiles").glob("*.lock.json"))
+
+
+def _print_retry_summary(provider_runner: "ProviderRunner") -> None:
+    stats = getattr(provider_runner.session, "retry_stats", None)
+    if stats is None or (stats.retries == 0 and stats.resumed == 0):
+        return
+
+    summary = []
+    if stats.retries != 0:
+        summary.append(
+            f"Retried {stats.retries} request(s) to {len(stats.retried_urls)} URL(s) after transient errors."
+        )
+    if stats.resumed != 0:
+        summary.append(
+            f"Resumed {stats.resumed} interrupted download(s), {format_bytes(stats.resumed_bytes)} were not downloaded again."
+        )
+
+    print(f"[{Fore.YELLOW}WARNING{Fore.RESET}] {' '.join(summary)}")
+
+
+def _download_locked(
+    profile: str,
+    profile_obj: Dict,
+    provider_runner: "ProviderRunner",
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+    mirror: Union[MirrorSource, None] = None,
+    lock_obj: Union[Dict, None] = None,
+) -> None:
+    """Downloads exactly the jars pinned by the lock file of profile, without resolving anything.
+
+    If a mirror is given, lock_obj is the profile's file in the mirror and the jars are taken from the mirror instead of the Mod Providers.
+    """
+    if mirror is None:
+        lock_file = lock_path(_config_dir(), profile)
+        if not lock_file.exists():
+            print(
+                f"[{Fore.RED}ERROR{Fore.RESET}] Profile '{profile}' has no lock file. Create one with the {Fore.CYAN}lock{Fore.RESET} command."
+            )
+            return
+
+        lock_obj = load_lock(lock_file)
+        if lock_obj["profile_digest"] != profile_digest(profile_obj):
+            print(
+                f"[{Fore.YELLOW}WARNING{Fore.RESET}] Profile '{profile}' changed since its lock file was written. Downloading the locked jars anyway."
+            )
+
+    previous_manifest = _jar_store().load_manifest(profile)
+    previous_jars = {}
+    if previous_manifest is not None:
+        previous_jars = {
+            jar["key"]: jar for jar in previous_manifest["jars"] if "key" in jar
+        }
+
+    print(
+        f"[{Fore.GREEN}INFO{Fore.RESET}] Downloading new jars for profile '{profile}'."
+    )
+
+    def download_locked_mod(
+        locked_mod: Dict,
+    ) -> Tuple[Union[Dict, None], Union[str, Exception], bool]:
+        """Fetches the jar pinned by a lock file entry into the jar store, without resolving it again.
+
+        Returns:
+            Tuple[Union[Dict, None], Union[str, Exception], bool]: The manifest entry of the jar (the previous one if the mod failed), the error and whether the jar changed.
+        """
+        previous_jar = previous_jars.get(locked_mod["key"])
+        jar = {
+            "key": locked_mod["key"],
+            "file_name": locked_mod["file_name"],
+            "sha256": locked_mod["sha256"],
+            "size": locked_mod["size"],
+            "resolution": locked_mod["resolution"],
+        }
+
+        # The jar may already be in the store, either from this profile or from any other profile that uses it.
+        if _jar_store().has_object(jar["sha256"]):
+            return (jar, "", previous_jar is None or previous_jar["sha256"] != jar["sha256"])
+
+        try:
+            if mirror is not None:
+                fetched_jar, err_str = _fetch_from_mirror(
+                    provider_runner, mirror, locked_mod
+                )
+            else:
+                fetched_jar, err_str = _fetch_into_store(
+                    provider_runner,
+                    locked_mod["provider"],
+                    locked_mod["key"],
+                    locked_mod["resolution"],
+                )
         except Exception as e:
-            errs[str(mod)] = e
+            return (previous_jar, e, False)
+        if err_str != "":
+            return (previous_jar, err_str, False)
+
+        if fetched_jar["sha256"] != jar["sha256"]:
+            return (
+                previous_jar,
+                f"Downloaded jar has SHA-256 {fetched_jar['sha256']}, but the {'mirror' if mirror is not None else 'lock file'} expects {jar['sha256']}",
+                False,
+            )
+
+        return (jar, "", True)
+
+    mods = [
+        {"provider": m["provider"], "metadata": m["metadata"]}
+        for m in lock_obj["mods"]
+    ]
+
+    # Executor.map yields results in lock file order, no matter which download finishes first.
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(download_locked_mod, lock_obj["mods"]))
+
+    errs = {}
+    jars = {}
+    skipped = 0
+    updated = 0
+    for mod, (jar, err, fetched) in zip(mods, results):
+        if err != "":
+            errs[str(mod)] = (
+                err
+                if jar is None
+                else f"{err} (keeping the previously downloaded {jar['file_name']})"
+            )
+        elif fetched:
+            updated += 1
+        else:
+            skipped += 1
+
+        if jar is None:
             continue
 
-        # Move jars to jar_storage_dir/profiles/{wanted_profile_name}/{mod_file_name}
-        (jar_storage_dir / profile).mkdir(parents=True, exist_ok=True)
-        shutil_move(
-            str(file_location), str(jar_storage_dir / profile / file_location.name)
+        # A later jar with the same file name replaces the earlier one, just like it would in the mods folder.
+        jars[jar["file_name"]] = jar
+
+    removed = 0
+    if previous_manifest is not None:
+        removed = len(
+            {jar["file_name"] for jar in previous_manifest["jars"]} - set(jars.keys())
+        )
+
+    _jar_store().save_manifest(profile, list(jars.values()))
+
+    # The profile's jars are now referenced by its manifest, so the private copy from before the jar store existed can go.
+    legacy_dir = _jar_store().legacy_profile_dir(profile)
+    if legacy_dir is not None:
+        shutil_rmtree(str(legacy_dir), ignore_errors=True)
+
+    collected = _gc_jar_store()
+    if collected != 0:
+        print(
+            f"[{Fore.GREEN}INFO{Fore.RESET}] Removed {collected} jar(s) from the jar store that are no longer used by any profile."
         )
 
     for err in errs:
@@ -131,12 +717,682 @@ def download(
             f"{Fore.RED}Error{Fore.RESET}: {errs[str(err)]}  on profile entry: {err}\n"
         )
 
+    print(
+        f"[{Fore.GREEN}INFO{Fore.RESET}] {skipped} unchanged, {updated} updated, {removed} removed, {len(errs)} failed."
+    )
+    _print_retry_summary(provider_runner)
+
     print(
         f"[{Fore.GREEN}SUCCESS{Fore.RESET}] Profile '{profile}' successfully downloaded. If you are currently using this profile and wish to take advantage of the newly downloaded mods, use the {Fore.CYAN}activate{Fore.RESET} command."
     )
 
 
-def _generate_dispatcher(args: List[str], provider_runner: ProviderRunner) -> None:
+def _mod_key(mod: Dict, mc_version: str) -> str:
+    """Returns a string that identifies a profile entry, used to find the entry's jar from the previous download."""
+    return dumps(
+        {
+            "provider": mod["provider"],
+            "mc_version": mc_version,
+            "metadata": mod["metadata"],
+        },
+        sort_keys=True,
+    )
+
+
+def _resolve_mods(
+    provider_runner: "ProviderRunner",
+    work: List[Tuple[Dict, str, Union[Dict, None]]],
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+) -> List[Union[Tuple[Dict, Union[str, Exception]], None]]:
+    """Resolves every mod that has a provider with a resolve handler in one go, so that providers can batch their API requests.
+
+    Args:
+            work (List[Tuple[Dict, str, Union[Dict, None]]]): (profile entry, Minecraft version, previous resolution) per mod.
+
+    Returns:
+        List[Union[Tuple[Dict, Union[str, Exception]], None]]: The resolution and error of each mod, or None for mods whose provider can't resolve.
+    """
+    resolutions = provider_runner.resolve_many(
+        [
+            (mod["provider"], mc_version, mod["metadata"], previous_resolution)
+            for mod, mc_version, previous_resolution in work
+            if provider_runner.can_resolve(mod["provider"])
+        ],
+        jobs=jobs,
+    )
+
+    resolved_iter = iter(resolutions)
+    return [
+        next(resolved_iter) if provider_runner.can_resolve(mod["provider"]) else None
+        for mod, _, _ in work
+    ]
+
+
+def _split_dependencies(
+    resolved: List[Union[Tuple[Dict, Union[str, Exception]], None]]
+) -> List[Dict]:
+    """Removes the "dependencies", "provides" and "incompatible" lists from every resolution in resolved (see ResolveHandler).
+
+    They are removed so that the resolution of a mod only changes when the mod itself does.
+
+    Returns:
+        List[Dict]: The removed lists of each mod, by their name.
+    """
+    infos = []
+    for result in resolved:
+        resolution = (
+            result[0] if result is not None and isinstance(result[0], dict) else {}
+        )
+        infos.append(
+            {
+                field: resolution.pop(field, [])
+                for field in ("dependencies", "provides", "incompatible")
+            }
+        )
+    return infos
+
+
+def _dependency_entries(
+    mods: List[Dict], infos_by_key: Dict[str, Dict], mc_version: str
+) -> Tuple[List[Tuple[Dict, Dict]], Dict[str, str]]:
+    """Returns the dependencies of mods that are not profile entries of mods themselves, each once,
+    and the entries of mods that conflict with each other.
+
+    A profile entry of the same provider whose id is one the dependency provides replaces the dependency.
+    Dependencies are told apart by their provider and id alone, not by the rest of their metadata, so a mod
+    is never added twice. Two entries conflict if they need different versions of the same mod, or if one of
+    them (or a mod it needs) is incompatible with the other one (or a mod it needs). Conflicting entries
+    fail, and the mods that only they need are left out.
+
+    Returns:
+        Tuple[List[Tuple[Dict, Dict]], Dict[str, str]]: (profile entry, resolution) per dependency, in the
+        order of the mods needing them, and the error of every conflicting entry by its key.
+    """
+    explicit = set()
+    for mod in mods:
+        info = infos_by_key.get(_mod_key(mod, mc_version), {})
+        explicit.add((mod["provider"], entry_id(mod)))
+        explicit.update((mod["provider"], provided) for provided in info.get("provides", []))
+
+    # {key: (profile entry, ids it and its dependencies provide, ids they are incompatible with, [(key, dependency, resolution)])}
+    closures = {}
+    for mod in mods:
+        key = _mod_key(mod, mc_version)
+        info = infos_by_key.get(key, {})
+        provides = {(mod["provider"], entry_id(mod))} | {
+            (mod["provider"], provided) for provided in info.get("provides", [])
+        }
+        incompatible = {(mod["provider"], other) for other in info.get("incompatible", [])}
+
+        dependencies = []
+        for dependency in info.get("dependencies", []):
+            dependency_provides = {
+                (dependency["provider"], provided) for provided in dependency["provides"]
+            }
+            if dependency_provides & explicit:
+                continue
+
+            entry = {"provider": dependency["provider"], "metadata": dependency["metadata"]}
+            dependencies.append(
+                ((entry["provider"], entry_id(entry)), entry, dependency["resolution"])
+            )
+            provides |= dependency_provides
+
+        closures[key] = (mod, provides, incompatible, dependencies)
+
+    def label(key: str) -> str:
+        mod = closures[key][0]
+        return mod_label(mod["provider"], mod["metadata"])
+
+    errors = {}
+    needed_by = {}  # {(provider, dependency id): (key of the first entry needing it, its resolution)}
+    for key, (_, provides, incompatible, dependencies) in closures.items():
+        for identity, _, resolution in dependencies:
+            other_key, other_resolution = needed_by.setdefault(
+                identity, (key, resolution)
+            )
+            if other_resolution != resolution:
+                err = f"{label(other_key)} and {label(key)} need different versions of the same mod: {other_resolution.get('file_name') or other_resolution['version_id']} and {resolution.get('file_name') or resolution['version_id']}."
+                errors[other_key] = errors[key] = err
+
+        for other_key, (_, other_provides, _, _) in closures.items():
+            if other_key != key and incompatible & other_provides:
+                err = f"{label(key)} (or a mod it needs) is incompatible with {label(other_key)} (or a mod it needs)."
+                errors[other_key] = errors[key] = err
+
+    entries = {}
+    for key, (_, _, _, dependencies) in closures.items():
+        if key in errors:
+            continue
+        for identity, entry, resolution in dependencies:
+            entries.setdefault(identity, (entry, resolution))
+
+    return (list(entries.values()), errors)
+
+
+def _is_unchanged(previous_jar: Union[Dict, None], resolution: Dict) -> bool:
+    """Returns whether previous_jar is what resolution would download, so that it does not need to be fetched again."""
+    return (
+        previous_jar is not None
+        and previous_jar["resolution"] == resolution
+        and _jar_store().has_object(previous_jar["sha256"])
+    )
+
+
+def _fetch_into_store(
+    provider_runner: "ProviderRunner", provider_id: str, key: str, resolution: Dict
+) -> Tuple[Union[Dict, None], str]:
+    """Fetches the jar described by resolution and adds it to the jar store.
+
+    Returns:
+        Tuple[Union[Dict, None], str]: The manifest entry of the jar and an error string.
+    """
+    out_file = _jar_store().incoming_path(
+        resolution["file_name"] or "mod.jar",
+        f"{provider_id}:{resolution['url']}:{resolution['version_id']}",
+    )
+    result, err_str = provider_runner.fetch(provider_id, resolution, out_file)
+    if err_str != "":
+        return (None, err_str)
+
+    mod = mod_label(provider_id, resolution=resolution)
+    with provider_runner.stats.timed("verify", mod, provider_id):
+        err_str = check_download(result, resolution)
+    if err_str != "":
+        remove_file(result.path)
+        return (None, err_str)
+
+    with provider_runner.stats.timed("store", mod, provider_id):
+        sha256, size = _jar_store().add(result.path, result.digest)
+    if result.path.parent != out_file.parent:
+        # Fetch handlers that have to keep the jar's own name put it in a folder next to out_file
+        try:
+            result.path.parent.rmdir()
+        except OSError:
+            pass
+    return (
+        {
+            "key": key,
+            "file_name": resolution["file_name"] or result.path.name,
+            "sha256": sha256,
+            "size": size,
+            "resolution": resolution,
+        },
+        "",
+    )
+
+
+def _fetch_from_mirror(
+    provider_runner: "ProviderRunner", mirror: MirrorSource, locked_mod: Dict
+) -> Tuple[Union[Dict, None], str]:
+    """Copies (or downloads) the jar of a mirrored profile entry from mirror and adds it to the jar store.
+
+    Returns:
+        Tuple[Union[Dict, None], str]: The manifest entry of the jar and an error string.
+    """
+    mod = mod_label(locked_mod["provider"], resolution=locked_mod["resolution"])
+    try:
+        with provider_runner.stats.timed("transfer", mod, locked_mod["provider"]):
+            result = mirror.fetch(
+                locked_mod["sha256"],
+                _jar_store().incoming_path(
+                    locked_mod["file_name"], f"mirror:{locked_mod['sha256']}"
+                ),
+            )
+    except OSError as e:
+        # Both a missing file in a folder mirror and a failed request (requests.RequestException) end up here
+        return (None, f"Could not get {locked_mod['file_name']} from mirror {mirror}: {e}")
+
+    with provider_runner.stats.timed("store", mod, locked_mod["provider"]):
+        sha256, size = _jar_store().add(result.path, result.digest)
+    return (
+        {
+            "key": locked_mod["key"],
+            "file_name": locked_mod["file_name"],
+            "sha256": sha256,
+            "size": size,
+            "resolution": locked_mod["resolution"],
+        },
+        "",
+    )
+
+
+def _download_from_mirror(
+    profile: str,
+    provider_runner: "ProviderRunner",
+    mirror: MirrorSource,
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+) -> None:
+    """Downloads the jars of a mirrored profile from mirror, adding the profile to the config dir if it is not there yet."""
+    try:
+        mirrored = mirror.load_profile(profile)
+    except (OSError, ValueError) as e:
+        print(
+            f"[{Fore.RED}ERROR{Fore.RESET}] Could not load profile '{profile}' from mirror {mirror}: {e}"
+        )
+        return
+
+    profile_obj = _profile_store().load(profile)
+    if profile_obj is None:
+        _profile_store().save(profile, mirrored["profile"])
+        print(
+            f"[{Fore.GREEN}INFO{Fore.RESET}] Added profile '{profile}' from mirror {mirror}."
+        )
+        profile_obj = mirrored["profile"]
+    else:
+        if mirrored["profile_digest"] != profile_digest(profile_obj):
+            print(
+                f"[{Fore.YELLOW}WARNING{Fore.RESET}] Profile '{profile}' differs from the mirrored profile. Downloading the mirrored jars anyway."
+            )
+
+    _download_locked(
+        profile, profile_obj, provider_runner, jobs=jobs, mirror=mirror, lock_obj=mirrored
+    )
+
+
+def _lock_dispatcher(args: List[str], provider_runner: "ProviderRunner") -> None:
+    """Parses out the command line arguments and calls lock.
+
+    Args:
+            args (List[str]): Arguments to parse.
+    """
+    options = _parse_download_options(args, provider_runner)
+    if options is None:
+        return
+
+    return lock(args[0], provider_runner, **options)
+
+
+def lock(
+    profile: str,
+    provider_runner: "ProviderRunner",
+    mc_version_override=None,
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+) -> None:
+    profile_obj = _load_profile(profile)
+    if profile_obj is None:
+        return
+
+    mc_version = _profile_mc_version(profile, profile_obj, mc_version_override)
+    if mc_version is None:
+        return
+
+    locked_mods = _lock_profile(profile, profile_obj, mc_version, provider_runner, jobs)
+    if locked_mods is None:
+        print(
+            f"[{Fore.RED}ERROR{Fore.RESET}] The lock file of profile '{profile}' was not written because some entries could not be resolved."
+        )
+        return
+
+    save_lock(lock_path(_config_dir(), profile), profile_obj, mc_version, locked_mods)
+
+    print(
+        f"[{Fore.GREEN}SUCCESS{Fore.RESET}] Profile '{profile}' successfully locked. Use {Fore.CYAN}download --locked{Fore.RESET} to download exactly the locked jars."
+    )
+
+
+def _lock_profile(
+    profile: str,
+    profile_obj: Dict,
+    mc_version: str,
+    provider_runner: "ProviderRunner",
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+) -> Union[List[Dict], None]:
+    """Resolves every entry of profile and fetches the jars that are not in the jar store yet.
+
+    Returns:
+        Union[List[Dict], None]: The lock file entries of the profile, or None (after printing the errors) if any entry failed.
+    """
+    previous_manifest = _jar_store().load_manifest(profile)
+    previous_jars = {}
+    if previous_manifest is not None:
+        previous_jars = {
+            jar["key"]: jar for jar in previous_manifest["jars"] if "key" in jar
+        }
+
+    print(f"[{Fore.GREEN}INFO{Fore.RESET}] Resolving profile '{profile}'.")
+
+    def lock_mod(
+        work: Tuple[Dict, Union[Tuple[Dict, Union[str, Exception]], None]]
+    ) -> Tuple[Union[Dict, None], Union[str, Exception]]:
+        mod, resolved = work
+        if resolved is None:
+            # Reports why the mod can't be resolved (either an unknown provider or one without a resolve handler)
+            return provider_runner.resolve(mod["provider"], mc_version, mod["metadata"])
+
+        resolution, err = resolved
+        if err != "":
+            return (None, err)
+
+        try:
+            key = _mod_key(mod, mc_version)
+
+            # Not every provider publishes hashes and sizes, so jars that aren't in the store yet are fetched to pin them.
+            jar = previous_jars.get(key)
+            if not _is_unchanged(jar, resolution):
+                jar, err_str = _fetch_into_store(
+                    provider_runner, mod["provider"], key, resolution
+                )
+                if err_str != "":
+                    return (None, err_str)
+
+            return (
+                {
+                    "provider": mod["provider"],
+                    "metadata": mod["metadata"],
+                    "key": key,
+                    "file_name": jar["file_name"],
+                    "size": jar["size"],
+                    "sha256": jar["sha256"],
+                    "resolution": resolution,
+                },
+                "",
+            )
+        except Exception as e:
+            return (None, e)
+
+    resolved = _resolve_mods(
+        provider_runner,
+        [
+            (
+                mod,
+                mc_version,
+                previous_jars.get(_mod_key(mod, mc_version), {}).get("resolution"),
+            )
+            for mod in profile_obj["mods"]
+        ],
+        jobs=jobs,
+    )
+
+    # The mods that the entries need are pinned in the lock file too, so that download --locked installs them
+    dependencies, conflicts = _dependency_entries(
+        profile_obj["mods"],
+        dict(
+            zip(
+                [_mod_key(mod, mc_version) for mod in profile_obj["mods"]],
+                _split_dependencies(resolved),
+            )
+        ),
+        mc_version,
+    )
+    mods = profile_obj["mods"] + [mod for mod, _ in dependencies]
+    resolved = resolved + [(resolution, "") for _, resolution in dependencies]
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(lock_mod, zip(mods, resolved)))
+
+    errs = {}
+    for mod, (_, err) in zip(mods, results):
+        err = conflicts.get(_mod_key(mod, mc_version), err)
+        if err != "":
+            errs[str(mod)] = err
+
+    for err in errs:
+        print(
+            f"{Fore.RED}Error{Fore.RESET}: {errs[str(err)]}  on profile entry: {err}\n"
+        )
+
+    if len(errs) != 0:
+        return None
+
+    return [locked_mod for locked_mod, _ in results]
+
+
+def _mirror_dispatcher(args: List[str], provider_runner: "ProviderRunner") -> None:
+    """Parses out the command line arguments and calls mirror.
+
+    Args:
+            args (List[str]): Arguments to parse.
+    """
+    options = _parse_download_options(args, provider_runner)
+    if options is None:
+        return
+
+    mirror_dir = None
+    if "--dir" in args:
+        i = args.index("--dir")
+        try:
+            mirror_dir = Path(args[i + 1])
+        except IndexError:
+            print(f"[{Fore.RED}ERROR{Fore.RESET}] Expected argument after '--dir'")
+            return
+
+    if "--all" in args:
+        profiles = _profile_names()
+    else:
+        profiles = _positional_args(
+            args, ["--mc-version", "--jobs", "--build-jobs", "--dir"]
+        )
+        if len(profiles) == 0:
+            print(
+                f"[{Fore.RED}ERROR{Fore.RESET}] Expected at least one profile (or '--all')."
+            )
+            return
+
+    return mirror(profiles, provider_runner, mirror_dir=mirror_dir, **options)
+
+
+def _positional_args(args: List[str], options_with_values: List[str]) -> List[str]:
+    """Returns the arguments that are neither options nor the values of options_with_values."""
+    positional = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in options_with_values:
+            skip = True
+        elif not arg.startswith("--"):
+            positional.append(arg)
+    return positional
+
+
+def mirror(
+    profiles: List[str],
+    provider_runner: "ProviderRunner",
+    mirror_dir: Union[Path, None] = None,
+    mc_version_override=None,
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+) -> None:
+    """Resolves profiles and copies their jars and resolutions into mirror_dir, for download --mirror."""
+    if mirror_dir is None:
+        mirror_dir = gen_jar_storage_dir().parent / "mirror"
+
+    for profile in profiles:
+        profile_obj = _load_profile(profile)
+        if profile_obj is None:
+            continue
+
+        mc_version = _profile_mc_version(profile, profile_obj, mc_version_override)
+        if mc_version is None:
+            continue
+
+        locked_mods = _lock_profile(profile, profile_obj, mc_version, provider_runner, jobs)
+        if locked_mods is None:
+            print(
+                f"[{Fore.RED}ERROR{Fore.RESET}] Profile '{profile}' was not mirrored because some entries could not be resolved."
+            )
+            continue
+
+        added = write_profile(
+            mirror_dir, _jar_store(), profile, profile_obj, mc_version, locked_mods
+        )
+        print(
+            f"[{Fore.GREEN}SUCCESS{Fore.RESET}] Mirrored profile '{profile}' ({len(locked_mods)} jars, {added} new to the mirror)."
+        )
+
+    mirrored = write_index(mirror_dir, _jar_store()) if (mirror_dir / "profiles").exists() else []
+    print(
+        f"[{Fore.GREEN}INFO{Fore.RESET}] {mirror_dir} mirrors {len(mirrored)} profile(s). Serve it over HTTP or share the folder and use {Fore.CYAN}download <profile> --mirror <url or folder>{Fore.RESET}."
+    )
+
+
+def _verify_dispatcher(args: List[str]) -> None:
+    """Parses out the command line arguments and calls verify.
+
+    Args:
+            args (List[str]): Arguments to parse.
+    """
+    jobs = _parse_positive_int(args, "--jobs", os.cpu_count() or 1)
+    if jobs is None:
+        return
+
+    if "--all" in args:
+        profiles = None
+    else:
+        profiles = _positional_args(args, ["--jobs"])
+        if len(profiles) == 0:
+            print(
+                f"[{Fore.RED}ERROR{Fore.RESET}] Expected at least one profile (or '--all')."
+            )
+            return
+
+    return verify(profiles, jobs=jobs, repair="--repair" in args)
+
+
+def verify(
+    profiles: Union[List[str], None] = None, jobs: int = 1, repair: bool = False
+) -> bool:
+    """Checks the jars of profiles (or of every downloaded profile if profiles is None) in the jar store against
+    their SHA-256 and size and the hashes their Mod Providers published. Jars that several profiles share are checked once.
+
+    With repair, corrupted jars are removed from the store, so that the next download fetches them again.
+
+    Returns:
+            bool: Whether every jar is intact.
+    """
+    store = _jar_store()
+    if profiles is None:
+        profiles = sorted(
+            file.name[: -len(".json")] for file in store.manifests_dir.glob("*.json")
+        )
+
+    jars = {}
+    users = {}
+    for profile in profiles:
+        manifest = store.load_manifest(profile)
+        if manifest is None:
+            print(
+                f"[{Fore.RED}ERROR{Fore.RESET}] Profile '{profile}' has not been downloaded yet."
+            )
+            continue
+
+        for jar in manifest["jars"]:
+            jars.setdefault(jar["sha256"], jar)
+            users.setdefault(jar["sha256"], []).append(profile)
+
+    results = verify_jars(store, list(jars.values()), jobs)
+    corrupted = [result for result in results if len(result.problems) != 0]
+
+    for result in corrupted:
+        sha256 = result.jar["sha256"]
+        print(
+            f"[{Fore.RED}ERROR{Fore.RESET}] {result.jar['file_name']} ({', '.join(users[sha256])}) {'; '.join(result.problems)}."
+        )
+        if repair and store.has_object(sha256):
+            remove_file(store.object_path(sha256))
+
+    unchecked = sum(
+        1 for result in results if upstream_hash(result.jar.get("resolution")) is None
+    )
+    print(
+        f"[{Fore.GREEN}INFO{Fore.RESET}] Verified {len(results)} jar(s) of {len(profiles)} profile(s): {len(results) - len(corrupted)} intact, {len(corrupted)} corrupted. {unchecked} jar(s) have no hash published by their Mod Provider and were only checked against the jar store."
+    )
+    if len(corrupted) != 0:
+        if repair:
+            print(
+                f"[{Fore.GREEN}INFO{Fore.RESET}] Removed the corrupted jars from the jar store. Download the affected profiles again to replace them."
+            )
+        else:
+            print(
+                f"[{Fore.GREEN}INFO{Fore.RESET}] Run {Fore.CYAN}verify --repair{Fore.RESET} to remove the corrupted jars, so that the next download fetches them again."
+            )
+
+    return len(corrupted) == 0
+
+
+def _query_dispatcher(args: List[str]) -> None:
+    """Parses out the command line arguments and calls query.
+
+    Args:
+            args (List[str]): Arguments to parse.
+    """
+    options = {}
+    for option in ("--mod-version", "--jar"):
+        if option in args:
+            i = args.index(option)
+            try:
+                options[option[2:].replace("-", "_")] = args[i + 1]
+            except IndexError:
+                print(f"[{Fore.RED}ERROR{Fore.RESET}] Expected argument after '{option}'")
+                return
+
+    mods = _positional_args(args, ["--mod-version", "--jar"])
+    if len(mods) != 0:
+        options["mod"] = mods[0]
+
+    if ("mod" in options) == ("jar" in options):
+        print(
+            f"[{Fore.RED}ERROR{Fore.RESET}] Expected either a mod id or name, or '--jar <file name or SHA-256>'."
+        )
+        return
+
+    return query(as_json="--json" in args, **options)
+
+
+def query(
+    mod: Union[str, None] = None,
+    mod_version: Union[str, None] = None,
+    jar: Union[str, None] = None,
+    as_json: bool = False,
+) -> List[Dict]:
+    """Looks up which downloaded jars (and the profiles using them) declare mod (optionally at mod_version),
+    or which mods and Minecraft and loader versions the jar named jar declares, in the jar metadata index.
+
+    The index is brought up to date first, which only reads the jars that were added to the store since the last query.
+
+    Returns:
+            List[Dict]: One row per declared mod and profile using its jar.
+    """
+    index = JarIndex(_config_dir() / "jar_index.sqlite3")
+    try:
+        index.update(_jar_store())
+        rows = index.find_mod(mod, mod_version) if mod is not None else index.find_jar(jar)
+    finally:
+        index.close()
+
+    if as_json:
+        print(dumps(rows, indent=4))
+        return rows
+
+    if len(rows) == 0:
+        print(f"[{Fore.GREEN}INFO{Fore.RESET}] No downloaded jar matches.")
+        return rows
+
+    jars = {}
+    for row in rows:
+        entry = jars.setdefault(
+            row["sha256"], {"file_names": [], "profiles": [], "mods": []}
+        )
+        if row["file_name"] is not None and row["file_name"] not in entry["file_names"]:
+            entry["file_names"].append(row["file_name"])
+        if row["profile"] is not None and row["profile"] not in entry["profiles"]:
+            entry["profiles"].append(row["profile"])
+        mod_line = f"{row['mod_id']} {row['version'] or '?'} ({row['loader']}, Minecraft {row['minecraft'] or 'any'}, loader {row['loader_version'] or 'any'})"
+        if mod_line not in entry["mods"]:
+            entry["mods"].append(mod_line)
+
+    for sha256, entry in jars.items():
+        profiles = ", ".join(entry["profiles"]) or "no profile"
+        print(
+            f"[{Fore.GREEN}INFO{Fore.RESET}] {' / '.join(entry['file_names']) or sha256} in {profiles}:"
+        )
+        for mod_line in entry["mods"]:
+            print(f"    {mod_line}")
+
+    return rows
+
+
+def _generate_dispatcher(args: List[str], provider_runner: "ProviderRunner") -> None:
     """Parses out the command line arguments and calls generate.
 
     Args:
@@ -145,10 +1401,8 @@ def _generate_dispatcher(args: List[str], provider_runner: ProviderRunner) -> No
     return generate(args[0], provider_runner)
 
 
-def generate(profile: str, provider_runner: ProviderRunner) -> None:
-    profile_json_file = config_dir / f"profiles/{profile}.json"
-
-    if profile_json_file.exists():
+def generate(profile: str, provider_runner: "ProviderRunner") -> None:
+    if _profile_store().exists(profile):
         overwrite = input(
             f"Profile '{profile}' already exists. Do you want to overwrite it? (y/n) "
         )
@@ -196,8 +1450,7 @@ def generate(profile: str, provider_runner: ProviderRunner) -> None:
                 f"[{Fore.RED}ERROR{Fore.RESET}] The selected mod provider errored with the following explanation: {err_str}"
             )
 
-    with profile_json_file.open("w") as f:
-        dump(new_prof_obj, f, indent=4)
+    _profile_store().save(profile, new_prof_obj)
 
     print(
         f"[{Fore.GREEN}SUCCESS{Fore.RESET}] Profile '{profile}' successfully generated."
@@ -210,14 +1463,116 @@ def _list_dispatcher(args: List[str]) -> None:
     Args:
             args (List[str]): Arguments to parse.
     """
-    return list_profiles()
+    filters = {}
+    for option in ("--provider", "--mod", "--mc-version"):
+        if option in args:
+            i = args.index(option)
+            try:
+                filters[option[2:].replace("-", "_")] = args[i + 1]
+            except IndexError:
+                print(f"[{Fore.RED}ERROR{Fore.RESET}] Expected argument after '{option}'")
+                return
+
+    return list_profiles(**filters)
+
+
+def list_profiles(
+    provider: Union[str, None] = None,
+    mod: Union[str, None] = None,
+    mc_version: Union[str, None] = None,
+):
+    """Prints every profile, or only those with an entry of provider and/or mod, and for mc_version if it is given."""
+    if provider is None and mod is None and mc_version is None:
+        profiles = _profile_names()
+    else:
+        profiles = _profile_store().find(provider, mod, mc_version)
+
+    for profile in profiles:
+        print(profile)
+
 
+def _profile_names() -> List[str]:
+    return _profile_store().names()
 
-def list_profiles():
-    profile_storage = config_dir / "profiles"
 
-    for file in profile_storage.glob("*.json"):
-        print(file.name.replace(".json", ""))
+@lru_cache(maxsize=None)
+def _profile_store() -> ProfileStore:
+    # Listing never creates the config folder, it just has nothing to list if there is none,
+    # so the config is only read if it exists (the default backend keeps profiles in profiles/*.json)
+    config_dir = gen_config_dir(create=False)
+    config = load_config() if (config_dir / "config.json").exists() else {}
+
+    return profile_store(config.get("profile_backend", DEFAULT_BACKEND), config_dir)
+
+
+def _load_profile(profile: str) -> Union[Dict, None]:
+    """Returns the profile called profile, or None (after printing an error) if there is none."""
+    profile_obj = _profile_store().load(profile)
+    if profile_obj is None:
+        print(
+            f"[{Fore.RED}ERROR{Fore.RESET}] Could not find a profile.json for '{profile}'"
+        )
+    return profile_obj
+
+
+def _profiles_dispatcher(args: List[str]) -> None:
+    """Parses out the command line arguments and calls import_profiles or export_profiles.
+
+    Args:
+            args (List[str]): Arguments to parse.
+    """
+    if len(args) == 0 or args[0] not in ("import", "export"):
+        print(f"[{Fore.RED}ERROR{Fore.RESET}] Expected 'import' or 'export'.")
+        return
+
+    names = args[1:] if len(args) > 1 else None
+    if args[0] == "import":
+        return import_profiles(names)
+    return export_profiles(names)
+
+
+def import_profiles(names: Union[List[str], None] = None) -> None:
+    """Copies the profiles called names (default: all of them) from profiles/*.json into the SQLite profile database."""
+    _copy_profiles("json", "sqlite", names)
+
+
+def export_profiles(names: Union[List[str], None] = None) -> None:
+    """Copies the profiles called names (default: all of them) from the SQLite profile database to profiles/*.json."""
+    _copy_profiles("sqlite", "json", names)
+
+
+def _copy_profiles(
+    src_backend: str, dest_backend: str, names: Union[List[str], None]
+) -> None:
+    if src_backend == "sqlite" and not (_config_dir() / "profiles.sqlite3").exists():
+        print(
+            f"[{Fore.RED}ERROR{Fore.RESET}] There is no profile database to export yet. Use {Fore.CYAN}profiles import{Fore.RESET} first."
+        )
+        return
+
+    try:
+        src = profile_store(src_backend, _config_dir())
+        dest = profile_store(dest_backend, _config_dir())
+    except (ValueError, sqlite3.Error) as e:
+        print(f"[{Fore.RED}ERROR{Fore.RESET}] {e}")
+        return
+
+    try:
+        copied = copy_profiles(src, dest, names)
+    finally:
+        src.close()
+        dest.close()
+
+    for name in sorted(set(names or []) - set(copied)):
+        print(f"[{Fore.RED}ERROR{Fore.RESET}] Could not find profile '{name}' in {src}")
+
+    print(
+        f"[{Fore.GREEN}SUCCESS{Fore.RESET}] Copied {len(copied)} profile(s) from {src} to {dest}."
+    )
+    if dest_backend != _profile_store().backend:
+        print(
+            f"[{Fore.GREEN}INFO{Fore.RESET}] mcmm uses the '{_profile_store().backend}' profile backend. Set \"profile_backend\" to \"{dest_backend}\" in config.json to use the copied profiles."
+        )
 
 
 def _deactivate_dispatcher(args: List[str]) -> None:
@@ -230,13 +1585,15 @@ def _deactivate_dispatcher(args: List[str]) -> None:
 
 def deactivate(minecraft_dir: Union[Path, None] = None):
     if minecraft_dir is None:
-        mods_folder: Path = dot_minecraft / "mods"
-    else:
-        mods_folder: Path = minecraft_dir / "mods"
+        minecraft_dir = _dot_minecraft()
+        if minecraft_dir is None:
+            return
+
+    mods_folder: Path = minecraft_dir / "mods"
 
     # Remove mod jars from dot_minecraft/mods
     for file in mods_folder.glob("*.jar"):
-        file.unlink()
+        remove_file(file, _jar_store())
 
 
 def _modify_dispatcher(args: List[str]) -> None:
@@ -244,8 +1601,9 @@ def _modify_dispatcher(args: List[str]) -> None:
 
 
 def modify(profile_name: str):
-    with (config_dir / f"profiles/{profile_name}.json").open("r") as f:
-        profile_obj = load(f)
+    profile_obj = _load_profile(profile_name)
+    if profile_obj is None:
+        return
 
     while True:
         print(
@@ -279,5 +1637,4 @@ def modify(profile_name: str):
                 "Modifying Mod Providers is currently not supported by the modify command."
             )
 
-    with (config_dir / f"profiles/{profile_name}.json").open("w") as f:
-        dump(profile_obj, f, indent=4)
+    _profile_store().save(profile_name, profile_obj)
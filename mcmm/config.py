@@ -0,0 +1,21 @@
+"""config.py loads the user's mcmm configuration file (config.json in the config dir).
+"""
+
+from json import load
+from typing import Dict
+
+from .dirs import gen_config_dir
+
+DEFAULT_CONFIG = r'{"mod_providers": []}'
+
+def load_config() -> Dict:
+	"""Reads config.json from the config dir, creating it with the default contents if it does not exist yet.
+	"""
+	config_file = gen_config_dir() / "config.json"
+
+	if not config_file.exists():
+		with config_file.open("w") as f:
+			f.write(DEFAULT_CONFIG)
+
+	with config_file.open("r") as f:
+		return load(f)
@@ -21,7 +21,7 @@ def gen_dot_minecraft() -> Path:
 
 	return _dir
 
-def gen_config_dir() -> Path:
+def gen_config_dir(create: bool = True) -> Path:
 	if current_os == "Linux" or current_os == "Darwin":
 		# Technically, the "correct" location for configuration on Unix is $XDG_CONFIG_HOME, but for consistency, $HOME/.config is fine.
 		_dir = Path(getenv("HOME")) / ".config"
@@ -29,6 +29,17 @@ def gen_config_dir() -> Path:
 		_dir = Path(getenv("APPDATA"))
 
 	_dir: Path = _dir / "mcmm"
+	if create:
+		_dir.mkdir(parents=True, exist_ok=True)
+
+	return _dir
+
+def gen_cache_dir() -> Path:
+	if current_os == "Linux" or current_os == "Darwin":
+		_dir = Path(getenv("HOME")) / ".cache/mcmm"
+	elif current_os == "Windows":
+		_dir = Path(getenv("LOCALAPPDATA")) / "mcmm/cache"
+
 	_dir.mkdir(parents=True, exist_ok=True)
 
 	return _dir
@@ -0,0 +1,288 @@
+"""fetch.py contains helpers for writing downloaded jars to disk without holding them in memory.
+
+Downloads are retried with exponential backoff and jitter, and interrupted transfers resume from a .part
+file next to the destination with an HTTP Range request instead of starting over.
+"""
+
+import hashlib, mmap, os, random, threading, time
+from email.utils import parsedate_to_datetime
+from json import dump, load
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, List, NamedTuple, Union
+from uuid import uuid4
+
+if TYPE_CHECKING:
+	import requests
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_HASH = "sha256"
+
+# Responses with these status codes are worth retrying, every other error status is final.
+RETRY_STATUS_CODES = frozenset([408, 425, 429, 500, 502, 503, 504])
+
+class FetchResult(NamedTuple):
+	path: Path
+	size: int
+	hash_name: str
+	digest: str
+
+class RetryPolicy(NamedTuple):
+	retries: int = 3
+	backoff: float = 0.5
+	max_backoff: float = 30.0
+
+	def delay(self, attempt: int, retry_after: Union[float, None] = None) -> float:
+		"""Returns how many seconds to wait before retry number attempt (starting at 1).
+
+		The delay is chosen at random between 0 and an exponentially growing cap ("full jitter"), so that
+		many downloads that failed together do not retry together. A server's Retry-After takes precedence.
+		"""
+		if retry_after is not None:
+			return min(retry_after, self.max_backoff)
+		return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+NO_RETRY = RetryPolicy(retries=0)
+
+class RetryStats:
+	"""Counts the retries and resumed transfers of a session, for the summary at the end of a download.
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.retries = 0
+		self.resumed = 0
+		self.resumed_bytes = 0
+		self.retried_urls = set()
+
+	def record_retry(self, url: str) -> None:
+		with self._lock:
+			self.retries += 1
+			self.retried_urls.add(url)
+
+	def record_resume(self, offset: int) -> None:
+		with self._lock:
+			self.resumed += 1
+			self.resumed_bytes += offset
+
+def stream_to_file(url: str, out_file: Path, session: "requests.Session" = None, hash_name: str = DEFAULT_HASH, chunk_size: int = CHUNK_SIZE, retry: RetryPolicy = None, **kwargs) -> FetchResult:
+	"""Downloads url to out_file in fixed-size chunks, hashing the data as it is written.
+
+	The data is written to out_file.part, which is renamed to out_file once it is complete, so out_file
+	is never left half-written. Transient failures (connection errors, timeouts and RETRY_STATUS_CODES)
+	are retried according to retry (default: the session's retry_policy, or no retries without a session),
+	and every retry resumes the .part file with a Range request. If all retries fail, the .part file is
+	kept, so the next download of out_file resumes it as long as the server's ETag/Last-Modified still match.
+	Providers should pass their session so that the transfer reuses ProviderRunner's pooled connections.
+
+	Raises:
+		requests.HTTPError: The server responded with an error status.
+		requests.RequestException: The transfer failed and could not be retried.
+	"""
+	import requests
+
+	if session is not None:
+		get = session.get
+	else:
+		get = requests.get
+
+	if retry is None:
+		retry = getattr(session, "retry_policy", None) or NO_RETRY
+	stats: Union[RetryStats, None] = getattr(session, "retry_stats", None)
+	http_stats = getattr(session, "http_stats", None)
+
+	transient_errors = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+	headers = dict(kwargs.pop("headers", None) or {})
+
+	out_file.parent.mkdir(parents=True, exist_ok=True)
+	part_file = out_file.parent / f"{out_file.name}.part"
+	meta_file = out_file.parent / f"{out_file.name}.part.json"
+
+	with _part_lock(part_file):
+		# A .part file left behind by an earlier run is only resumed if it belongs to the same URL and the server can tell whether it changed since.
+		validator = _load_validator(meta_file, url)
+		if validator is None:
+			_remove(part_file)
+
+		attempt = 0
+		while True:
+			offset = part_file.stat().st_size if part_file.exists() else 0
+			request_headers = dict(headers)
+			if offset > 0:
+				request_headers["Range"] = f"bytes={offset}-"
+				if validator is not None:
+					request_headers["If-Range"] = validator
+
+			retry_after = None
+			try:
+				with get(url, stream=True, headers=request_headers, **kwargs) as r:
+					if r.status_code == 416 and offset > 0:
+						# The part file does not fit the resource anymore
+						_remove(part_file)
+						raise requests.HTTPError(f"416 Range Not Satisfiable for url: {url}", response=r)
+
+					retry_after = retry_after_seconds(r)
+					r.raise_for_status()
+
+					if offset > 0 and r.status_code != 206:
+						# The server ignored the range (or the resource changed), so it sent the whole file
+						offset = 0
+					elif offset > 0 and stats is not None:
+						stats.record_resume(offset)
+
+					validator = _strong_validator(r)
+					if validator is not None:
+						_save_validator(meta_file, url, validator)
+
+					hasher = hashlib.new(hash_name)
+					if offset > 0:
+						with part_file.open("rb") as f:
+							for chunk in _iter_file(f, chunk_size):
+								hasher.update(chunk)
+
+					size = offset
+					transfer_start = time.perf_counter()
+					try:
+						with _open_part(part_file, append=offset > 0) as f:
+							for chunk in r.iter_content(chunk_size=chunk_size):
+								f.write(chunk)
+								hasher.update(chunk)
+								size += len(chunk)
+					finally:
+						if http_stats is not None:
+							http_stats.record_transfer(size - offset, time.perf_counter() - transfer_start)
+				break
+			except transient_errors + (requests.HTTPError,) as e:
+				# A 416 means that the part file was removed, so retrying starts over
+				retryable = not isinstance(e, requests.HTTPError) or (e.response is not None and (e.response.status_code in RETRY_STATUS_CODES or e.response.status_code == 416))
+				if not retryable or attempt >= retry.retries:
+					if not retryable:
+						_remove(part_file)
+						_remove(meta_file)
+					raise
+
+				attempt += 1
+				if stats is not None:
+					stats.record_retry(url)
+				time.sleep(retry.delay(attempt, retry_after))
+
+		os.replace(str(part_file), str(out_file))
+		_remove(meta_file)
+
+	return FetchResult(out_file, size, hash_name, hasher.hexdigest())
+
+def copy_to_file(in_file: Path, out_file: Path, hash_name: str = DEFAULT_HASH, chunk_size: int = CHUNK_SIZE) -> FetchResult:
+	"""Copies in_file to out_file with the same chunked, atomic and hashing behavior as stream_to_file.
+	"""
+	with in_file.open("rb") as f:
+		return _write_atomic(_iter_file(f, chunk_size), out_file, hash_name)
+
+def hash_file(in_file: Path, hash_name: str = DEFAULT_HASH, chunk_size: int = CHUNK_SIZE) -> str:
+	"""Returns the hex digest of in_file, reading it in fixed-size chunks.
+	"""
+	hasher = hashlib.new(hash_name)
+	with in_file.open("rb") as f:
+		for chunk in _iter_file(f, chunk_size):
+			hasher.update(chunk)
+	return hasher.hexdigest()
+
+def hash_file_multi(in_file: Path, hash_names: List[str]) -> Dict[str, str]:
+	"""Returns the hex digests of in_file for every algorithm in hash_names, reading the file from disk only once.
+
+	The file is memory-mapped, so the hashes are computed straight from the page cache without copying
+	it into Python, and hashlib releases the GIL while it hashes, so several threads can verify files at once.
+	"""
+	hashers = {hash_name: hashlib.new(hash_name) for hash_name in hash_names}
+	with in_file.open("rb") as f:
+		# Empty files can't be mapped, but there is nothing to hash in them either.
+		if os.fstat(f.fileno()).st_size != 0:
+			with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+				for hasher in hashers.values():
+					hasher.update(m)
+
+	return {hash_name: hasher.hexdigest() for hash_name, hasher in hashers.items()}
+
+def _iter_file(f: BinaryIO, chunk_size: int) -> Iterable[bytes]:
+	while True:
+		chunk = f.read(chunk_size)
+		if not chunk:
+			return
+		yield chunk
+
+_part_locks: Dict[str, threading.Lock] = {}
+_part_locks_lock = threading.Lock()
+
+def _part_lock(part_file: Path) -> threading.Lock:
+	"""Returns the lock that keeps two threads from writing the same .part file at once.
+	"""
+	with _part_locks_lock:
+		return _part_locks.setdefault(str(part_file), threading.Lock())
+
+def _open_part(part_file: Path, append: bool) -> BinaryIO:
+	# os.open is used so that the jar gets the usual umask-based permissions, just like in _write_atomic.
+	flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0) | (os.O_APPEND if append else os.O_TRUNC)
+	return os.fdopen(os.open(str(part_file), flags, 0o666), "wb")
+
+def _strong_validator(r: "requests.Response") -> Union[str, None]:
+	"""Returns the ETag or Last-Modified of a response if it can be used in If-Range (weak ETags can't)."""
+	etag = r.headers.get("ETag")
+	if etag is not None and not etag.startswith("W/"):
+		return etag
+	return r.headers.get("Last-Modified")
+
+def retry_after_seconds(r: "requests.Response") -> Union[float, None]:
+	"""Returns how many seconds the Retry-After header of r asks to wait, or None if it has none.
+	"""
+	value = r.headers.get("Retry-After")
+	if value is None:
+		return None
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	try:
+		return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+	except (TypeError, ValueError):
+		return None
+
+def _load_validator(meta_file: Path, url: str) -> Union[str, None]:
+	try:
+		with meta_file.open("r") as f:
+			meta = load(f)
+	except (OSError, ValueError):
+		return None
+	return meta.get("validator") if meta.get("url") == url else None
+
+def _save_validator(meta_file: Path, url: str, validator: str) -> None:
+	with meta_file.open("w") as f:
+		dump({"url": url, "validator": validator}, f)
+
+def _remove(file: Path) -> None:
+	try:
+		file.unlink()
+	except FileNotFoundError:
+		pass
+
+def _write_atomic(chunks: Iterable[bytes], out_file: Path, hash_name: str) -> FetchResult:
+	out_file.parent.mkdir(parents=True, exist_ok=True)
+	hasher = hashlib.new(hash_name)
+	size = 0
+
+	# The temporary file has to live in the same directory as out_file for os.replace to be an atomic rename.
+	# os.open is used over tempfile.mkstemp so that the jar gets the usual umask-based permissions instead of 0600.
+	tmp_name = str(out_file.parent / f".{out_file.name}.{uuid4().hex}.tmp")
+	fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+	try:
+		with os.fdopen(fd, "wb") as f:
+			for chunk in chunks:
+				f.write(chunk)
+				hasher.update(chunk)
+				size += len(chunk)
+		os.replace(tmp_name, str(out_file))
+	except BaseException:
+		try:
+			os.unlink(tmp_name)
+		except OSError:
+			pass
+		raise
+
+	return FetchResult(out_file, size, hash_name, hasher.hexdigest())
@@ -1,18 +1,17 @@
 """file is a Mod Provider for files on the local system.
 """
 
-import os, platform, requests
+import os, platform
 from pathlib import Path
-from requests.models import HTTPError
 from typing import Dict, Tuple
 
-from ..plugin import DownloadHandler, GenerationHandler, MCMMPlugin, PluginBase
+from ..fetch import copy_to_file
+from ..plugin import FetchHandler, GenerationHandler, MCMMPlugin, PluginBase, ResolveHandler
 
 if platform.system() == "Windows":
     cache_dir = Path(f"{os.getenv('LOCALAPPDATA')}/mcmm/cache/file")
 else:
     cache_dir = Path(f"{os.getenv('HOME')}/.cache/mcmm/file")
-cache_dir.mkdir(exist_ok=True, parents=True)
 
 
 @MCMMPlugin
@@ -20,17 +19,35 @@ class FileModProvider(PluginBase):
     id = "file"
     help_string = "Local File Mod Provider"
 
-    @DownloadHandler
-    def download_mod(self, mc_version, info) -> Tuple[Path, str]:
-        file_path = Path(info["file_path"])
-
-        out_file = cache_dir / f"{file_path.name}"
-
-        out_file.parent.mkdir(parents=True, exist_ok=True)
-
-        with file_path.open("rb") as in_f:
-            with out_file.open("wb") as f:
-                f.write(in_f.read())
+    @ResolveHandler
+    def resolve(self, mc_version, info) -> Tuple[Dict, str]:
+        file_path = Path(os.path.abspath(info["file_path"]))
+
+        try:
+            stat = file_path.stat()
+        except OSError as e:
+            return ({}, str(e))
+
+        # Local files have no version, but a changed file almost always has a different size or modification time.
+        return (
+            {
+                "file_name": file_path.name,
+                "url": file_path.as_uri(),
+                "version_id": f"{stat.st_mtime_ns}-{stat.st_size}",
+                "size": stat.st_size,
+                "file_path": str(file_path),
+            },
+            "",
+        )
+
+    @FetchHandler
+    def fetch(self, resolution: Dict, out_file: Path) -> Tuple[Path, str]:
+        file_path = Path(resolution["file_path"])
+
+        try:
+            out_file = copy_to_file(file_path, out_file).path
+        except OSError as e:
+            return (Path.cwd(), str(e))
 
         return (out_file, "")
 
@@ -1,160 +1,370 @@
 """github is a Mod Provider for GitHub(github.com).
 """
 
-import os, platform, random, requests
+import hashlib, os, platform, threading, time
+from colorama import Fore
 from dateutil.parser import isoparse
-from github_release import get_releases
+from json import dump, dumps, load
 from pathlib import Path
 from requests.models import HTTPError
+from shutil import copyfile as shutil_copyfile
 from shutil import rmtree as shutil_rmtree
-from shutil import move as shutil_move
-from subprocess import Popen
-from typing import Dict, Tuple
+from subprocess import DEVNULL, PIPE, STDOUT, Popen
+from typing import Dict, List, Tuple, Union
+from uuid import uuid4
 
-from ..plugin import DownloadHandler, GenerationHandler, MCMMPlugin, PluginBase
+from ..fetch import copy_to_file, stream_to_file
+from ..plugin import FetchHandler, GenerationHandler, MCMMPlugin, PluginBase, ResolveHandler
 
 if platform.system() == "Windows":
 	save_dir = Path(f"{os.getenv('LOCALAPPDATA')}/mcmm/cache/github")
 else:
 	save_dir = Path(f"{os.getenv('HOME')}/.cache/mcmm/github")
-save_dir.mkdir(parents=True, exist_ok=True)
+
+# Bare mirrors of the repos of compile entries, updated with incremental fetches.
+repos_dir = save_dir / "repos"
+# The jars built from a commit with a command, so that an unchanged commit is never built twice.
+builds_dir = save_dir / "builds"
+worktrees_dir = save_dir / "worktrees"
+# The output of the latest build of each build in builds_dir, named like it.
+build_logs_dir = save_dir / "logs"
+
+DEFAULT_BUILD_JOBS = 2
+
+# Git can't run two fetches or worktree changes in the same repo at once, so they are serialized per repo.
+_repo_locks: Dict[str, threading.Lock] = {}
+_repo_locks_lock = threading.Lock()
+
+def _repo_lock(repo: str) -> threading.Lock:
+	with _repo_locks_lock:
+		return _repo_locks.setdefault(repo, threading.Lock())
+
+def _git(args: List[str], cwd: Path) -> Tuple[int, str]:
+	p = Popen(["git"] + args, cwd=str(cwd), stdout=PIPE, stderr=STDOUT, universal_newlines=True)
+	out, _ = p.communicate()
+	return (p.returncode, out)
+
+RELEASES_PER_PAGE = 100
+RELEASE_INDEX_VERSION = 2
 
 @MCMMPlugin
 class GitHubModProvider(PluginBase):
 	id = "github"
 	help_string = "GitHub Mod Provider"
 
-	@DownloadHandler
-	def download_mod(self, mc_version: str, info: Dict) -> Tuple[Path, str]:
+	def __init__(self):
+		self._build_slots: Union[threading.BoundedSemaphore, None] = None
+		self._build_slots_lock = threading.Lock()
+
+	@ResolveHandler
+	def resolve(self, mc_version: str, info: Dict) -> Tuple[Dict, str]:
 		repo = info["repo"]
 
 		if info["releases"] != None:
-			return self._releases(repo, info["releases"])
+			return self._resolve_release(repo, info["releases"])
 		elif info["compile"] != None:
-			return self._compile(repo, info["compile"])
+			return self._resolve_compile(repo, info["compile"])
 		else:
-			return (Path.cwd(), "'releases' or 'compile' must be defined")
+			return ({}, "'releases' or 'compile' must be defined")
 
-	def _releases(self, repo: str, info: Dict) -> Path:
+	@FetchHandler
+	def fetch(self, resolution: Dict, out_file: Path) -> Tuple[Path, str]:
+		if resolution.get("compile") != None:
+			return self._compile(resolution["repo"], resolution["compile"], resolution["version_id"], out_file)
+
+		try:
+			out_file = stream_to_file(resolution["url"], out_file, session=self.session).path
+		except HTTPError as e:
+			return (Path.cwd(), str(e))
+
+		return (out_file, "")
+
+	def _resolve_release(self, repo: str, info: Dict) -> Tuple[Dict, str]:
 		if info["latest"]:
-			r = requests.get(f"https://api.github.com/repos/{repo}/releases/latest")
+			r = self.session.get_cached(f"https://api.github.com/repos/{repo}/releases/latest")
 			try:
 				r.raise_for_status()
 			except HTTPError as e:
-				return (Path.cwd(), str(e))
+				return ({}, str(e))
 
-			latest_release = r.json()
+			release = r.json()
 
-			for asset in latest_release["assets"]:
-				invalid = False
-				for s in info["must_contain"]:
-					if s not in asset["name"]:
-						invalid = True
-						break
-				if invalid:
-					continue
-
-				for s in info["must_not_contain"]:
-					if s in asset["name"]:
-						invalid = True
-						break
-				if invalid:
-					continue
-
-				r = requests.get(asset["browser_download_url"])
-				try:
-					r.raise_for_status()
-				except HTTPError as e:
-					return (Path.cwd(), str(e))
-
-				out_file: Path = save_dir / asset["name"]
-
-				with out_file.open("wb") as f:
-					f.write(r.content)
-
-				return (out_file, "")
-
-			return (Path.cwd(), f"Could not locate a valid binary for {info}")
-
-		else: # We have to evaluate all tags against info["tag"]
-			matching_releases = [release for release in get_releases(repo) if info["tag"] in release["tag_name"]]
-
-			times = [isoparse(r["published_at"]) for r in matching_releases]
-
-			most_recent_release_time = max(times)
-
-			most_recent_release = [r for r in matching_releases if isoparse(r["published_at"]) == most_recent_release_time][0]
-
-			for asset in most_recent_release["assets"]:
-				invalid = False
-				for s in info["must_contain"]:
-					if s not in asset["name"]:
-						invalid = True
-						break
-				if invalid:
-					continue
-
-				for s in info["must_not_contain"]:
-					if s in asset["name"]:
-						invalid = True
-						break
-				if invalid:
-					continue
-
-				r = requests.get(asset["browser_download_url"])
-				try:
-					r.raise_for_status()
-				except HTTPError as e:
-					return (Path.cwd(), str(e))
-
-				out_file: Path = save_dir / asset["name"]
-
-				with out_file.open("wb") as f:
-					f.write(r.content)
-
-				return (out_file, "")
-
-			return (Path.cwd(), f"Could not locate a valid binary for {info}")
-
-	def _compile(self, repo: str, info: Dict) -> Path:
-		clone_dir = save_dir / (repo.replace("/", "") + f"-{random.randint(0, 99999999)}")
-		os.system(f"git clone https://github.com/{repo} {clone_dir}")
-
-		p = Popen(["git", "checkout", info["branch"]], cwd=str(clone_dir), shell=True)
-		p.wait()
-
-		p = Popen(info["command"], cwd=str(clone_dir), shell=True)
-		p.wait()
-
-		jar_dir: Path = clone_dir / info["dir"]
-
-		for jar in jar_dir.glob("*.jar"):
-				invalid = False
-				for s in info["must_contain"]:
-					if s not in jar.name:
-						invalid = True
-						break
-				if invalid:
-					continue
-
-				for s in info["must_not_contain"]:
-					if s in jar.name:
-						invalid = True
-						break
-				if invalid:
+		else: # We have to evaluate the tags against info["tag"]
+			try:
+				release = self._find_release(repo, info["tag"])
+			except HTTPError as e:
+				return ({}, str(e))
+
+			if release is None:
+				return ({}, f"Could not find a release of {repo} with a tag containing '{info['tag']}'")
+
+		asset = self._select_asset(release, info)
+		if asset is None:
+			return ({}, f"Could not locate a valid binary for {info}")
+
+		resolution = {
+			"file_name": asset["name"],
+			"url": asset["browser_download_url"],
+			"version_id": str(asset["id"]) if "id" in asset else f"{release['tag_name']}/{asset['name']}",
+			"size": asset.get("size"),
+		}
+		# GitHub publishes the SHA-256 of assets as "sha256:<hex>", but only for assets uploaded since mid 2025
+		if (asset.get("digest") or "").startswith("sha256:"):
+			resolution["hashes"] = {"sha256": asset["digest"][len("sha256:"):]}
+
+		return (resolution, "")
+
+	def _find_release(self, repo: str, tag: Union[str, None]) -> Union[Dict, None]:
+		"""Returns the most recently published release of repo whose tag contains tag, or None if there is none.
+
+		GitHub lists releases newest first, so pages are only requested until one contains a matching release.
+		The parsed pages are kept in a release index on disk, which stays valid for as long as the first page
+		of releases does not change, so later runs usually need a single (conditional) request.
+		"""
+		r = self._get_release_page(repo, 1)
+		first_page = hashlib.sha256(r.content).hexdigest()
+
+		index = self._load_release_index(repo)
+		changed = index is None or index["first_page"] != first_page
+		if changed:
+			index = {"version": RELEASE_INDEX_VERSION, "first_page": first_page, "complete": False, "pages": []}
+			self._add_release_page(index, r.json())
+
+		# Searching stops at the end of the first page with a match even if more pages are cached,
+		# so the result does not depend on how much of the release history earlier runs had to read.
+		newest = None
+		page = 0
+		while newest is None:
+			if page == len(index["pages"]):
+				if index["complete"]:
+					break
+				self._add_release_page(index, self._get_release_page(repo, page + 1).json())
+				changed = True
+
+			for release in index["pages"][page]:
+				if tag is not None and tag not in release["tag_name"]:
 					continue
+				if newest is None or release["published_at"] > newest["published_at"]:
+					newest = release
+			page += 1
+
+		if changed:
+			self._save_release_index(repo, index)
+
+		return newest
+
+	def _get_release_page(self, repo: str, page: int):
+		r = self.session.get_cached(f"https://api.github.com/repos/{repo}/releases?per_page={RELEASES_PER_PAGE}&page={page}")
+		r.raise_for_status()
+		return r
+
+	def _add_release_page(self, index: Dict, releases: List[Dict]) -> None:
+		"""Appends a page of releases to index, reduced to the fields that resolving needs and with published_at parsed into a POSIX timestamp.
+		"""
+		index["pages"].append([{
+			"tag_name": release["tag_name"],
+			"published_at": isoparse(release["published_at"]).timestamp(),
+			"assets": [{
+				"id": asset["id"],
+				"name": asset["name"],
+				"browser_download_url": asset["browser_download_url"],
+				"size": asset.get("size"),
+				"digest": asset.get("digest"),
+			} for asset in release["assets"]],
+		} for release in releases if release.get("published_at") is not None]) # Drafts have not been published
+		index["complete"] = len(releases) < RELEASES_PER_PAGE
+
+	def _release_index_path(self, repo: str) -> Path:
+		return save_dir / "releases" / (repo.replace("/", "__") + ".json")
+
+	def _load_release_index(self, repo: str) -> Union[Dict, None]:
+		try:
+			with self._release_index_path(repo).open("r") as f:
+				index = load(f)
+		except (OSError, ValueError):
+			return None
+
+		if index.get("version") != RELEASE_INDEX_VERSION:
+			return None
+
+		return index
+
+	def _save_release_index(self, repo: str, index: Dict) -> None:
+		index_file = self._release_index_path(repo)
+		index_file.parent.mkdir(parents=True, exist_ok=True)
+
+		tmp = index_file.parent / f".{index_file.name}.{uuid4().hex}.tmp"
+		with tmp.open("w") as f:
+			dump(index, f)
+		os.replace(str(tmp), str(index_file))
+
+	def _select_asset(self, release: Dict, info: Dict) -> Union[Dict, None]:
+		for asset in release["assets"]:
+			invalid = False
+			for s in info["must_contain"]:
+				if s not in asset["name"]:
+					invalid = True
+					break
+			if invalid:
+				continue
+
+			for s in info["must_not_contain"]:
+				if s in asset["name"]:
+					invalid = True
+					break
+			if invalid:
+				continue
+
+			return asset
+
+		return None
+
+	def _resolve_compile(self, repo: str, info: Dict) -> Tuple[Dict, str]:
+		# The commit that the branch points to identifies the build, so an unchanged branch does not need to be rebuilt.
+		p = Popen(["git", "ls-remote", f"https://github.com/{repo}", info["branch"]], stdout=PIPE, universal_newlines=True)
+		out, _ = p.communicate()
+		if p.returncode != 0:
+			return ({}, f"Could not list the refs of https://github.com/{repo}")
+
+		refs = {}
+		for line in out.splitlines():
+			sha, _, ref = line.partition("\t")
+			refs[ref] = sha
+
+		branch = info["branch"]
+		for ref in [f"refs/heads/{branch}", f"refs/tags/{branch}^{{}}", f"refs/tags/{branch}"]:
+			if ref in refs:
+				sha = refs[ref]
+				break
+		else:
+			# Commits can be checked out directly, but they are not refs that ls-remote can find
+			if len(branch) >= 7 and all(c in "0123456789abcdef" for c in branch.lower()):
+				sha = branch
+			else:
+				return ({}, f"Could not find branch '{branch}' in https://github.com/{repo}")
+
+		return ({
+			"file_name": None,
+			"url": f"https://github.com/{repo}",
+			"version_id": sha,
+			"repo": repo,
+			"compile": info,
+		}, "")
+
+	def _compile(self, repo: str, info: Dict, commit: str, out_file: Path) -> Tuple[Path, str]:
+		build_dir = builds_dir / hashlib.sha256(dumps({"commit": commit, "command": info["command"], "dir": info["dir"]}, sort_keys=True).encode()).hexdigest()
+		if not build_dir.exists():
+			err_str = self._build(repo, info, commit, build_dir)
+			if err_str != "":
+				return (Path.cwd(), err_str)
+
+		for jar in sorted(build_dir.glob("*.jar")):
+			if any(s not in jar.name for s in info["must_contain"]):
+				continue
+
+			if any(s in jar.name for s in info["must_not_contain"]):
+				continue
+
+			# The caller takes ownership of the returned file, so the cached build is copied. The jar keeps its
+			# name, which is the only one it has (compile resolutions have no file_name), in a folder of its own.
+			return (copy_to_file(jar, out_file.parent / out_file.stem / jar.name).path, "")
 
-				out_file: Path = save_dir / jar.name
-
-				shutil_move(str(jar), str(out_file))
-
-				shutil_rmtree(str(clone_dir), ignore_errors=True)
-				return (out_file, "")
-
-		# Unfortunately, shutil_rmtree leaves behind some files in .git because of permission errors
-		shutil_rmtree(str(clone_dir), ignore_errors=True)
 		return (Path.cwd(), f"Could not locate a binary for info: {info}")
 
+	def _update_mirror(self, repo: str, commit: str) -> Tuple[Path, str]:
+		"""Makes sure that the bare mirror of repo contains commit, fetching only what it is missing.
+		"""
+		mirror = repos_dir / (repo.replace("/", "__") + ".git")
+		if not mirror.exists():
+			mirror.mkdir(parents=True)
+			_git(["init", "--bare"], mirror)
+			_git(["remote", "add", "origin", f"https://github.com/{repo}"], mirror)
+
+		if _git(["cat-file", "-e", f"{commit}^{{commit}}"], mirror)[0] == 0:
+			return (mirror, "")
+
+		_git(["fetch", "--prune", "--tags", "origin", "+refs/heads/*:refs/heads/*"], mirror)
+		if _git(["cat-file", "-e", f"{commit}^{{commit}}"], mirror)[0] == 0:
+			return (mirror, "")
+
+		# Commits that no branch points to anymore can still be fetched by their hash
+		returncode, out = _git(["fetch", "origin", commit], mirror)
+		if returncode != 0:
+			return (mirror, f"Could not fetch commit {commit} of https://github.com/{repo}: {out.strip()}")
+
+		return (mirror, "")
+
+	def _build(self, repo: str, info: Dict, commit: str, build_dir: Path) -> str:
+		"""Builds commit of repo in a temporary worktree and keeps the resulting jars in build_dir.
+		"""
+		worktree = worktrees_dir / f"{repo.replace('/', '__')}-{uuid4().hex}"
+
+		with _repo_lock(repo):
+			mirror, err_str = self._update_mirror(repo, commit)
+			if err_str != "":
+				return err_str
+
+			worktrees_dir.mkdir(parents=True, exist_ok=True)
+			returncode, out = _git(["worktree", "add", "--detach", str(worktree), commit], mirror)
+			if returncode != 0:
+				return f"Could not check out commit {commit} of https://github.com/{repo}: {out.strip()}"
+
+		try:
+			returncode, seconds, log_file = self._run_build(repo, info, worktree, build_dir.name)
+			if returncode != 0:
+				return f"Build command {info['command']} of {repo}@{commit[:7]} failed with exit code {returncode} after {seconds:.1f}s, see {log_file}"
+
+			# A build that leaves nothing behind is not kept, so that the next run builds the commit again
+			jars = list((worktree / info["dir"]).glob("*.jar"))
+			if len(jars) == 0:
+				return f"Build command {info['command']} of {repo}@{commit[:7]} finished, but left no jars in {info['dir']}, see {log_file}"
+			print(f"[{Fore.GREEN}INFO{Fore.RESET}] Built {repo}@{commit[:7]} in {seconds:.1f}s (log: {log_file})")
+
+			tmp_dir = builds_dir / f".{build_dir.name}.{uuid4().hex}.tmp"
+			tmp_dir.mkdir(parents=True)
+			for jar in jars:
+				shutil_copyfile(str(jar), str(tmp_dir / jar.name))
+			try:
+				os.replace(str(tmp_dir), str(build_dir))
+			except OSError:
+				# Another entry built the same commit with the same command at the same time
+				shutil_rmtree(str(tmp_dir), ignore_errors=True)
+				if not build_dir.exists():
+					raise
+		finally:
+			with _repo_lock(repo):
+				_git(["worktree", "remove", "--force", str(worktree)], mirror)
+				shutil_rmtree(str(worktree), ignore_errors=True)
+				_git(["worktree", "prune"], mirror)
+
+		return ""
+
+	def _run_build(self, repo: str, info: Dict, worktree: Path, build_name: str) -> Tuple[int, float, Path]:
+		"""Runs the build command of info in worktree once one of the build slots is free.
+
+		Every build is its own process with its own worktree, so up to options["build_jobs"] builds run side by side.
+		Their output is written to a log file instead of being interleaved on the terminal, which is named after the
+		build's folder in builds_dir (build_name), so that entries building the same commit with another command or dir
+		do not write to the same log.
+
+		Returns:
+			Tuple[int, float, Path]: The exit code of the build command, how many seconds it took and its log file.
+		"""
+		with self._build_slots_lock:
+			if self._build_slots is None:
+				self._build_slots = threading.BoundedSemaphore((self.options or {}).get("build_jobs", DEFAULT_BUILD_JOBS))
+
+		build_logs_dir.mkdir(parents=True, exist_ok=True)
+		log_file = build_logs_dir / f"{repo.replace('/', '__')}-{build_name}.log"
+
+		with self._build_slots, log_file.open("w") as log:
+			start = time.perf_counter()
+			# Build commands are stored one argument per line, but Windows needs a shell to find .bat files like gradlew.bat
+			p = Popen(info["command"], cwd=str(worktree), stdin=DEVNULL, stdout=log, stderr=STDOUT, shell=platform.system() == "Windows")
+			returncode = p.wait()
+
+		return (returncode, time.perf_counter() - start, log_file)
+
 	@GenerationHandler
 	def generate(self) -> Tuple[Dict, str]:
 		repo = input("Repo name (ex. 'BrenekH/mc-mod-manager'): ")
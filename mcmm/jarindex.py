@@ -0,0 +1,273 @@
+"""jarindex.py contains the SQLite index of what the jars in the jar store declare about themselves.
+
+Jars are indexed by reading only their zip central directory and the metadata files of the mod loaders
+(fabric.mod.json, META-INF/mods.toml and META-INF/neoforge.mods.toml), never by unpacking them. Every jar
+is indexed once and again only if the size or mtime of its store object changes, and the profiles that use
+each jar are taken from the store's manifests whenever one of them changes, so keeping the index up to date
+costs one stat per jar and manifest.
+"""
+
+import os, re, sqlite3, zipfile
+from json import load, loads
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple, Union
+
+from .store import JarStore
+
+INDEX_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE jars (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, entries INTEGER NOT NULL, error TEXT);
+CREATE TABLE mods (sha256 TEXT NOT NULL, loader TEXT NOT NULL, mod_id TEXT NOT NULL, name TEXT, version TEXT, minecraft TEXT, loader_version TEXT);
+CREATE INDEX mods_mod_id ON mods (mod_id COLLATE NOCASE);
+CREATE INDEX mods_sha256 ON mods (sha256);
+CREATE TABLE manifests (profile TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);
+CREATE TABLE profile_jars (profile TEXT NOT NULL, file_name TEXT NOT NULL, sha256 TEXT NOT NULL);
+CREATE INDEX profile_jars_sha256 ON profile_jars (sha256);
+CREATE INDEX profile_jars_profile ON profile_jars (profile);
+"""
+
+_FORGE_LOADERS = ("forge", "neoforge")
+
+class IndexedMod(NamedTuple):
+	loader: str
+	mod_id: str
+	name: Union[str, None]
+	version: Union[str, None]
+	minecraft: Union[str, None]
+	loader_version: Union[str, None]
+
+class UpdateResult(NamedTuple):
+	indexed: int
+	removed: int
+	profiles: int
+
+class JarIndex:
+	def __init__(self, path: Path):
+		self.path: Path = path
+		self._db = sqlite3.connect(str(path))
+		self._db.row_factory = sqlite3.Row
+
+		if self._db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+			# The index only holds what can be read from the store again, so an outdated one is simply rebuilt
+			self._db.close()
+			path.unlink()
+			self._db = sqlite3.connect(str(path))
+			self._db.row_factory = sqlite3.Row
+			self._db.executescript(_SCHEMA)
+			self._db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+	def close(self) -> None:
+		self._db.close()
+
+	def update(self, store: JarStore) -> UpdateResult:
+		"""Indexes the jars of store that are new or changed since the last update and the profiles whose manifests changed.
+		"""
+		known = {row["sha256"]: (row["size"], row["mtime_ns"]) for row in self._db.execute("SELECT sha256, size, mtime_ns FROM jars")}
+		indexed = 0
+
+		with self._db:
+			for obj, st in _stat_all(store.objects()):
+				if known.pop(obj.name, None) == (st.st_size, st.st_mtime_ns):
+					continue
+
+				entries, mods, error = read_jar_metadata(obj)
+				self._db.execute("DELETE FROM mods WHERE sha256 = ?", (obj.name,))
+				self._db.execute("INSERT OR REPLACE INTO jars VALUES (?, ?, ?, ?, ?)", (obj.name, st.st_size, st.st_mtime_ns, entries, error))
+				self._db.executemany("INSERT INTO mods VALUES (?, ?, ?, ?, ?, ?, ?)", [(obj.name,) + tuple(mod) for mod in mods])
+				indexed += 1
+
+			# Whatever is left in known was removed from the store
+			self._db.executemany("DELETE FROM jars WHERE sha256 = ?", [(sha256,) for sha256 in known])
+			self._db.executemany("DELETE FROM mods WHERE sha256 = ?", [(sha256,) for sha256 in known])
+
+			self._update_profiles(store)
+
+		profiles = self._db.execute("SELECT COUNT(*) FROM manifests").fetchone()[0]
+		return UpdateResult(indexed, len(known), profiles)
+
+	def _update_profiles(self, store: JarStore) -> None:
+		known = {row["profile"]: (row["size"], row["mtime_ns"]) for row in self._db.execute("SELECT profile, size, mtime_ns FROM manifests")}
+
+		for manifest_file, st in _stat_all(store.manifests_dir.glob("*.json")):
+			profile = manifest_file.name[:-len(".json")]
+			if known.pop(profile, None) == (st.st_size, st.st_mtime_ns):
+				continue
+
+			try:
+				with manifest_file.open("r") as f:
+					jars = load(f)["jars"]
+			except (OSError, ValueError, KeyError):
+				continue
+
+			self._db.execute("DELETE FROM profile_jars WHERE profile = ?", (profile,))
+			self._db.executemany("INSERT INTO profile_jars VALUES (?, ?, ?)", [(profile, jar["file_name"], jar["sha256"]) for jar in jars])
+			self._db.execute("INSERT OR REPLACE INTO manifests VALUES (?, ?, ?)", (profile, st.st_size, st.st_mtime_ns))
+
+		self._db.executemany("DELETE FROM profile_jars WHERE profile = ?", [(profile,) for profile in known])
+		self._db.executemany("DELETE FROM manifests WHERE profile = ?", [(profile,) for profile in known])
+
+	def find_mod(self, mod: str, version: str = None) -> List[Dict]:
+		"""Returns every jar that declares a mod whose id is mod or whose name contains mod (ignoring case),
+		optionally only at version, once for each profile that uses it (profile is None for jars no profile uses anymore).
+		"""
+		query = """
+			SELECT p.profile, p.file_name, m.*
+			FROM mods m LEFT JOIN profile_jars p ON p.sha256 = m.sha256
+			WHERE (m.mod_id = ? COLLATE NOCASE OR m.name LIKE ?)
+		"""
+		params = [mod, f"%{mod}%"]
+		if version is not None:
+			query += " AND m.version = ?"
+			params.append(version)
+
+		return [dict(row) for row in self._db.execute(query + " ORDER BY m.mod_id, p.profile", params)]
+
+	def find_jar(self, jar: str) -> List[Dict]:
+		"""Returns the mods declared by the jars whose file name in some profile contains jar, or whose SHA-256 starts with jar.
+		"""
+		return [dict(row) for row in self._db.execute("""
+			SELECT p.profile, p.file_name, m.*
+			FROM mods m LEFT JOIN profile_jars p ON p.sha256 = m.sha256
+			WHERE m.sha256 IN (SELECT sha256 FROM profile_jars WHERE file_name LIKE ?) OR m.sha256 LIKE ?
+			ORDER BY p.file_name, p.profile, m.mod_id
+		""", (f"%{jar}%", f"{jar.lower()}%"))]
+
+	def counts(self) -> Tuple[int, int]:
+		"""Returns how many jars and how many of their mods are indexed.
+		"""
+		return (self._db.execute("SELECT COUNT(*) FROM jars").fetchone()[0], self._db.execute("SELECT COUNT(*) FROM mods").fetchone()[0])
+
+def _stat_all(files: Iterator[Path]) -> Iterator[Tuple[Path, os.stat_result]]:
+	for file in files:
+		try:
+			yield (file, file.stat())
+		except OSError:
+			continue
+
+def read_jar_metadata(jar: Path) -> Tuple[int, List[IndexedMod], Union[str, None]]:
+	"""Reads the mods that jar declares from its central directory and loader metadata files, without unpacking anything else.
+
+	Returns:
+		Tuple[int, List[IndexedMod], Union[str, None]]: The number of entries in the jar, its mods and an error if it could not be read.
+	"""
+	try:
+		with zipfile.ZipFile(str(jar)) as zf:
+			names = set(zf.namelist())
+			mods = []
+			if "fabric.mod.json" in names:
+				mods += _fabric_mods(loads(zf.read("fabric.mod.json").decode("utf-8-sig"), strict=False))
+			for loader, toml_name in (("forge", "META-INF/mods.toml"), ("neoforge", "META-INF/neoforge.mods.toml")):
+				if toml_name in names:
+					jar_version = _manifest_version(zf) if "META-INF/MANIFEST.MF" in names else None
+					mods += _forge_mods(loader, parse_toml_subset(zf.read(toml_name).decode("utf-8-sig")), jar_version)
+			return (len(names), mods, None)
+	except (OSError, zipfile.BadZipFile, ValueError, KeyError, TypeError, AttributeError) as e:
+		return (0, [], f"{type(e).__name__}: {e}")
+
+def _fabric_mods(obj: Dict) -> List[IndexedMod]:
+	depends = obj.get("depends") or {}
+
+	def requirement(mod_id: str) -> Union[str, None]:
+		value = depends.get(mod_id)
+		if isinstance(value, list):
+			return " || ".join(str(v) for v in value)
+		return str(value) if value is not None else None
+
+	return [IndexedMod("fabric", str(obj["id"]), obj.get("name"), obj.get("version"), requirement("minecraft"), requirement("fabricloader"))]
+
+def _forge_mods(loader: str, obj: Dict, jar_version: Union[str, None]) -> List[IndexedMod]:
+	mods = []
+	for mod in obj.get("mods", []):
+		if not isinstance(mod, dict) or "modId" not in mod:
+			continue
+
+		minecraft = None
+		loader_version = obj.get("loaderVersion")
+		dependencies = obj.get("dependencies", {}).get(mod["modId"], [])
+		for dependency in dependencies if isinstance(dependencies, list) else []:
+			if dependency.get("modId") == "minecraft":
+				minecraft = dependency.get("versionRange")
+			elif dependency.get("modId") in _FORGE_LOADERS:
+				loader_version = dependency.get("versionRange")
+
+		version = mod.get("version")
+		if version == "${file.jarVersion}":
+			version = jar_version
+
+		mods.append(IndexedMod(loader, str(mod["modId"]), mod.get("displayName"), version, minecraft, loader_version))
+	return mods
+
+def _manifest_version(zf: zipfile.ZipFile) -> Union[str, None]:
+	"""Returns the Implementation-Version of a jar's manifest, which Forge substitutes for ${file.jarVersion}.
+	"""
+	for line in zf.read("META-INF/MANIFEST.MF").decode("utf-8", "replace").splitlines():
+		if line.startswith("Implementation-Version:"):
+			return line[len("Implementation-Version:"):].strip()
+	return None
+
+def parse_toml_subset(text: str) -> Dict:
+	"""Parses the subset of TOML that mods.toml files use: tables, arrays of tables and single line keys with
+	string, boolean or number values. Multiline strings (usually descriptions) and arrays are skipped.
+	"""
+	root = {}
+	current = root
+	lines = iter(text.splitlines())
+	for line in lines:
+		line = line.strip()
+		if line == "" or line.startswith("#"):
+			continue
+
+		if line.startswith("["):
+			is_array = line.startswith("[[")
+			path = [part.strip().strip("\"'") for part in line.strip("[]# \t").split("]")[0].split(".")]
+			parent = root
+			for part in path[:-1]:
+				parent = parent.setdefault(part, {})
+				if isinstance(parent, list):
+					parent = parent[-1]
+
+			if is_array:
+				current = {}
+				parent.setdefault(path[-1], []).append(current)
+			else:
+				current = parent.setdefault(path[-1], {})
+			continue
+
+		if "=" not in line:
+			continue
+
+		key, value = (part.strip() for part in line.split("=", 1))
+		key = key.strip("\"'")
+		for quote in ('"""', "'''"):
+			if value.startswith(quote):
+				# Skip to the line that ends the multiline string
+				rest = value[len(quote):]
+				while quote not in rest:
+					rest = next(lines, quote)
+				value = None
+				break
+		if value is None or value.startswith("["):
+			continue
+
+		current[key] = _toml_value(value)
+	return root
+
+_TOML_BASIC_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+def _toml_value(value: str) -> Union[str, bool, int, float]:
+	if value.startswith('"'):
+		match = _TOML_BASIC_STRING.match(value)
+		return loads(match.group(0)) if match else value.strip('"')
+	if value.startswith("'"):
+		return value[1:].split("'", 1)[0]
+
+	value = value.split("#", 1)[0].strip()
+	if value in ("true", "false"):
+		return value == "true"
+	for number in (int, float):
+		try:
+			return number(value)
+		except ValueError:
+			pass
+	return value
@@ -0,0 +1,49 @@
+"""lockfile.py reads and writes profile lock files (profiles/<profile>.lock.json in the config dir).
+
+A lock file pins the exact resolution of every entry of a profile, including the SHA-256 and size of the
+resulting jar, so that `download --locked` can fetch the jars without asking any Mod Provider's API again.
+"""
+
+import hashlib, os
+from json import dump, dumps, load
+from pathlib import Path
+from typing import Dict, List
+from uuid import uuid4
+
+LOCK_VERSION = 1
+
+def lock_path(config_dir: Path, profile: str) -> Path:
+	return config_dir / f"profiles/{profile}.lock.json"
+
+def profile_digest(profile_obj: Dict) -> str:
+	"""Returns a hash of everything in a profile that influences resolution, used to detect outdated lock files.
+	"""
+	relevant = {"minecraft_version": profile_obj.get("minecraft_version"), "mods": profile_obj["mods"]}
+	return hashlib.sha256(dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+def save_lock(path: Path, profile_obj: Dict, mc_version: str, mods: List[Dict]) -> None:
+	"""Writes a lock file.
+
+	Arguments:
+		mods {List[Dict]} -- One {"provider", "metadata", "key", "file_name", "size", "sha256", "resolution"} dict per profile entry
+	"""
+	lock_obj = {
+		"version": LOCK_VERSION,
+		"minecraft_version": mc_version,
+		"profile_digest": profile_digest(profile_obj),
+		"mods": mods,
+	}
+
+	tmp = path.parent / f".{path.name}.{uuid4().hex}.tmp"
+	with tmp.open("w") as f:
+		dump(lock_obj, f, indent=4)
+	os.replace(str(tmp), str(path))
+
+def load_lock(path: Path) -> Dict:
+	with path.open("r") as f:
+		lock_obj = load(f)
+
+	if lock_obj.get("version") != LOCK_VERSION:
+		raise ValueError(f"Unsupported lock file version {lock_obj.get('version')} in {path}")
+
+	return lock_obj
@@ -0,0 +1,159 @@
+"""mirror.py reads and writes mirrors, folders that hold everything needed to download profiles without any Mod Provider.
+
+A mirror contains the jars of its profiles, stored by SHA-256 like in the jar store, and one file per profile with the
+profile itself and the exact resolution of each of its entries (the same entries a lock file has):
+
+	index.json                  -- {"version": 1, "profiles": [profile names]}
+	profiles/<profile>.json     -- {"version": 1, "profile": {...}, "minecraft_version": str, "profile_digest": str, "mods": [...]}
+	objects/<sha256[:2]>/<sha256>
+
+Since nothing in a mirror has to be listed, it can be used straight from disk or from any static HTTP server that serves the folder.
+"""
+
+import os, re
+from json import dump, load
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List
+from uuid import uuid4
+
+from .fetch import FetchResult, copy_to_file, stream_to_file
+from .lockfile import profile_digest
+from .store import JarStore, remove_file
+
+if TYPE_CHECKING:
+	import requests
+
+MIRROR_VERSION = 1
+
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+def object_path(sha256: str) -> str:
+	"""Returns the path of a jar in a mirror, relative to the mirror's root.
+
+	Raises:
+		ValueError: sha256 is not a lowercase hex SHA-256, so it could point outside of objects/.
+	"""
+	if not _SHA256.fullmatch(sha256):
+		raise ValueError(f"Invalid SHA-256 '{sha256}'")
+	return f"objects/{sha256[:2]}/{sha256}"
+
+def check_name(name: str) -> str:
+	"""Returns name (of a profile or jar in a mirror) if it can be used as a file name.
+
+	Names come from the mirror's files and end up in paths and URLs, so a name that could point outside of its folder is refused.
+
+	Raises:
+		ValueError: name is empty or contains a path separator or "..".
+	"""
+	if name == "" or "/" in name or "\\" in name or ".." in name:
+		raise ValueError(f"Invalid name '{name}'")
+	return name
+
+def _write_json(path: Path, obj: Dict) -> None:
+	path.parent.mkdir(parents=True, exist_ok=True)
+	tmp = path.parent / f".{path.name}.{uuid4().hex}.tmp"
+	with tmp.open("w") as f:
+		dump(obj, f, indent=4)
+	os.replace(str(tmp), str(path))
+
+def write_profile(mirror_dir: Path, store: JarStore, profile: str, profile_obj: Dict, mc_version: str, mods: List[Dict]) -> int:
+	"""Adds the jars of mods (lock file entries, all of which must be in store) to the mirror and writes the profile's file.
+
+	Returns:
+		int: How many jars were added to the mirror, the others were already in it.
+	"""
+	added = 0
+	for mod in mods:
+		dest = mirror_dir / object_path(mod["sha256"])
+		if dest.exists():
+			continue
+		dest.parent.mkdir(parents=True, exist_ok=True)
+		store.link(mod["sha256"], dest)
+		added += 1
+
+	_write_json(mirror_dir / f"profiles/{profile}.json", {
+		"version": MIRROR_VERSION,
+		"profile": profile_obj,
+		"minecraft_version": mc_version,
+		"profile_digest": profile_digest(profile_obj),
+		"mods": mods,
+	})
+	return added
+
+def write_index(mirror_dir: Path, store: JarStore = None) -> List[str]:
+	"""Writes the index of the mirror, which lists every profile in it, and removes the jars that no profile uses anymore.
+
+	Jars of the mirror may be hard links of the objects of store (see write_profile), which stay read-only when they are removed.
+
+	Returns:
+		List[str]: The profiles in the mirror.
+	"""
+	profiles = sorted(file.name[:-len(".json")] for file in (mirror_dir / "profiles").glob("*.json"))
+
+	referenced = set()
+	for profile in profiles:
+		with (mirror_dir / f"profiles/{profile}.json").open("r") as f:
+			referenced.update(mod["sha256"] for mod in load(f)["mods"])
+
+	for obj in (mirror_dir / "objects").glob("*/*"):
+		# Temporary files belong to a write_profile that is still running
+		if _SHA256.fullmatch(obj.name) and obj.name not in referenced:
+			remove_file(obj, store)
+
+	_write_json(mirror_dir / "index.json", {"version": MIRROR_VERSION, "profiles": profiles})
+	return profiles
+
+class MirrorSource:
+	"""A mirror to download from, either a folder or the URL of a folder on an HTTP server.
+	"""
+
+	def __init__(self, location: str, session: "requests.Session" = None):
+		self.location: str = location.rstrip("/")
+		self.session = session
+		self.is_url: bool = self.location.startswith(("http://", "https://"))
+
+	def _load(self, path: str) -> Dict:
+		"""Loads a JSON file of the mirror.
+
+		Raises:
+			OSError: The file does not exist in a folder mirror.
+			requests.HTTPError: The file does not exist on an HTTP mirror.
+			ValueError: The file is not valid JSON or was written by an unsupported version of mcmm.
+		"""
+		if self.is_url:
+			r = self.session.get(f"{self.location}/{path}")
+			r.raise_for_status()
+			obj = r.json()
+		else:
+			with (Path(self.location) / path).open("r") as f:
+				obj = load(f)
+
+		if obj.get("version") != MIRROR_VERSION:
+			raise ValueError(f"Unsupported mirror version {obj.get('version')} in {self.location}/{path}")
+
+		return obj
+
+	def profiles(self) -> List[str]:
+		return [check_name(profile) for profile in self._load("index.json")["profiles"]]
+
+	def load_profile(self, profile: str) -> Dict:
+		"""Loads the file of profile, checking the names and hashes of its jars before any of them is used in a path.
+
+		Raises:
+			ValueError: The profile, one of its jars or the file itself is invalid (see _load for the other errors).
+		"""
+		obj = self._load(f"profiles/{check_name(profile)}.json")
+		for mod in obj["mods"]:
+			check_name(mod["file_name"])
+			object_path(mod["sha256"])
+		return obj
+
+	def fetch(self, sha256: str, out_file: Path) -> FetchResult:
+		"""Copies (or downloads) the jar with the given SHA-256 from the mirror to out_file.
+		"""
+		if self.is_url:
+			return stream_to_file(f"{self.location}/{object_path(sha256)}", out_file, session=self.session)
+		return copy_to_file(Path(self.location) / object_path(sha256), out_file)
+
+	def __str__(self) -> str:
+		return self.location
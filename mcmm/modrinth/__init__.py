@@ -1,90 +1,406 @@
 """modrinth is a Mod Provider for Modrinth(modrinth.com).
 """
 
-import platform, requests
-from os import getenv
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
 from requests.models import HTTPError
-from typing import Dict, Tuple
+from typing import Dict, Iterable, List, Tuple, Union
+from urllib.parse import quote, urlencode
 
-from ..plugin import DownloadHandler, GenerationHandler, MCMMPlugin, PluginBase
+from ..plugin import BatchResolveHandler, GenerationHandler, MCMMPlugin, PluginBase, ResolveHandler
+from ..session import DEFAULT_MAX_CONNECTIONS_PER_HOST
 
-current_os = platform.system()
-if current_os == "Windows":
-	save_dir = Path(getenv("LOCALAPPDATA")) / "mcmm/cache/modrinth"
-else:
-	save_dir = Path(getenv("HOME")) / ".cache/mcmm/modrinth"
-save_dir.mkdir(exist_ok=True, parents=True)
+API_URL = "https://api.modrinth.com/v2"
+
+# Ids per bulk request, kept low enough that the query string stays well under common URL length limits.
+BULK_CHUNK_SIZE = 100
+# Projects whose versions are listed at the same time, one per connection that the session keeps to a host.
+LISTING_JOBS = DEFAULT_MAX_CONNECTIONS_PER_HOST
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+	for i in range(0, len(items), size):
+		yield items[i:i + size]
+
+def _required(version: Dict) -> List[Dict]:
+	"""Returns the dependencies of version that must be installed with it. Embedded ones ship inside its jar.
+	"""
+	return [d for d in version.get("dependencies") or [] if d.get("dependency_type") == "required" and (d.get("project_id") or d.get("version_id"))]
+
+def _incompatible_ids(versions: Iterable[Dict]) -> List[str]:
+	"""Returns the project and version ids that any of versions declares itself incompatible with.
+	"""
+	return sorted({
+		d.get("version_id") or d.get("project_id")
+		for version in versions
+		for d in version.get("dependencies") or []
+		if d.get("dependency_type") == "incompatible" and (d.get("version_id") or d.get("project_id"))
+	})
+
+def _dependency_metadata(mod_loader: str, allow_prereleases: bool = True) -> Dict:
+	"""Returns the metadata that dependencies for mod_loader are selected with.
+
+	It does not depend on the entry that needs the dependency, so that every entry needing a mod gets the same entry for it.
+	"""
+	return {
+		"allow_prereleases": allow_prereleases,
+		"mod_loader": mod_loader,
+		"must_contain": [],
+		"must_not_contain": [],
+	}
+
+def _version_label(version: Dict) -> str:
+	return f"{version.get('name') or version['project_id']} {version.get('version_number') or version['id']}"
+
+def _incompatibility(closure: Dict[str, Dict]) -> str:
+	"""Returns an error if a version in closure ({project id: version}) declares another one incompatible, otherwise "".
+	"""
+	chosen_ids = {version["id"]: version for version in closure.values()}
+	for version in closure.values():
+		for dependency in version.get("dependencies") or []:
+			if dependency.get("dependency_type") != "incompatible":
+				continue
+
+			if dependency.get("version_id"):
+				other = chosen_ids.get(dependency["version_id"])
+			else:
+				other = closure.get(dependency.get("project_id"))
+			if other is not None:
+				return f"{_version_label(version)} is incompatible with {_version_label(other)}, but the profile entry needs both."
+	return ""
 
 @MCMMPlugin
 class ModrinthModProvider(PluginBase):
 	id = "modrinth"
 	help_string = "Modrinth Mod Provider"
 
-	@DownloadHandler
-	def download(self, mc_version: str, metadata: Dict) -> Tuple[Path, str]:
-		_id = metadata["id"]
-		allow_prereleases = metadata["allow_prereleases"]
-		mod_loader = metadata["mod_loader"]
-		must_contain = metadata["must_contain"]
-		must_not_contain = metadata["must_not_contain"]
+	@ResolveHandler
+	def resolve(self, mc_version: str, metadata: Dict) -> Tuple[Dict, str]:
+		return self.resolve_batch([{"mc_version": mc_version, "metadata": metadata, "previous": None}])[0]
 
-		r = requests.get(f"https://api.modrinth.com/api/v1/mod/{_id}/version")
+	@BatchResolveHandler
+	def resolve_batch(self, entries: List[Dict]) -> List[Tuple[Dict, str]]:
+		results: List[Union[Tuple[Dict, str], None]] = [None] * len(entries)
+		chosen: Dict[int, Dict] = {}
+
+		# Entries that were downloaded before are looked up by the SHA-1 of their previous jar, which
+		# answers with the newest version of the same project for a whole loader/Minecraft version at once.
 		try:
-			r.raise_for_status()
-		except HTTPError as e:
-			return (Path.cwd(), str(e))
+			for i, version in self._latest_by_hash(entries).items():
+				resolution = self._select_file(version, entries[i]["mc_version"], entries[i]["metadata"])
+				if resolution is not None:
+					results[i] = (resolution, "")
+					chosen[i] = version
+		except HTTPError:
+			# The listings below still resolve everything.
+			pass
 
-		json_obj = r.json()
+		remaining = [i for i, result in enumerate(results) if result is None]
+		if len(remaining) == 0:
+			return self._add_dependencies(entries, results, chosen)
 
-		for file in json_obj:
-			if not allow_prereleases and file["version_type"] != "release":
-				continue
+		queries = {i: (entries[i]["metadata"]["id"], entries[i]["metadata"]["mod_loader"], entries[i]["mc_version"]) for i in remaining}
+		try:
+			matching = self._matching_versions(queries.values())
+		except HTTPError as e:
+			for i in remaining:
+				results[i] = ({}, str(e))
+			return results
 
-			if mod_loader not in file["loaders"]:
+		for i in remaining:
+			if matching[queries[i]] is None:
+				results[i] = ({}, f"Modrinth project '{queries[i][0]}' not found.")
 				continue
 
-			if mc_version not in file["game_versions"]:
+			results[i] = ({}, "Valid file not found.")
+			for version in matching[queries[i]]:
+				resolution = self._select_file(version, entries[i]["mc_version"], entries[i]["metadata"])
+				if resolution is not None:
+					results[i] = (resolution, "")
+					chosen[i] = version
+					break
+
+		return self._add_dependencies(entries, results, chosen)
+
+	def _add_dependencies(self, entries: List[Dict], results: List[Tuple[Dict, str]], chosen: Dict[int, Dict]) -> List[Tuple[Dict, str]]:
+		"""Adds what every chosen version (by entry index) "provides" and is "incompatible" with to its resolution, and for
+		entries whose metadata sets "dependencies" to true, the mods it requires to its "dependencies" (see ResolveHandler).
+
+		An entry whose dependencies can not be resolved fails with the reason, since its jar would not load without them.
+		"""
+		for i, version in chosen.items():
+			results[i][0]["provides"] = [version["project_id"], version["id"]]
+			incompatible = _incompatible_ids([version])
+			if len(incompatible) != 0:
+				results[i][0]["incompatible"] = incompatible
+
+		# Only entries that ask for it, since profiles made before dependencies were resolved list them as entries of their own,
+		# often from other providers, and the loaders refuse to start with two copies of a mod.
+		roots = [i for i in sorted(chosen) if entries[i]["metadata"].get("dependencies", False)]
+		if len(roots) == 0:
+			return results
+
+		try:
+			closures = self._resolve_dependencies([(chosen[i], entries[i]["mc_version"], entries[i]["metadata"]) for i in roots])
+		except HTTPError as e:
+			for i in roots:
+				results[i] = ({}, f"Could not resolve the dependencies of {_version_label(chosen[i])}: {e}")
+			return results
+
+		for i, (dependencies, incompatible, err_str) in zip(roots, closures):
+			if err_str != "":
+				results[i] = ({}, err_str)
 				continue
 
-			for f in file["files"]:
-				filename = f["filename"]
+			if len(dependencies) != 0:
+				results[i][0]["dependencies"] = dependencies
+			if len(incompatible) != 0:
+				results[i][0]["incompatible"] = incompatible
 
-				invalid = False
-				for s in must_contain:
-					if s not in filename:
-						invalid = True
-						break
-				if invalid:
-					continue
+		return results
+
+	def _resolve_dependencies(self, roots: List[Tuple[Dict, str, Dict]]) -> List[Tuple[List[Dict], List[str], str]]:
+		"""Returns the transitive closure of the required dependencies of every root (a chosen version, its Minecraft version and its entry's metadata).
+
+		The graph is walked one level at a time for all roots at once, so each level takes one bulk request per
+		endpoint (and a listing of the matching versions of each project that no pinned version satisfies),
+		and every project is looked up and every version chosen only once. A dependency pinned to a
+		version uses that version if it fits the Minecraft version and loader, any other dependency uses the
+		newest release of its project that does, or its newest prerelease if it has no such release. That choice
+		is the same for every root with the same Minecraft version and loader, whatever the root's own metadata
+		allows, so that entries sharing a dependency agree on its version. Projects that are already in a closure (shared dependencies
+		and cycles) are not visited again. The closure fails if two of its mods pin different versions of a
+		project or if one of its mods declares another one incompatible.
+
+		Returns:
+			List[Tuple[List[Dict], List[str], str]]: Per root, one profile entry per dependency (with its "resolution"
+			and the project id, slug and version id it "provides"), the project and version ids that the mods of the
+			closure are incompatible with and an error string.
+		"""
+		projects: Dict[str, Dict] = {} # {project id or slug: project}, None for unknown projects
+		project_versions: Dict[Tuple[str, str, str], List[Dict]] = {} # See _matching_versions
+		versions: Dict[str, Dict] = {} # {version id: version}, None for unknown versions
+		selected: Dict[Tuple, Union[Tuple[Dict, Dict], None]] = {} # {(project id, Minecraft version, loader): (version, resolution)}
+
+		states = []
+		for version, mc_version, metadata in roots:
+			states.append({
+				"mc_version": mc_version,
+				"metadata": metadata,
+				"closure": {version["project_id"]: version},
+				"dependencies": [],
+				"pending": [(version, dependency) for dependency in _required(version)],
+				"err": "",
+			})
+
+		while any(len(state["pending"]) != 0 for state in states):
+			pending = [dependency for state in states for _, dependency in state["pending"]]
 
-				for s in must_not_contain:
-					if s in filename:
-						invalid = True
+			missing_versions = sorted({d["version_id"] for d in pending if d.get("version_id") and d["version_id"] not in versions})
+			for chunk in _chunks(missing_versions, BULK_CHUNK_SIZE):
+				r = self.session.get_cached(f"{API_URL}/versions?{urlencode({'ids': dumps(chunk)})}")
+				r.raise_for_status()
+				for version in r.json():
+					versions[version["id"]] = version
+			for version_id in missing_versions:
+				versions.setdefault(version_id, None)
+
+			missing_projects = sorted({
+				project_id for project_id in (d.get("project_id") or (versions.get(d.get("version_id")) or {}).get("project_id") for d in pending)
+				if project_id is not None and project_id not in projects
+			})
+			if len(missing_projects) != 0:
+				found = self._projects(missing_projects)
+				for project_id in missing_projects:
+					projects[project_id] = found.get(project_id)
+
+			queries = set()
+			for state in states:
+				for _, dependency in state["pending"]:
+					pinned = versions.get(dependency.get("version_id")) if dependency.get("version_id") else None
+					project = projects.get(dependency.get("project_id") or (pinned or {}).get("project_id"))
+					if project is None or project["id"] in state["closure"]:
+						continue
+					if pinned is not None and self._select_file(pinned, state["mc_version"], _dependency_metadata(state["metadata"]["mod_loader"])) is not None:
+						continue
+					query = (project["id"], state["metadata"]["mod_loader"], state["mc_version"])
+					if query not in project_versions:
+						queries.add(query)
+			project_versions.update(self._matching_versions(queries))
+
+			for state in states:
+				work, state["pending"] = state["pending"], []
+				for parent, dependency in work:
+					if state["err"] == "":
+						state["err"] = self._visit_dependency(state, parent, dependency, projects, project_versions, versions, selected)
+
+		results = []
+		for state in states:
+			err_str = state["err"] or _incompatibility(state["closure"])
+			if err_str != "":
+				results.append(([], [], err_str))
+			else:
+				results.append((state["dependencies"], _incompatible_ids(state["closure"].values()), ""))
+		return results
+
+	def _visit_dependency(self, state: Dict, parent: Dict, dependency: Dict, projects: Dict, project_versions: Dict, versions: Dict, selected: Dict) -> str:
+		"""Adds dependency (of the version parent) to the closure of state, unless its project already is in it.
+
+		Returns:
+			str: An error if the dependency can not be satisfied, otherwise "".
+		"""
+		mod_loader = state["metadata"]["mod_loader"]
+		mc_version = state["mc_version"]
+
+		pinned = versions.get(dependency.get("version_id")) if dependency.get("version_id") else None
+		project_id = dependency.get("project_id") or (pinned or {}).get("project_id")
+		if project_id is None:
+			return f"{_version_label(parent)} depends on Modrinth version '{dependency['version_id']}', which does not exist."
+
+		project = projects.get(project_id)
+		if project is None:
+			return f"{_version_label(parent)} depends on Modrinth project '{project_id}', which does not exist."
+		project_id = project["id"]
+
+		# A pinned version is what its parent was made for, so it is used even if it is a prerelease
+		pinned_resolution = self._select_file(pinned, mc_version, _dependency_metadata(mod_loader)) if pinned is not None else None
+
+		if project_id in state["closure"]:
+			existing = state["closure"][project_id]
+			if pinned_resolution is not None and pinned["id"] != existing["id"]:
+				return f"{_version_label(parent)} requires {_version_label(pinned)}, but {_version_label(existing)} is already required by another mod."
+			return ""
+
+		if pinned_resolution is not None:
+			version, resolution = pinned, pinned_resolution
+		else:
+			key = (project_id, mc_version, mod_loader)
+			if key not in selected:
+				selected[key] = None
+				for allow_prereleases in (False, True):
+					for candidate in project_versions.get((project_id, mod_loader, mc_version)) or []:
+						candidate_resolution = self._select_file(candidate, mc_version, _dependency_metadata(mod_loader, allow_prereleases))
+						if candidate_resolution is not None:
+							selected[key] = (candidate, candidate_resolution)
+							break
+					if selected[key] is not None:
 						break
-				if invalid:
-					continue
 
-				r = requests.get(f["url"])
-				try:
-					r.raise_for_status()
-				except HTTPError as e:
-					return (Path.cwd(), str(e))
+			if selected[key] is None:
+				return f"{_version_label(parent)} requires Modrinth project '{project['slug']}', which has no version for Minecraft {mc_version} and {mod_loader}."
+			version, resolution = selected[key]
+
+		state["closure"][project_id] = version
+		state["dependencies"].append({
+			"provider": self.id,
+			# The dependencies of a dependency are part of the same closure already
+			"metadata": dict(_dependency_metadata(mod_loader, version["version_type"] != "release"), id=project_id, dependencies=False),
+			"provides": [project_id, project["slug"], version["id"]],
+			"resolution": dict(resolution),
+		})
+		state["pending"] += [(version, d) for d in _required(version)]
+		return ""
+
+	def _latest_by_hash(self, entries: List[Dict]) -> Dict[int, Dict]:
+		"""Returns the newest version of each previously resolved entry (by index), as reported by /version_files/update.
+		"""
+		groups = {}
+		for i, entry in enumerate(entries):
+			previous = entry["previous"] or {}
+			sha1 = previous.get("hashes", {}).get("sha1")
+			if sha1 is None:
+				continue
+			groups.setdefault((entry["metadata"]["mod_loader"], entry["mc_version"]), []).append((i, sha1))
+
+		latest = {}
+		for (mod_loader, mc_version), group in groups.items():
+			for chunk in _chunks(group, BULK_CHUNK_SIZE):
+				r = self.session.post_cached(f"{API_URL}/version_files/update", {
+					"hashes": [sha1 for _, sha1 in chunk],
+					"algorithm": "sha1",
+					"loaders": [mod_loader],
+					"game_versions": [mc_version],
+				})
+				r.raise_for_status()
+				versions = r.json()
 
-				out_file: Path = save_dir / filename
+				for i, sha1 in chunk:
+					if sha1 in versions:
+						latest[i] = versions[sha1]
 
-				with out_file.open("wb") as f:
-					f.write(r.content)
+		return latest
+
+	def _projects(self, ids: List[str]) -> Dict[str, Dict]:
+		"""Returns every project in ids (slugs or project ids) that exists, by both its id and its slug.
+		"""
+		projects = {}
+		for chunk in _chunks(sorted(set(ids)), BULK_CHUNK_SIZE):
+			r = self.session.get_cached(f"{API_URL}/projects?{urlencode({'ids': dumps(chunk)})}")
+			r.raise_for_status()
+			for project in r.json():
+				projects[project["id"]] = project
+				projects[project["slug"]] = project
+		return projects
+
+	def _matching_versions(self, queries: Iterable[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], Union[List[Dict], None]]:
+		"""Returns the versions of every (project id or slug, mod loader, Minecraft version) in queries that are for
+		that mod loader and Minecraft version, newest first, or None for projects that do not exist.
+
+		Modrinth filters the versions itself, so the versions for other loaders and Minecraft versions, which make
+		up most of a long lived project's history, are never transferred. No bulk endpoint filters versions, so
+		up to LISTING_JOBS projects are listed at the same time instead.
+		"""
+		queries = sorted(set(queries))
+		if len(queries) == 0:
+			return {}
+
+		def listing(query: Tuple[str, str, str]) -> Union[List[Dict], None]:
+			_id, mod_loader, mc_version = query
+			r = self.session.get_cached(f"{API_URL}/project/{quote(_id, safe='')}/version?{urlencode({'loaders': dumps([mod_loader]), 'game_versions': dumps([mc_version])})}")
+			if r.status_code == 404:
+				return None
+			r.raise_for_status()
+			return sorted(r.json(), key=lambda version: version["date_published"], reverse=True)
+
+		with ThreadPoolExecutor(max_workers=min(LISTING_JOBS, len(queries))) as executor:
+			return dict(zip(queries, executor.map(listing, queries)))
+
+	def _select_file(self, version: Dict, mc_version: str, metadata: Dict) -> Union[Dict, None]:
+		"""Returns the resolution of the first file of version that matches metadata, or None if there is none.
+		"""
+		if not metadata["allow_prereleases"] and version["version_type"] != "release":
+			return None
+
+		if metadata["mod_loader"] not in version["loaders"]:
+			return None
+
+		if mc_version not in version["game_versions"]:
+			return None
+
+		for f in version["files"]:
+			filename = f["filename"]
+
+			if any(s not in filename for s in metadata["must_contain"]):
+				continue
+
+			if any(s in filename for s in metadata["must_not_contain"]):
+				continue
 
-				return (out_file, "")
+			return {
+				"file_name": filename,
+				"url": f["url"],
+				"version_id": version["id"],
+				"size": f.get("size"),
+				"hashes": f.get("hashes", {}),
+			}
 
-		return (Path.cwd(), "Valid file not found.")
+		return None
 
 	@GenerationHandler
 	def generate(self) -> Tuple[Dict, str]:
 		_id = input("Mod ID: ")
 		allow_prereleases = input("Allow Pre-Releases (y/n): ").lower() == "y"
 		mod_loader = input("Mod Loader (ex. 'fabric' or 'forge'): ").lower()
+		dependencies = input("Also download the mods it requires (Y/n): ").lower() != "n"
 
 		must_contain = []
 		while True:
@@ -105,5 +421,6 @@ class ModrinthModProvider(PluginBase):
 			"allow_prereleases": allow_prereleases,
 			"mod_loader": mod_loader,
 			"must_contain": must_contain,
-			"must_not_contain": must_not_contain
+			"must_not_contain": must_not_contain,
+			"dependencies": dependencies,
 		}, "")
@@ -1,34 +1,34 @@
 """optifine is a Mod Provider for Optifine(optifine.net).
 """
 
-import os, platform, requests
+import os, platform
 from bs4 import BeautifulSoup as BS
 from pathlib import Path
 from requests.models import HTTPError
 from typing import Dict, Tuple
 
-from ..plugin import DownloadHandler, GenerationHandler, MCMMPlugin, PluginBase
+from ..fetch import stream_to_file
+from ..plugin import FetchHandler, GenerationHandler, MCMMPlugin, PluginBase, ResolveHandler
 
 if platform.system() == "Windows":
 	cache_dir = Path(f"{os.getenv('LOCALAPPDATA')}/mcmm/cache/optifine")
 else:
 	cache_dir = Path(f"{os.getenv('HOME')}/.cache/mcmm/optifine")
-cache_dir.mkdir(exist_ok=True, parents=True)
 
 @MCMMPlugin
 class OptifineModProvider(PluginBase):
 	id = "optifine"
 	help_string = "Optifine Mod Provider"
 
-	@DownloadHandler
-	def download_mod(self, mc_version, info) -> Tuple[Path, str]:
+	@ResolveHandler
+	def resolve(self, mc_version, info) -> Tuple[Dict, str]:
 		prerel_allowed = info["allow_prerelease"] if "allow_prerelease" in info else False
 
-		r = requests.get("https://optifine.net/downloads")
+		r = self.session.get_cached("https://optifine.net/downloads")
 		try:
 			r.raise_for_status()
 		except HTTPError as e:
-			return Path.cwd(), str(e)
+			return {}, str(e)
 
 		downloads_page = BS(r.text, "html.parser")
 
@@ -37,7 +37,17 @@ class OptifineModProvider(PluginBase):
 
 		file_download_page_url = downloads_page.find_all(check_bs4_tag_wrapper)[1].attrs["href"]
 
-		r = requests.get(file_download_page_url)
+		# The mirror page URL names the exact OptiFine release, while the final download link on it contains a
+		# short-lived key. The mirror page is therefore used as the resolution's URL and scraped in fetch.
+		return ({
+			"file_name": "optifine.jar",
+			"url": file_download_page_url,
+			"version_id": file_download_page_url,
+		}, "")
+
+	@FetchHandler
+	def fetch(self, resolution: Dict, out_file: Path) -> Tuple[Path, str]:
+		r = self.session.get(resolution["url"])
 		try:
 			r.raise_for_status()
 		except HTTPError as e:
@@ -47,19 +57,11 @@ class OptifineModProvider(PluginBase):
 
 		file_download_url = f"https://optifine.net/{file_download_page.find(lambda tag: tag.has_attr('href') and 'downloadx' in tag['href'])['href']}"
 
-		r = requests.get(file_download_url)
 		try:
-			r.raise_for_status()
+			out_file = stream_to_file(file_download_url, out_file, session=self.session).path
 		except HTTPError as e:
 			return Path.cwd(), str(e)
 
-		out_file = cache_dir / "optifine.jar"
-
-		out_file.parent.mkdir(parents=True, exist_ok=True)
-
-		with out_file.open("wb") as f:
-			f.write(r.content)
-
 		# OptiFine with OptiFabric seems to work, but it might not when using Forge.
 		# https://github.com/sp614x/optifine/issues/5323 explains how to command-line extract the mod jar.
 
@@ -1,6 +1,14 @@
+import inspect
 from abc import ABC, abstractmethod
 
 class PluginBase(ABC):
+	# The pooled requests.Session owned by ProviderRunner. The runner assigns it to every provider instance it creates,
+	# so providers should make their HTTP requests through self.session instead of the module-level requests functions.
+	session = None
+	# Command line options that providers may honor (for example "build_jobs"). Like session, the runner assigns its
+	# own options dict to every provider instance it creates, so options set on the runner are seen by every provider.
+	options = None
+
 	@property
 	@abstractmethod
 	def id(self):
@@ -25,8 +33,81 @@ def GenerationHandler(func):
 	func._mcmm_event = HandlerType.generate
 	return func
 
+def ResolveHandler(func):
+	"""Marks func(self, mc_version, metadata) -> Tuple[Dict, str] as the provider's resolve handler.
+
+	Resolving determines which file a profile entry should download without downloading it. The returned
+	resolution dict must be JSON serializable and must contain "file_name", "url" and "version_id", and
+	may contain "size" and "hashes" ({algorithm: hex digest}). "file_name" may be None if the name is only
+	known after fetching and "url" may be None if the provider has a fetch handler. Any other keys the
+	provider's fetch handler needs can be added too. If nothing in the resolution changes between two
+	downloads, the jar that was downloaded last time is reused.
+
+	A resolution may also list the mods the entry needs in "dependencies": one profile entry per mod
+	({"provider", "metadata"}) with its own "resolution" and the ids it "provides", so that profile entries
+	with one of those ids replace it. They are downloaded alongside the entry. "provides" and "incompatible"
+	list the ids (of the same provider) that the entry itself is known under and that the entry or its
+	dependencies can not be installed with, so that conflicting entries of a profile fail. All three keys are
+	removed from the resolution before it is used.
+	"""
+	func._is_mcmm_handler = True
+	func._mcmm_event = HandlerType.resolve
+	return func
+
+def BatchResolveHandler(func):
+	"""Marks func(self, entries) -> List[Tuple[Dict, str]] as the provider's batch resolve handler.
+
+	When a whole profile is resolved, a provider with a batch resolve handler receives all of its entries
+	in a single call instead of one resolve handler call per entry, so that it can use bulk API endpoints.
+	Each entry is a dict with the keys "mc_version", "metadata" and "previous" (the resolution from the
+	previous download, or None). One (resolution, error string) tuple must be returned per entry, in order.
+	A provider with a batch resolve handler should still provide a resolve handler for single entries.
+	"""
+	func._is_mcmm_handler = True
+	func._mcmm_event = HandlerType.batch_resolve
+	return func
+
+def FetchHandler(func):
+	"""Marks func(self, resolution, out_file) -> Tuple[Path, str] as the provider's fetch handler.
+
+	Providers with a resolve handler only need a fetch handler if the resolved file can not simply be
+	downloaded from resolution["url"]. out_file is a path on the jar store's filesystem that no other
+	resolution uses, which the handler should write the file to (and return) instead of a fixed path of its
+	own, so that downloads running at the same time never overwrite each other's files. Handlers that only
+	take resolution are still supported.
+	"""
+	func._is_mcmm_handler = True
+	func._mcmm_event = HandlerType.fetch
+	return func
+
+def _async_variant(handler_decorator, name: str):
+	def decorator(func):
+		if not inspect.iscoroutinefunction(func):
+			raise TypeError(f"@{name} can only decorate coroutine functions ('async def'), but '{func.__name__}' is not one")
+		return handler_decorator(func)
+
+	decorator.__name__ = name
+	decorator.__doc__ = f"""Same as @{handler_decorator.__name__}, but for a coroutine function.
+
+	ProviderRunner awaits the handler on its event loop, so the handlers of many profile entries can wait on the
+	network at the same time without a thread each. The handler must not block, or it stalls every other async handler.
+
+	The internal providers do not use these: they make their requests through the runner's ProviderSession, whose
+	response cache, rate limits, retries and API tokens are not available to an async HTTP client, so they stay
+	synchronous and run on executor threads (Modrinth resolves a whole profile in a few bulk requests instead).
+	"""
+	return decorator
+
+AsyncDownloadHandler = _async_variant(DownloadHandler, "AsyncDownloadHandler")
+AsyncResolveHandler = _async_variant(ResolveHandler, "AsyncResolveHandler")
+AsyncBatchResolveHandler = _async_variant(BatchResolveHandler, "AsyncBatchResolveHandler")
+AsyncFetchHandler = _async_variant(FetchHandler, "AsyncFetchHandler")
+
 class HandlerType:
 	download = "download"
 	generate = "generate"
+	resolve = "resolve"
+	batch_resolve = "batch_resolve"
+	fetch = "fetch"
 
-	_all_types = ["download", "generate"]
+	_all_types = ["download", "generate", "resolve", "batch_resolve", "fetch"]
@@ -1,34 +1,268 @@
-import inspect
+import asyncio, inspect, os, threading, time
 from colorama import Fore
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from requests.models import HTTPError
 from importlib import import_module
+from json import dump, load
 from pathlib import Path
 from types import ModuleType
 from typing import Dict, List, Tuple, Union
+from uuid import uuid4
 
+from .dirs import gen_cache_dir
+from .fetch import FetchResult, hash_file, stream_to_file
 from .plugin import HandlerType
+from .session import ProviderSession
+from .stats import RunStats, mod_label
+
+REGISTRY_VERSION = 2
 
 class ProviderRunner:
-	def __init__(self, providers: Dict, event_registry: Dict):
-		self._providers: Dict = providers
+	def __init__(self, registry: Dict, event_registry: Dict, session: ProviderSession, options: Dict = None):
+		self._registry: Dict = registry # {"provider id": {"module": module name or module, "class": class name, "handlers": {"event": function name}}}
+		self._providers: Dict = {} # {"provider id": {"instance": provider instance, "event": handler function}}, filled in as providers are used
+		self._providers_lock = threading.Lock()
 		self._event_registry: Dict = event_registry
+		self.session: ProviderSession = session
+		self.options: Dict = options if options is not None else {}
+		# Per-phase and per-mod timings of every handler call, for the --stats report
+		self.stats = RunStats()
+		# The event loop that drives async handlers. It runs on its own thread, which is only started once an async handler is used.
+		self._loop: Union[asyncio.AbstractEventLoop, None] = None
+		self._loop_thread: Union[threading.Thread, None] = None
+		self._loop_lock = threading.Lock()
+
+	def _event_loop(self) -> asyncio.AbstractEventLoop:
+		with self._loop_lock:
+			if self._loop is None:
+				self._loop = asyncio.new_event_loop()
+				self._loop_thread = threading.Thread(target=self._loop.run_forever, name="mcmm-provider-loop", daemon=True)
+				self._loop_thread.start()
+			return self._loop
+
+	def _call(self, handler, *args):
+		"""Calls a handler from synchronous code, running it on the runner's event loop if it is a coroutine function.
+		"""
+		if inspect.iscoroutinefunction(handler):
+			return asyncio.run_coroutine_threadsafe(handler(*args), self._event_loop()).result()
+		return handler(*args)
+
+	def _network_seconds(self) -> float:
+		http_stats = getattr(self.session, "http_stats", None)
+		return http_stats.network_seconds() if http_stats is not None else 0.0
+
+	def _call_timed(self, handler, *args) -> Tuple[object, float, float]:
+		"""Calls a handler like _call and returns its result, how long it took and how much of that was spent on requests made from this thread.
+
+		Async handlers make their requests on the event loop's thread, so their network time is not told apart.
+		"""
+		network_start = self._network_seconds()
+		start = time.perf_counter()
+		result = self._call(handler, *args)
+		return (result, time.perf_counter() - start, self._network_seconds() - network_start)
+
+	def _provider(self, provider_id: str) -> Dict:
+		"""Returns the instance and handlers of a provider, importing its module the first time it is used.
+
+		Raises:
+			KeyError: provider_id is not a known provider.
+		"""
+		with self._providers_lock:
+			if provider_id in self._providers:
+				return self._providers[provider_id]
+
+			entry = self._registry[provider_id]
+			module = entry["module"] if inspect.ismodule(entry["module"]) else import_module(entry["module"])
+			provider_class = getattr(module, entry["class"])
+
+			provider_instance = provider_class()
+			provider_instance.session = self.session
+			provider_instance.options = self.options
+
+			provider = {"instance": provider_instance}
+			for event, func_name in entry["handlers"].items():
+				provider[event] = getattr(provider_class, func_name)
+
+			self._providers[provider_id] = provider
+			return provider
 
 	def download(self, provider_id: str, mc_version: str, metadata: Dict) -> Tuple[Path, str]:
 		try:
-			provider = self._providers[provider_id]
+			provider = self._provider(provider_id)
 		except KeyError:
 			return (Path.cwd(), f"[ERROR] Could not locate mod provider with id '{provider_id}'")
 
 		try:
 			handler = provider["download"]
 		except KeyError:
-			return (Path.cwd(), f"[ERROR] Mod provider '{provider_id}' does not provide a download handler.")
+			if "resolve" not in provider:
+				return (Path.cwd(), f"[ERROR] Mod provider '{provider_id}' does not provide a download handler.")
+
+			# Providers that were split into resolve and fetch handlers can still be used like a download handler.
+			resolution, err_str = self.resolve(provider_id, mc_version, metadata)
+			if err_str != "":
+				return (Path.cwd(), err_str)
+
+			result, err_str = self.fetch(provider_id, resolution)
+			if err_str != "":
+				return (Path.cwd(), err_str)
+			return (result.path, "")
+
+		# Since the handler is supposed to be a method, we need to provide the class instance as the self parameter.
+		(file_location, err_str), seconds, network_seconds = self._call_timed(handler, provider["instance"], mc_version, metadata)
+
+		mod = mod_label(provider_id, metadata)
+		self.stats.record("transfer", network_seconds, mod, provider_id)
+		self.stats.record("download", seconds - network_seconds, mod, provider_id, size=file_location.stat().st_size if err_str == "" else 0)
+		return (file_location, err_str)
+
+	def can_resolve(self, provider_id: str) -> bool:
+		"""Returns whether the provider has a resolve handler. Providers without one can only be used through download.
+		"""
+		return provider_id in self._registry and "resolve" in self._registry[provider_id]["handlers"]
+
+	def resolve(self, provider_id: str, mc_version: str, metadata: Dict) -> Tuple[Dict, str]:
+		try:
+			provider = self._provider(provider_id)
+		except KeyError:
+			return ({}, f"[ERROR] Could not locate mod provider with id '{provider_id}'")
+
+		try:
+			handler = provider["resolve"]
+		except KeyError:
+			return ({}, f"[ERROR] Mod provider '{provider_id}' does not provide a resolve handler.")
 
 		# Since the handler is supposed to be a method, we need to provide the class instance as the self parameter.
-		return handler(provider["instance"], mc_version, metadata)
+		(resolution, err_str), seconds, _ = self._call_timed(handler, provider["instance"], mc_version, metadata)
+		self.stats.record("resolve", seconds, mod_label(provider_id, metadata, resolution), provider_id)
+		return (resolution, err_str)
+
+	def resolve_many(self, entries: List[Tuple[str, str, Dict, Union[Dict, None]]], jobs: int = 1) -> List[Tuple[Dict, Union[str, Exception]]]:
+		"""Resolves many profile entries at once.
+
+		Providers with a batch resolve handler receive all of their entries in a single call, the entries of
+		every other provider are resolved one at a time. All handler calls are scheduled on the runner's event
+		loop: async handlers overlap on the loop itself, synchronous ones (like those of every internal provider)
+		run on up to jobs executor threads.
+		The time of a batch is split evenly between its entries in the runner's stats.
+
+		Arguments:
+			entries {List[Tuple[str, str, Dict, Union[Dict, None]]]} -- (provider id, Minecraft version, metadata, previous resolution) per entry
+			jobs {int} -- Maximum number of synchronous handlers to run at the same time
+
+		Returns:
+			List[Tuple[Dict, Union[str, Exception]]]: One (resolution, error) tuple per entry, in order.
+		"""
+		results = [({}, "")] * len(entries)
+		batches = {}
+		singles = []
+		for i, (provider_id, _, _, _) in enumerate(entries):
+			if "batch_resolve" in self._registry.get(provider_id, {}).get("handlers", {}):
+				batches.setdefault(provider_id, []).append(i)
+			else:
+				singles.append(i)
+
+		if len(entries) == 0:
+			return results
+
+		with ThreadPoolExecutor(max_workers=jobs) as executor:
+			async def run(handler, *args):
+				if inspect.iscoroutinefunction(handler):
+					return await handler(*args)
+				return await asyncio.get_event_loop().run_in_executor(executor, partial(handler, *args))
+
+			async def resolve_single(i: int) -> None:
+				provider_id, mc_version, metadata, _ = entries[i]
+				try:
+					provider = self._provider(provider_id)
+				except KeyError:
+					results[i] = ({}, f"[ERROR] Could not locate mod provider with id '{provider_id}'")
+					return
+
+				if "resolve" not in provider:
+					results[i] = ({}, f"[ERROR] Mod provider '{provider_id}' does not provide a resolve handler.")
+					return
+
+				start = time.perf_counter()
+				try:
+					results[i] = await run(provider["resolve"], provider["instance"], mc_version, metadata)
+				except Exception as e:
+					results[i] = ({}, e)
+				self.stats.record("resolve", time.perf_counter() - start, mod_label(provider_id, metadata, results[i][0]), provider_id)
+
+			async def resolve_batch(provider_id: str) -> None:
+				indices = batches[provider_id]
+				batch = [{"mc_version": entries[i][1], "metadata": entries[i][2], "previous": entries[i][3]} for i in indices]
+				start = time.perf_counter()
+				try:
+					provider = self._provider(provider_id)
+					batch_results = await run(provider["batch_resolve"], provider["instance"], batch)
+				except Exception as e:
+					batch_results = [({}, e)] * len(indices)
+				if not isinstance(batch_results, list) or len(batch_results) != len(indices):
+					# Which result belongs to which entry is unknown, so none of them can be used
+					err_str = f"[ERROR] Mod provider '{provider_id}' returned {len(batch_results) if isinstance(batch_results, list) else 'no list of'} results for {len(indices)} entries."
+					batch_results = [({}, err_str)] * len(indices)
+				seconds = (time.perf_counter() - start) / len(indices)
+
+				for i, result in zip(indices, batch_results):
+					results[i] = result
+					self.stats.record("resolve", seconds, mod_label(provider_id, entries[i][2], result[0]), provider_id)
+
+			async def resolve_all() -> None:
+				await asyncio.gather(
+					*[resolve_batch(provider_id) for provider_id in batches],
+					*[resolve_single(i) for i in singles],
+				)
+
+			asyncio.run_coroutine_threadsafe(resolve_all(), self._event_loop()).result()
+
+		return results
+
+	def fetch(self, provider_id: str, resolution: Dict, out_file: Path = None) -> Tuple[Union[FetchResult, None], str]:
+		"""Fetches the file described by resolution, using the provider's fetch handler if it has one.
+
+		Providers without a fetch handler have the file streamed from resolution["url"] to out_file
+		(default: resolution["file_name"] in the downloads folder of the mcmm cache dir).
+
+		The time spent on requests is recorded as the mod's "transfer" phase, everything else (like scraping a
+		download page or building a jar) as its "fetch" phase.
+		"""
+		try:
+			provider = self._provider(provider_id)
+		except KeyError:
+			return (None, f"[ERROR] Could not locate mod provider with id '{provider_id}'")
+
+		(result, err_str), seconds, network_seconds = self._call_timed(self._fetch, provider, resolution, out_file)
+
+		mod = mod_label(provider_id, resolution=resolution)
+		self.stats.record("transfer", network_seconds, mod, provider_id, size=result.size if result is not None else 0)
+		self.stats.record("fetch", seconds - network_seconds, mod, provider_id)
+		return (result, err_str)
+
+	def _fetch(self, provider: Dict, resolution: Dict, out_file: Union[Path, None]) -> Tuple[Union[FetchResult, None], str]:
+		if "fetch" in provider:
+			if out_file is None:
+				out_file = gen_cache_dir() / "downloads" / f"{uuid4().hex}-{resolution['file_name'] or 'mod.jar'}"
+
+			args = (resolution, out_file) if _takes_out_file(provider["fetch"]) else (resolution,)
+			file_location, err_str = self._call(provider["fetch"], provider["instance"], *args)
+			if err_str != "":
+				return (None, err_str)
+			return (FetchResult(file_location, file_location.stat().st_size, "sha256", hash_file(file_location, "sha256")), "")
+
+		if out_file is None:
+			out_file = gen_cache_dir() / "downloads" / resolution["file_name"]
+
+		try:
+			return (stream_to_file(resolution["url"], out_file, session=self.session), "")
+		except HTTPError as e:
+			return (None, str(e))
 
 	def generate(self, provider_id: str) -> Tuple[Dict, str]:
 		try:
-			provider = self._providers[provider_id]
+			provider = self._provider(provider_id)
 		except KeyError:
 			return ({}, f"[ERROR] Could not locate mod provider with id '{provider_id}'")
 
@@ -38,19 +272,53 @@ class ProviderRunner:
 			return ({}, f"[ERROR] Mod provider '{provider_id}' does not provide a generation handler.")
 
 		# Since the handler is supposed to be a method, we need to provide the class instance as the self parameter.
-		return handler(provider["instance"])
+		return self._call(handler, provider["instance"])
+
+	def close(self) -> None:
+		with self._loop_lock:
+			if self._loop is not None:
+				self._loop.call_soon_threadsafe(self._loop.stop)
+				self._loop_thread.join()
+				self._loop.close()
+				self._loop = None
+
+		self.session.close()
 
 	def __str__(self) -> str:
-		return f"Providers: {self._providers}; Event Registry: {self._event_registry};"
+		return f"Providers: {self._registry}; Event Registry: {self._event_registry};"
 
-def load_providers(providers: List[Union[str, ModuleType]]) -> ProviderRunner:
+def _takes_out_file(handler) -> bool:
+	"""Returns whether a fetch handler takes out_file, which fetch handlers written before it was added do not.
+	"""
+	try:
+		parameters = inspect.signature(handler).parameters.values()
+	except (TypeError, ValueError):
+		return False
+
+	positional = [p for p in parameters if p.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+	return len(positional) >= 3 or any(p.kind == inspect.Parameter.VAR_POSITIONAL for p in parameters)
+
+def load_providers(providers: List[Union[str, ModuleType]], session: ProviderSession = None, registry_file: Path = None) -> ProviderRunner:
 	"""Loads providers to be used by the MCMM plugin engine
-	
+
+	Provider modules are not imported here. The providers and handlers of each module are read from a registry
+	manifest, which is only rebuilt for modules that changed since it was written, and a module is imported
+	once one of its providers is actually used.
+
 	Arguments:
 		providers {List[str]} -- List of providers to load
+		session {ProviderSession} -- HTTP session shared by all providers (default: a new ProviderSession)
+		registry_file {Path} -- Registry manifest to use (default: providers.json in the mcmm cache dir)
 	"""
-	
-	return_providers = {} # {"provider id": {"instance": provider_class, "misc metadata (listeners, configs, requirements, etc.)": "the data"}}
+	if session is None:
+		session = ProviderSession()
+	if registry_file is None:
+		registry_file = gen_cache_dir() / "providers.json"
+
+	manifest = _load_registry_manifest(registry_file)
+	manifest_changed = False
+
+	return_registry = {} # {"provider id": {"module": module name or module, "class": class name, "handlers": {"event": function name}}}
 	return_event_registry = {}
 
 	# Initialize event registry with empty lists to prevent KeyErrors elsewhere
@@ -58,62 +326,127 @@ def load_providers(providers: List[Union[str, ModuleType]]) -> ProviderRunner:
 		return_event_registry[h_type] = []
 
 	for provider in providers:
-		# Import the provider's module if the parameter is not already a module
 		if inspect.ismodule(provider):
-			provider_module = provider
+			# Modules that were passed in are already imported, so there is nothing to gain from caching them
+			module_providers, warnings = _scan_module(provider)
 		else:
-			provider_module = import_module(provider)
-		
-		# Find all classes in the provider's module
-		all_module_classes = [m[1] for m in inspect.getmembers(provider_module, inspect.isclass) if m[1].__module__ == provider_module.__name__]
-		
-		# Find all classes marked with the Class._is_mcmm_plugin variable set to True
-		mcmm_provider_classes = []
-		for module_class in all_module_classes:
+			module_entry = manifest["modules"].get(provider)
+			if module_entry is None or not _is_current(module_entry):
+				provider_module = import_module(provider)
+				module_file = getattr(provider_module, "__file__", None)
+				module_providers, warnings = _scan_module(provider_module)
+				module_entry = {"file": module_file, "mtime_ns": _mtime_ns(module_file), "providers": module_providers, "warnings": warnings}
+				manifest["modules"][provider] = module_entry
+				manifest_changed = True
+			module_providers, warnings = module_entry["providers"], module_entry["warnings"]
+
+		# The problems of a module are shown on every load, not only when it is scanned
+		for warning in warnings:
+			print(warning)
+
+		for provider_entry in module_providers:
+			provider_id = provider_entry["id"]
+			return_registry[provider_id] = {"module": provider, "class": provider_entry["class"], "handlers": provider_entry["handlers"]}
+
+			for event in provider_entry["handlers"]:
+				return_event_registry[event].append(provider_id)
+
+	if manifest_changed:
+		_save_registry_manifest(registry_file, manifest)
+
+	return ProviderRunner(return_registry, return_event_registry, session)
+
+def _scan_module(provider_module: ModuleType) -> Tuple[List[Dict], List[str]]:
+	"""Finds the MCMM provider classes of a module and their handlers.
+
+	Returns:
+		Tuple[List[Dict], List[str]]: One {"id": str, "class": str, "handlers": {"event": function name}} dict per provider class,
+		and the warnings and errors about the module to print.
+	"""
+	warnings = []
+
+	# Find all classes in the provider's module
+	all_module_classes = [m[1] for m in inspect.getmembers(provider_module, inspect.isclass) if m[1].__module__ == provider_module.__name__]
+
+	# Find all classes marked with the Class._is_mcmm_plugin variable set to True
+	mcmm_provider_classes = []
+	for module_class in all_module_classes:
+		try:
+			if not module_class._is_mcmm_plugin:
+				continue
+		except AttributeError:
+			continue
+
+		mcmm_provider_classes.append(module_class)
+
+	# Recommended amount of @MCMMPlugin decorators sanity check
+	if len(mcmm_provider_classes) == 0:
+		warnings.append(f"[{Fore.YELLOW}WARNING{Fore.RESET}] Could not find an MCMM provider class in {provider_module.__name__}. Maybe it is missing the @MCMMPlugin decoration?")
+	elif len(mcmm_provider_classes) > 1:
+		warnings.append(f"[{Fore.YELLOW}WARNING{Fore.RESET}] {provider_module.__name__} provided more than one MCMM plugin class. The recommended limit is one per module.")
+
+	module_providers = []
+	for provider_class in mcmm_provider_classes:
+		provider_id = provider_class.id
+		if not isinstance(provider_id, str):
+			# The id may be a property, like the abstract one of PluginBase, which only an instance can answer
+			provider_id = provider_class().id
+		handlers = {}
+
+		# Discovers and adds the handlers
+		for _, func in inspect.getmembers(provider_class, inspect.isfunction):
 			try:
-				if not module_class._is_mcmm_plugin:
+				if not func._is_mcmm_handler:
 					continue
 			except AttributeError:
 				continue
-			
-			mcmm_provider_classes.append(module_class)
 
-		# Recommended amount of @MCMMPlugin decorators sanity check
-		if len(mcmm_provider_classes) == 0:
-			print(f"[{Fore.YELLOW}WARNING{Fore.RESET}] Could not find an MCMM provider class in {provider}. Maybe it is missing the @MCMMPlugin decoration?")
-		elif len(mcmm_provider_classes) > 1:
-			print(f"[{Fore.YELLOW}WARNING{Fore.RESET}] {provider} provided more than one MCMM plugin class. The recommended limit is one per module.")
+			try:
+				# Check if valid event type
+				if func._mcmm_event not in HandlerType._all_types:
+					warnings.append(f"[{Fore.RED}ERROR{Fore.RESET}] Function '{func.__name__}' of '{provider_id}' has invalid event type '{func._mcmm_event}'")
+					continue
 
-		# Identify functions that have
-		for provider_class in mcmm_provider_classes:
-			provider_instance = provider_class()
-			provider_id = provider_instance.id
+				handlers[func._mcmm_event] = func.__name__
 
-			# Store an instance of the provider
-			return_providers[provider_id] = {"instance": provider_instance}
+			except AttributeError:
+				warnings.append(f"[{Fore.RED}ERROR{Fore.RESET}] '{func.__name__}' of '{provider_id}' was marked as an MCMM event handler but did not specify the event to handle!")
 
-			# Discovers and adds the handlers
-			for _, func in inspect.getmembers(provider_class, inspect.isfunction):
-				try:
-					if not func._is_mcmm_handler:
-						continue
-				except AttributeError as e:
-					continue
+		module_providers.append({"id": provider_id, "class": provider_class.__name__, "handlers": handlers})
 
-				# Sort into different types
-				try:
-					# Check if valid event type
-					if func._mcmm_event not in HandlerType._all_types:
-						print(f"[{Fore.RED}ERROR{Fore.RESET}] Function '{func.__name__}' of '{provider_id}' has invalid event type '{func._mcmm_event}'")
+	return (module_providers, warnings)
+
+def _mtime_ns(file: Union[str, None]) -> Union[int, None]:
+	if file is None:
+		return None
+	try:
+		return os.stat(file).st_mtime_ns
+	except OSError:
+		return None
+
+def _is_current(module_entry: Dict) -> bool:
+	"""Returns whether the cached providers of a module are still valid, which they are until the module's file is modified.
+	"""
+	return module_entry["file"] is not None and _mtime_ns(module_entry["file"]) == module_entry["mtime_ns"]
+
+def _load_registry_manifest(registry_file: Path) -> Dict:
+	from . import __version__
 
-					return_providers[provider_id][func._mcmm_event] = func
-					
-					if func._mcmm_event not in return_event_registry:
-						return_event_registry[func._mcmm_event] = []
+	empty_manifest = {"version": REGISTRY_VERSION, "mcmm_version": __version__, "modules": {}}
+	try:
+		with registry_file.open("r") as f:
+			manifest = load(f)
+	except (OSError, ValueError):
+		return empty_manifest
 
-					return_event_registry[func._mcmm_event].append(provider_id)
+	# Another version of mcmm may scan modules differently, so nothing it cached is trusted
+	if manifest.get("version") != REGISTRY_VERSION or manifest.get("mcmm_version") != __version__:
+		return empty_manifest
 
-				except AttributeError:
-					print(f"[{Fore.RED}ERROR{Fore.RESET}] '{func.__name__}' of '{provider_id}' was marked as an MCMM event handler but did not specify the event to handle!")
+	return manifest
 
-	return ProviderRunner(return_providers, return_event_registry)
+def _save_registry_manifest(registry_file: Path, manifest: Dict) -> None:
+	tmp = registry_file.parent / f".{registry_file.name}.{uuid4().hex}.tmp"
+	with tmp.open("w") as f:
+		dump(manifest, f, indent=4)
+	os.replace(str(tmp), str(registry_file))
@@ -0,0 +1,207 @@
+"""profiles.py contains the two places profiles can be kept in, selected with "profile_backend" in config.json:
+
+- "json" (the default): one file per profile in profiles/<profile>.json in the config dir.
+- "sqlite": profiles.sqlite3 in the config dir, which saves every profile in a transaction and indexes the
+  provider, mod id and Minecraft version of every profile, so finding the profiles that use a mod does not
+  have to read every profile.
+
+Both have the same interface, and copy_profiles copies profiles between them (`mcmm profiles import` and `export`).
+"""
+
+import os, sqlite3
+from json import dump, dumps, load, loads
+from pathlib import Path
+from typing import Dict, List, Union
+from uuid import uuid4
+
+PROFILE_DB_VERSION = 1
+DEFAULT_BACKEND = "json"
+
+_SCHEMA = """
+CREATE TABLE profiles (name TEXT PRIMARY KEY, minecraft_version TEXT, data TEXT NOT NULL);
+CREATE INDEX profiles_minecraft_version ON profiles (minecraft_version);
+CREATE TABLE profile_mods (profile TEXT NOT NULL, position INTEGER NOT NULL, provider TEXT NOT NULL, mod_id TEXT);
+CREATE INDEX profile_mods_profile ON profile_mods (profile);
+CREATE INDEX profile_mods_provider ON profile_mods (provider, mod_id);
+CREATE INDEX profile_mods_mod_id ON profile_mods (mod_id COLLATE NOCASE);
+"""
+
+def entry_id(mod: Dict) -> Union[str, None]:
+	"""Returns what identifies a profile entry within its provider: the project id, repository, name or path in its metadata.
+	"""
+	metadata = mod.get("metadata") or {}
+	for field in ("id", "repo", "name", "path"):
+		if metadata.get(field) is not None:
+			return str(metadata[field])
+	return None
+
+def _matches(profile_obj: Dict, provider: str = None, mod_id: str = None, mc_version: str = None) -> bool:
+	if mc_version is not None and profile_obj.get("minecraft_version") != mc_version:
+		return False
+	if provider is None and mod_id is None:
+		return True
+
+	return any(
+		(provider is None or mod["provider"] == provider) and (mod_id is None or (entry_id(mod) or "").lower() == mod_id.lower())
+		for mod in profile_obj["mods"]
+	)
+
+class JSONProfileStore:
+	backend = "json"
+
+	def __init__(self, profiles_dir: Path):
+		self.profiles_dir: Path = profiles_dir
+
+	def _path(self, name: str) -> Path:
+		return self.profiles_dir / f"{name}.json"
+
+	def names(self) -> List[str]:
+		return sorted(
+			file.name[:-len(".json")]
+			for file in self.profiles_dir.glob("*.json")
+			if not file.name.endswith(".lock.json")
+		)
+
+	def exists(self, name: str) -> bool:
+		return self._path(name).exists()
+
+	def load(self, name: str) -> Union[Dict, None]:
+		"""Returns the profile called name, or None if there is none.
+		"""
+		try:
+			with self._path(name).open("r") as f:
+				return load(f)
+		except FileNotFoundError:
+			return None
+
+	def save(self, name: str, profile_obj: Dict) -> None:
+		# Written to a temporary file first, so that other commands never read a half written profile
+		self.profiles_dir.mkdir(parents=True, exist_ok=True)
+		tmp = self.profiles_dir / f".{name}.{uuid4().hex}.tmp"
+		with tmp.open("w") as f:
+			dump(profile_obj, f, indent=4)
+		os.replace(str(tmp), str(self._path(name)))
+
+	def find(self, provider: str = None, mod_id: str = None, mc_version: str = None) -> List[str]:
+		"""Returns the profiles with an entry of provider and/or mod_id, and for mc_version if it is given.
+		"""
+		return [name for name in self.names() if _matches(self.load(name), provider, mod_id, mc_version)]
+
+	def close(self) -> None:
+		pass
+
+	def __str__(self) -> str:
+		return str(self.profiles_dir)
+
+class SQLiteProfileStore:
+	backend = "sqlite"
+
+	def __init__(self, path: Path):
+		self.path: Path = path
+		path.parent.mkdir(parents=True, exist_ok=True)
+		# Transactions are started explicitly, so that a profile is never saved halfway
+		self._db = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+
+		version = self._db.execute("PRAGMA user_version").fetchone()[0]
+		if version == 0:
+			self._db.execute("PRAGMA journal_mode = WAL")
+			self._db.execute("BEGIN IMMEDIATE")
+			if self._db.execute("PRAGMA user_version").fetchone()[0] == 0:
+				for statement in _SCHEMA.strip().split(";\n"):
+					self._db.execute(statement)
+				self._db.execute(f"PRAGMA user_version = {PROFILE_DB_VERSION}")
+			self._db.execute("COMMIT")
+		elif version != PROFILE_DB_VERSION:
+			# Unlike the jar index, this holds the profiles themselves, so it is never rebuilt
+			self._db.close()
+			raise ValueError(f"{path} was written by an unsupported version of mcmm (profile database version {version})")
+
+	def names(self) -> List[str]:
+		return [row[0] for row in self._db.execute("SELECT name FROM profiles ORDER BY name")]
+
+	def exists(self, name: str) -> bool:
+		return self._db.execute("SELECT 1 FROM profiles WHERE name = ?", (name,)).fetchone() is not None
+
+	def load(self, name: str) -> Union[Dict, None]:
+		row = self._db.execute("SELECT data FROM profiles WHERE name = ?", (name,)).fetchone()
+		return loads(row[0]) if row is not None else None
+
+	def save(self, name: str, profile_obj: Dict) -> None:
+		self.save_many({name: profile_obj})
+
+	def save_many(self, profiles: Dict[str, Dict]) -> None:
+		"""Saves several profiles in a single transaction.
+		"""
+		self._db.execute("BEGIN IMMEDIATE")
+		try:
+			for name, profile_obj in profiles.items():
+				self._db.execute("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?)", (name, profile_obj.get("minecraft_version"), dumps(profile_obj)))
+				self._db.execute("DELETE FROM profile_mods WHERE profile = ?", (name,))
+				self._db.executemany("INSERT INTO profile_mods VALUES (?, ?, ?, ?)", [
+					(name, position, mod["provider"], entry_id(mod)) for position, mod in enumerate(profile_obj["mods"])
+				])
+		except BaseException:
+			self._db.execute("ROLLBACK")
+			raise
+		self._db.execute("COMMIT")
+
+	def find(self, provider: str = None, mod_id: str = None, mc_version: str = None) -> List[str]:
+		"""Returns the profiles with an entry of provider and/or mod_id, and for mc_version if it is given.
+		"""
+		query = "SELECT name FROM profiles WHERE 1"
+		params = []
+		if mc_version is not None:
+			query += " AND minecraft_version = ?"
+			params.append(mc_version)
+
+		if provider is not None or mod_id is not None:
+			query += " AND name IN (SELECT profile FROM profile_mods WHERE 1"
+			if provider is not None:
+				query += " AND provider = ?"
+				params.append(provider)
+			if mod_id is not None:
+				query += " AND mod_id = ? COLLATE NOCASE"
+				params.append(mod_id)
+			query += ")"
+
+		return [row[0] for row in self._db.execute(query + " ORDER BY name", params)]
+
+	def close(self) -> None:
+		self._db.close()
+
+	def __str__(self) -> str:
+		return str(self.path)
+
+ProfileStore = Union[JSONProfileStore, SQLiteProfileStore]
+
+def profile_store(backend: str, config_dir: Path) -> ProfileStore:
+	"""Opens the profile store of backend ("json" or "sqlite") in config_dir.
+
+	Raises:
+		ValueError: backend is unknown or the SQLite database is from an unsupported version of mcmm.
+	"""
+	if backend == "json":
+		return JSONProfileStore(config_dir / "profiles")
+	if backend == "sqlite":
+		return SQLiteProfileStore(config_dir / "profiles.sqlite3")
+	raise ValueError(f"Unknown profile_backend '{backend}' in config.json, expected 'json' or 'sqlite'")
+
+def copy_profiles(src: ProfileStore, dest: ProfileStore, names: List[str] = None) -> List[str]:
+	"""Copies the profiles called names (default: all of them) from src to dest, overwriting profiles of the same name.
+
+	Returns:
+		List[str]: The profiles that were copied. Names that src does not have are skipped.
+	"""
+	profiles = {}
+	for name in names if names is not None else src.names():
+		profile_obj = src.load(name)
+		if profile_obj is not None:
+			profiles[name] = profile_obj
+
+	if isinstance(dest, SQLiteProfileStore):
+		dest.save_many(profiles)
+	else:
+		for name, profile_obj in profiles.items():
+			dest.save(name, profile_obj)
+
+	return list(profiles)
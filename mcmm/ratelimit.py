@@ -0,0 +1,192 @@
+"""ratelimit.py contains the per-host token buckets that ProviderSession schedules its requests with.
+
+A host has no limit until it is configured in the "rate_limit" section of config.json or until one of its
+responses carries rate limit headers. From then on requests to the host wait for a token, and the bucket
+follows what the server reports:
+
+- X-RateLimit-Remaining/X-RateLimit-Reset (GitHub sends the reset as a POSIX timestamp, Modrinth as seconds
+  from now) set the tokens that are left until the reset. Once they run out, requests wait for the reset.
+- Retry-After pauses the host for that long, and a 429 without any of these headers halves the host's rate.
+
+Nothing waits longer than max_wait for a single token. Past that, requests go through and fail like they would without a limit.
+"""
+
+import threading, time
+from colorama import Fore
+from typing import TYPE_CHECKING, Dict, Union
+from urllib.parse import urlsplit
+
+from .fetch import retry_after_seconds
+
+if TYPE_CHECKING:
+	import requests
+
+DEFAULT_MAX_WAIT = 600.0
+# A 429 without a Retry-After pauses the host for this long, on top of halving its rate.
+DEFAULT_THROTTLE_PAUSE = 1.0
+MIN_RATE = 0.1
+
+# Reset headers larger than this are POSIX timestamps (GitHub), smaller ones are seconds from now (Modrinth).
+_TIMESTAMP_THRESHOLD = 10 ** 9
+
+class _Bucket:
+	def __init__(self, rate: Union[float, None], burst: Union[float, None]):
+		# A rate of None means that nothing is known about the host yet, so requests are not limited.
+		self.rate: Union[float, None] = rate
+		self.capacity: float = burst if burst is not None else (rate if rate is not None else 1.0)
+		self.tokens: float = self.capacity
+		self.updated: float = time.monotonic()
+		self.blocked_until: float = 0.0
+		# While the server reports its window, tokens are only refilled when the window resets.
+		self.reset_at: Union[float, None] = None
+		self.limit: Union[float, None] = None
+
+	def refill(self, now: float) -> None:
+		if self.reset_at is not None:
+			if now >= self.reset_at:
+				self.tokens = self.limit if self.limit is not None else self.capacity
+				self.reset_at = None
+		elif self.rate is not None:
+			self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	def wait_time(self, now: float) -> float:
+		"""Takes a token and returns 0, or returns how long to wait before trying again.
+		"""
+		self.refill(now)
+		if now < self.blocked_until:
+			return self.blocked_until - now
+		if self.rate is None and self.reset_at is None:
+			return 0.0
+		if self.tokens >= 1:
+			self.tokens -= 1
+			return 0.0
+		if self.reset_at is not None:
+			return self.reset_at - now
+		return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+	def __init__(self, hosts: Dict[str, Dict] = None, default_rate: float = None, default_burst: float = None, max_wait: float = DEFAULT_MAX_WAIT):
+		"""
+		Arguments:
+			hosts {Dict[str, Dict]} -- {host: {"requests_per_second": float, "burst": float}} for hosts with a configured limit
+			default_rate {float} -- Requests per second of every other host (default: no limit until the host sends rate limit headers)
+			max_wait {float} -- The longest a request waits for a token, in seconds
+		"""
+		self._lock = threading.Lock()
+		self._hosts: Dict[str, Dict] = hosts or {}
+		self._default_rate = default_rate
+		self._default_burst = default_burst
+		self.max_wait: float = max_wait
+		self._buckets: Dict[str, _Bucket] = {}
+		self._warned = set()
+
+	def _bucket(self, host: str) -> _Bucket:
+		bucket = self._buckets.get(host)
+		if bucket is None:
+			conf = self._hosts.get(host, {})
+			bucket = _Bucket(conf.get("requests_per_second", self._default_rate), conf.get("burst", self._default_burst))
+			self._buckets[host] = bucket
+		return bucket
+
+	def acquire(self, url: str) -> float:
+		"""Waits until a request to the host of url may be sent and returns how many seconds that took.
+		"""
+		host = urlsplit(url).hostname or ""
+		waited = 0.0
+		while True:
+			with self._lock:
+				wait = self._bucket(host).wait_time(time.monotonic())
+			if wait <= 0:
+				return waited
+
+			if waited + wait > self.max_wait:
+				self._warn_once(host, wait)
+				return waited
+
+			time.sleep(wait)
+			waited += wait
+
+	def update(self, url: str, r: "requests.Response") -> None:
+		"""Adapts the bucket of the host of url to the rate limit headers of its response r.
+		"""
+		host = urlsplit(url).hostname or ""
+		now = time.monotonic()
+
+		remaining = _header_float(r, "X-RateLimit-Remaining")
+		reset = _header_float(r, "X-RateLimit-Reset")
+		limit = _header_float(r, "X-RateLimit-Limit")
+		retry_after = retry_after_seconds(r)
+
+		with self._lock:
+			bucket = self._bucket(host)
+
+			if remaining is not None and reset is not None:
+				reset_in = reset - time.time() if reset > _TIMESTAMP_THRESHOLD else reset
+				bucket.refill(now)
+				bucket.tokens = remaining
+				bucket.reset_at = now + max(reset_in, 0.0)
+				bucket.limit = limit
+				if remaining < 1:
+					bucket.blocked_until = max(bucket.blocked_until, bucket.reset_at)
+
+			if retry_after is not None:
+				bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+			elif r.status_code == 429 and remaining is None:
+				# The server limits requests without saying how, so the host gets half the rate for the rest of the run.
+				current = bucket.rate if bucket.rate is not None else 10.0
+				bucket.rate = max(current / 2, MIN_RATE)
+				bucket.capacity = max(min(bucket.capacity, bucket.rate), 1.0)
+				bucket.tokens = min(bucket.tokens, 0.0)
+				bucket.blocked_until = max(bucket.blocked_until, now + DEFAULT_THROTTLE_PAUSE)
+
+	def rate_limit_wait(self, r: "requests.Response") -> Union[float, None]:
+		"""Returns how long to wait before retrying r if it was refused for exceeding a rate limit, or None if it was not.
+
+		GitHub answers with a 403 instead of a 429 once the remaining requests hit 0.
+		"""
+		if r.status_code not in (403, 429):
+			return None
+
+		retry_after = retry_after_seconds(r)
+		if retry_after is not None:
+			return retry_after
+
+		remaining = _header_float(r, "X-RateLimit-Remaining")
+		reset = _header_float(r, "X-RateLimit-Reset")
+		if remaining is None or remaining >= 1 or reset is None:
+			return None if r.status_code == 403 else DEFAULT_THROTTLE_PAUSE
+
+		return max(reset - time.time() if reset > _TIMESTAMP_THRESHOLD else reset, 0.0)
+
+	def _warn_once(self, host: str, wait: float) -> None:
+		with self._lock:
+			if host in self._warned:
+				return
+			self._warned.add(host)
+
+		print(f"[{Fore.YELLOW}WARNING{Fore.RESET}] The rate limit of {host} is exhausted for another {wait:.0f} s, which is longer than the {self.max_wait:.0f} s mcmm waits. Requests to {host} will fail until then. An API token (\"tokens\" in config.json) usually raises the limit.")
+
+def _header_float(r: "requests.Response", name: str) -> Union[float, None]:
+	try:
+		return float(r.headers[name])
+	except (KeyError, ValueError):
+		return None
+
+def rate_limiter_from_config(config: Dict) -> RateLimiter:
+	"""Creates a RateLimiter using the optional "rate_limit" section of config.json.
+
+	Recognized keys are "requests_per_second" and "burst" (the default limit of every host, none by default),
+	"max_wait" (seconds) and "hosts", which maps host names to their own "requests_per_second" and "burst".
+	"""
+	conf = config.get("rate_limit", {})
+
+	def optional_float(value) -> Union[float, None]:
+		return float(value) if value is not None else None
+
+	return RateLimiter(
+		hosts={host: {key: float(value) for key, value in host_conf.items()} for host, host_conf in conf.get("hosts", {}).items()},
+		default_rate=optional_float(conf.get("requests_per_second")),
+		default_burst=optional_float(conf.get("burst")),
+		max_wait=float(conf.get("max_wait", DEFAULT_MAX_WAIT)),
+	)
@@ -0,0 +1,215 @@
+"""session.py contains the pooled HTTP session that ProviderRunner shares with every Mod Provider.
+"""
+
+import hashlib, os, requests, time
+from json import dumps
+from requests.adapters import HTTPAdapter
+from typing import Dict
+from urllib.parse import urlsplit
+
+from .cache import ResponseCache, cache_from_config
+from .dirs import gen_cache_dir
+from .fetch import RETRY_STATUS_CODES, RetryPolicy, RetryStats, retry_after_seconds
+from .ratelimit import RateLimiter, rate_limiter_from_config
+from .stats import HTTPStats
+
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_MAX_HOSTS = 10
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 8
+
+# The API hosts of the "tokens" that config.json may name by provider, and how each one expects its Authorization header.
+TOKEN_HOSTS = {
+	"github": ("api.github.com", "Bearer {}"),
+	"modrinth": ("api.modrinth.com", "{}"),
+}
+
+class ProviderSession(requests.Session):
+	"""A requests.Session with keep-alive connection pools, a per-host connection limit and default timeouts.
+
+	Every request made through the session reuses open connections to the same host instead of
+	doing a new TCP and TLS handshake, and waits for a free connection once max_connections_per_host
+	requests to one host are in flight. Requests are also scheduled by a per-host RateLimiter, which slows
+	down the requests to a host as its rate limit headers report fewer remaining requests, and sent with
+	the API token of their host, if authorizations has one.
+
+	API metadata should be requested with get_cached, which goes through the session's ResponseCache (if it has one).
+	"""
+
+	def __init__(self,
+		connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+		read_timeout: float = DEFAULT_READ_TIMEOUT,
+		max_hosts: int = DEFAULT_MAX_HOSTS,
+		max_connections_per_host: int = DEFAULT_MAX_CONNECTIONS_PER_HOST,
+		cache: ResponseCache = None,
+		retry_policy: RetryPolicy = None,
+		rate_limiter: RateLimiter = None,
+		authorizations: Dict[str, str] = None,
+	):
+		super().__init__()
+		self.timeout = (connect_timeout, read_timeout)
+
+		self.rate_limiter: RateLimiter = rate_limiter if rate_limiter is not None else RateLimiter()
+		# {host: Authorization header}. requests drops the header when a response redirects to another host.
+		self.authorizations: Dict[str, str] = authorizations if authorizations is not None else {}
+
+		# Used for API requests here and for file downloads by fetch.stream_to_file, which also resumes interrupted transfers.
+		self.retry_policy: RetryPolicy = retry_policy if retry_policy is not None else RetryPolicy()
+		self.retry_stats = RetryStats()
+		# Requests, bytes and cache outcomes for the --stats report. stream_to_file adds the bodies of file downloads.
+		self.http_stats = HTTPStats()
+
+		self.cache: ResponseCache = cache
+		# When refresh_cache is set, cached responses are always revalidated, even if they are not expired yet.
+		self.refresh_cache: bool = False
+
+		adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=max_connections_per_host, pool_block=True)
+		self.mount("https://", adapter)
+		self.mount("http://", adapter)
+
+	def request(self, method, url, **kwargs) -> requests.Response:
+		# Providers may still pass their own timeout for requests that are known to be slow.
+		kwargs.setdefault("timeout", self.timeout)
+
+		# Streamed responses are file downloads, which stream_to_file retries (and resumes) itself.
+		# POST requests are only retried if they are read-only lookups made through post_cached.
+		retryable = not kwargs.get("stream", False) and (method.upper() in ("GET", "HEAD") or kwargs.pop("_idempotent", False))
+		kwargs.pop("_idempotent", None)
+		if not retryable:
+			return self._counted_request(method, url, **kwargs)
+
+		attempt = 0
+		while True:
+			try:
+				r = self._counted_request(method, url, **kwargs)
+			except (requests.ConnectionError, requests.Timeout):
+				if attempt >= self.retry_policy.retries:
+					raise
+				retry_after = None
+			else:
+				if r.status_code in RETRY_STATUS_CODES:
+					retry_after = retry_after_seconds(r)
+				else:
+					# Refusals for exceeding a rate limit (like GitHub's 403s) are retried once the limit resets, unless that is too far away.
+					retry_after = self.rate_limiter.rate_limit_wait(r)
+					if retry_after is None or retry_after > self.rate_limiter.max_wait:
+						return r
+				if attempt >= self.retry_policy.retries:
+					return r
+				r.close()
+
+			attempt += 1
+			self.retry_stats.record_retry(url)
+			time.sleep(self.retry_policy.delay(attempt, retry_after))
+
+	def _counted_request(self, method, url, **kwargs) -> requests.Response:
+		"""Sends a single request once the rate limiter allows it, with the token of its host, and records it in http_stats.
+		"""
+		waited = self.rate_limiter.acquire(url)
+		if waited > 0:
+			self.http_stats.record_throttle(waited)
+
+		authorization = self.authorizations.get(urlsplit(url).hostname)
+		if authorization is not None:
+			kwargs["headers"] = dict(kwargs.get("headers") or {})
+			kwargs["headers"].setdefault("Authorization", authorization)
+
+		start = time.perf_counter()
+		try:
+			r = super().request(method, url, **kwargs)
+		except requests.RequestException:
+			self.http_stats.record_request(url, 0, time.perf_counter() - start)
+			raise
+
+		self.rate_limiter.update(url, r)
+
+		# The body of a streamed response has not been read yet, its reader records it with record_transfer.
+		size = 0 if kwargs.get("stream", False) else len(r.content)
+		self.http_stats.record_request(url, size, time.perf_counter() - start)
+		return r
+
+	def get_cached(self, url: str, **kwargs) -> requests.Response:
+		"""Same as get, but answers from the response cache while the cached response is fresh.
+
+		Expired responses are revalidated with a conditional request, so an unchanged resource is not transferred again.
+		Only use this for API metadata, never for file downloads.
+		"""
+		return self._request_cached("GET", url, url, **kwargs)
+
+	def post_cached(self, url: str, json_body, **kwargs) -> requests.Response:
+		"""Same as get_cached, but for read-only POST requests (like bulk lookups) whose response only depends on the JSON body.
+		"""
+		body = dumps(json_body, sort_keys=True)
+		cache_key = f"{url}#{hashlib.sha256(body.encode()).hexdigest()}"
+		return self._request_cached("POST", url, cache_key, json=json_body, _idempotent=True, **kwargs)
+
+	def _request_cached(self, method: str, url: str, cache_key: str, **kwargs) -> requests.Response:
+		if self.cache is None:
+			return self.request(method, url, **kwargs)
+
+		entry = self.cache.load(cache_key)
+		if entry is not None and not self.refresh_cache and self.cache.is_fresh(entry):
+			self.http_stats.record_cache("hits")
+			return self.cache.to_response(entry)
+
+		headers = dict(kwargs.pop("headers", None) or {})
+		if entry is not None:
+			if "ETag" in entry["headers"]:
+				headers["If-None-Match"] = entry["headers"]["ETag"]
+			if "Last-Modified" in entry["headers"]:
+				headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+		r = self.request(method, url, headers=headers, **kwargs)
+
+		if r.status_code == 304 and entry is not None:
+			self.http_stats.record_cache("revalidated")
+			self.cache.revalidated(cache_key, entry)
+			return self.cache.to_response(entry)
+
+		self.http_stats.record_cache("misses")
+		if r.status_code == 200:
+			self.cache.save(cache_key, r)
+
+		return r
+
+def session_from_config(config: Dict) -> ProviderSession:
+	"""Creates a ProviderSession using the optional "http" section of config.json.
+
+	Recognized keys are "connect_timeout", "read_timeout", "max_hosts" and "max_connections_per_host".
+	Retries are configured by the "retry" section, which recognizes "retries", "backoff" and "max_backoff" (seconds).
+	The response cache is configured by the "cache" section (see cache_from_config) and rate limits by the
+	"rate_limit" section (see rate_limiter_from_config).
+
+	API tokens are read from the "tokens" section, which maps "github", "modrinth" or any host name to a token.
+	Without a configured GitHub token, the GITHUB_TOKEN environment variable is used if it is set.
+	"""
+	http_conf = config.get("http", {})
+	retry_conf = config.get("retry", {})
+	default_retry = RetryPolicy()
+
+	return ProviderSession(
+		connect_timeout=float(http_conf.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+		read_timeout=float(http_conf.get("read_timeout", DEFAULT_READ_TIMEOUT)),
+		max_hosts=int(http_conf.get("max_hosts", DEFAULT_MAX_HOSTS)),
+		max_connections_per_host=int(http_conf.get("max_connections_per_host", DEFAULT_MAX_CONNECTIONS_PER_HOST)),
+		cache=cache_from_config(config, gen_cache_dir() / "http"),
+		retry_policy=RetryPolicy(
+			retries=int(retry_conf.get("retries", default_retry.retries)),
+			backoff=float(retry_conf.get("backoff", default_retry.backoff)),
+			max_backoff=float(retry_conf.get("max_backoff", default_retry.max_backoff)),
+		),
+		rate_limiter=rate_limiter_from_config(config),
+		authorizations=_authorizations(config),
+	)
+
+def _authorizations(config: Dict) -> Dict[str, str]:
+	tokens = dict(config.get("tokens", {}))
+	if "github" not in tokens and os.getenv("GITHUB_TOKEN"):
+		tokens["github"] = os.getenv("GITHUB_TOKEN")
+
+	authorizations = {}
+	for name, token in tokens.items():
+		host, header = TOKEN_HOSTS.get(name, (name, "Bearer {}"))
+		authorizations[host] = header.format(token)
+
+	return authorizations
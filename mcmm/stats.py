@@ -0,0 +1,204 @@
+"""stats.py contains the timing and transfer counters behind the --stats report of download and activate.
+
+RunStats collects how long each phase (resolve, transfer, fetch, store, ...) took in total and for every mod,
+HTTPStats counts the requests, bytes and response cache outcomes of a ProviderSession. Both are always collected,
+since they only cost a lock and a clock read per event, and are only reported when --stats is given.
+"""
+
+import threading, time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Union
+from urllib.parse import urlsplit
+
+# The order of the phases in the report, any other phase follows them alphabetically.
+PHASE_ORDER = ["resolve", "download", "transfer", "fetch", "verify", "store", "manifest", "compare", "link", "replace", "remove"]
+
+def mod_label(provider_id: str, metadata: Dict = None, resolution: Dict = None) -> str:
+	"""Returns the name a mod is reported under: the file name of its jar once it is resolved, otherwise whatever identifies its profile entry.
+	"""
+	if resolution:
+		if resolution.get("file_name"):
+			return resolution["file_name"]
+		if resolution.get("url"):
+			return resolution["url"]
+
+	for field in ("id", "repo", "name", "path"):
+		if metadata and metadata.get(field):
+			return f"{provider_id}:{metadata[field]}"
+
+	return provider_id
+
+class RunStats:
+	"""Per-phase and per-mod timings of one command.
+
+	Phases of different mods overlap when several jobs run at once, so the phase totals are the time spent in
+	each phase summed over all threads and can add up to more than the wall time.
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.started = time.perf_counter()
+		self.phases: Dict[str, List] = {} # {phase: [seconds, count]}
+		self.mods: Dict[str, Dict] = {} # {mod: {"provider": str, "phases": {phase: seconds}, "bytes": int}}
+
+	def record(self, phase: str, seconds: float, mod: str = None, provider_id: str = None, size: int = 0) -> None:
+		with self._lock:
+			totals = self.phases.setdefault(phase, [0.0, 0])
+			totals[0] += seconds
+			totals[1] += 1
+
+			if mod is None:
+				return
+
+			mod_stats = self.mods.setdefault(mod, {"provider": provider_id, "phases": {}, "bytes": 0})
+			if mod_stats["provider"] is None:
+				mod_stats["provider"] = provider_id
+			mod_stats["phases"][phase] = mod_stats["phases"].get(phase, 0.0) + seconds
+			mod_stats["bytes"] += size
+
+	@contextmanager
+	def timed(self, phase: str, mod: str = None, provider_id: str = None) -> Iterator[None]:
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.record(phase, time.perf_counter() - start, mod, provider_id)
+
+	def report(self, http_stats: "HTTPStats" = None, retry_stats=None) -> Dict:
+		"""Returns everything that was recorded as a JSON serializable dict, mods sorted by their total time (slowest first).
+		"""
+		with self._lock:
+			phases = {phase: {"seconds": seconds, "count": count} for phase, (seconds, count) in self.phases.items()}
+			mods = [{
+				"mod": mod,
+				"provider": mod_stats["provider"],
+				"seconds": sum(mod_stats["phases"].values()),
+				"phases": dict(mod_stats["phases"]),
+				"bytes": mod_stats["bytes"],
+			} for mod, mod_stats in self.mods.items()]
+
+		mods.sort(key=lambda mod: mod["seconds"], reverse=True)
+		report = {"wall_seconds": time.perf_counter() - self.started, "phases": _ordered(phases), "mods": mods}
+
+		if http_stats is not None:
+			report["http"] = http_stats.report()
+			if retry_stats is not None:
+				report["http"].update({"retries": retry_stats.retries, "resumed": retry_stats.resumed, "resumed_bytes": retry_stats.resumed_bytes})
+
+		return report
+
+class HTTPStats:
+	"""Counts the requests of a session, the bytes they received and the outcomes of the response cache.
+
+	The time spent waiting for the network is also summed per thread, so that the time a handler spent on
+	the network can be told apart from the time it spent on everything else (see network_seconds).
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._local = threading.local()
+		self.requests = 0
+		self.bytes_received = 0
+		self.hosts: Dict[str, int] = {} # {host: requests}
+		self.cache: Dict[str, int] = {"hits": 0, "revalidated": 0, "misses": 0}
+		self.throttled_seconds = 0.0
+
+	def record_request(self, url: str, size: int, seconds: float) -> None:
+		host = urlsplit(url).hostname or ""
+		with self._lock:
+			self.requests += 1
+			self.bytes_received += size
+			self.hosts[host] = self.hosts.get(host, 0) + 1
+		self.add_network_time(seconds)
+
+	def record_transfer(self, size: int, seconds: float) -> None:
+		"""Records the body of a streamed response, which record_request could not count because it was read later.
+		"""
+		with self._lock:
+			self.bytes_received += size
+		self.add_network_time(seconds)
+
+	def record_throttle(self, seconds: float) -> None:
+		"""Records time that a request waited for the rate limit of its host.
+		"""
+		with self._lock:
+			self.throttled_seconds += seconds
+
+	def record_cache(self, outcome: str) -> None:
+		with self._lock:
+			self.cache[outcome] += 1
+
+	def add_network_time(self, seconds: float) -> None:
+		self._local.seconds = self.network_seconds() + seconds
+
+	def network_seconds(self) -> float:
+		"""Returns the time the current thread has spent on requests so far.
+		"""
+		return getattr(self._local, "seconds", 0.0)
+
+	def report(self) -> Dict:
+		with self._lock:
+			return {
+				"requests": self.requests,
+				"bytes_received": self.bytes_received,
+				"hosts": dict(sorted(self.hosts.items(), key=lambda item: item[1], reverse=True)),
+				"cache": dict(self.cache),
+				"throttled_seconds": self.throttled_seconds,
+			}
+
+def _ordered(phases: Dict) -> Dict:
+	def order(phase: str):
+		return (PHASE_ORDER.index(phase), "") if phase in PHASE_ORDER else (len(PHASE_ORDER), phase)
+	return {phase: phases[phase] for phase in sorted(phases, key=order)}
+
+def format_report(report: Dict, top: int = 10) -> List[str]:
+	"""Returns the human readable lines of a report: the phase totals, the HTTP counters and the top slowest mods.
+	"""
+	lines = [f"Wall time {report['wall_seconds']:.2f} s. Time per phase, summed over all jobs:"]
+	for phase, totals in report["phases"].items():
+		lines.append(f"    {phase:<10} {totals['seconds']:9.3f} s in {totals['count']} call(s)")
+
+	http = report.get("http")
+	if http is not None:
+		hosts = ", ".join(f"{host} {count}" for host, count in http["hosts"].items())
+		lines.append(f"HTTP: {http['requests']} request(s), {format_bytes(http['bytes_received'])} received" + (f" ({hosts})" if hosts != "" else ""))
+		cache = http["cache"]
+		lines.append(f"Response cache: {cache['hits']} hit(s), {cache['revalidated']} revalidated, {cache['misses']} miss(es)")
+		if http["throttled_seconds"] > 0:
+			lines.append(f"Rate limits: requests waited {http['throttled_seconds']:.1f} s in total")
+		if http.get("retries") or http.get("resumed"):
+			lines.append(f"Retries: {http['retries']}, resumed downloads: {http['resumed']} ({format_bytes(http['resumed_bytes'])} not downloaded again)")
+
+	if len(report["mods"]) != 0:
+		lines.append(f"Slowest mods (of {len(report['mods'])}):")
+		for mod in report["mods"][:top]:
+			phases = ", ".join(f"{phase} {seconds:.3f} s" for phase, seconds in _ordered(mod["phases"]).items())
+			size = f", {format_bytes(mod['bytes'])}" if mod["bytes"] != 0 else ""
+			lines.append(f"    {mod['mod']}: {mod['seconds']:.3f} s ({phases}){size}")
+
+	return lines
+
+def format_bytes(n: Union[int, float]) -> str:
+	for unit in ["B", "KiB", "MiB"]:
+		if n < 1024:
+			return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+		n /= 1024
+	return f"{n:.1f} GiB"
+
+@contextmanager
+def cprofile_to(out_file: Union[str, None]) -> Iterator[None]:
+	"""Runs the body under cProfile and writes the profile to out_file (readable with `python -m pstats`), or just runs it if out_file is None.
+	"""
+	if out_file is None:
+		yield
+		return
+
+	import cProfile
+
+	profiler = cProfile.Profile()
+	profiler.enable()
+	try:
+		yield
+	finally:
+		profiler.disable()
+		profiler.dump_stats(out_file)
@@ -0,0 +1,283 @@
+"""store.py contains the content-addressed jar store that all profiles share.
+
+Every jar is stored once, named after its SHA-256, under jar_storage_dir/objects. Each profile has a
+manifest in jar_storage_dir/manifests/<profile>.json which lists the jar file names of the profile and
+the objects they point to, so profiles that share a mod also share its bytes on disk.
+"""
+
+import hashlib, os, re, stat
+from json import dump, load
+from pathlib import Path
+from shutil import copyfile as shutil_copyfile
+from shutil import move as shutil_move
+from shutil import rmtree as shutil_rmtree
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Set, Tuple, Union
+from uuid import uuid4
+
+from .fetch import hash_file
+from .stats import RunStats
+
+MANIFEST_VERSION = 1
+STAGING_DIR_NAME = ".mcmm-staging"
+
+# The names of objects. Anything else in objects/, like the temporary files of add, is not an object.
+_OBJECT_NAME = re.compile(r"[0-9a-f]{64}")
+
+class SyncResult(NamedTuple):
+	unchanged: int
+	written: int
+	removed: int
+	bytes_written: int
+
+class JarStore:
+	def __init__(self, root: Path):
+		self.root: Path = root
+		self.objects_dir: Path = root / "objects"
+		self.manifests_dir: Path = root / "manifests"
+
+	def object_path(self, sha256: str) -> Path:
+		# Objects are sharded by the first two hex characters to keep directory sizes reasonable.
+		return self.objects_dir / sha256[:2] / sha256
+
+	def has_object(self, sha256: str) -> bool:
+		return self.object_path(sha256).exists()
+
+	def objects(self) -> Iterator[Path]:
+		"""Yields the path of every object in the store.
+
+		Temporary files next to the objects are skipped, since they belong to an add that is still running (maybe in another process).
+		"""
+		for obj in self.objects_dir.glob("*/*"):
+			if _OBJECT_NAME.fullmatch(obj.name):
+				yield obj
+
+	def add(self, file: Path, sha256: str = None) -> Tuple[str, int]:
+		"""Moves file into the store and returns its SHA-256 and size.
+
+		If the store already contains the same bytes, file is simply removed.
+		"""
+		if sha256 is None:
+			sha256 = hash_file(file, "sha256")
+		size = file.stat().st_size
+
+		obj = self.object_path(sha256)
+		if obj.exists():
+			file.unlink()
+			return (sha256, size)
+
+		obj.parent.mkdir(parents=True, exist_ok=True)
+
+		# file usually lives on another filesystem (the providers' cache dirs), so it is moved next to
+		# the object first and then renamed, which keeps half-moved objects from ever being visible.
+		tmp = obj.parent / f".{sha256}.{uuid4().hex}.tmp"
+		shutil_move(str(file), str(tmp))
+		# Objects are hard linked into mods folders, so they are made read-only to keep anything that writes
+		# to a jar in a mods folder from silently changing the jar of every profile.
+		os.chmod(str(tmp), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+		os.replace(str(tmp), str(obj))
+
+		return (sha256, size)
+
+	def incoming_path(self, file_name: str, source: str = None) -> Path:
+		"""Returns a path on the store's filesystem to download file_name to before adding it to the store.
+
+		The path is derived from source (for example the URL of the jar) if it is given, so that a download
+		that was interrupted can resume its .part file the next time the same jar is downloaded.
+		"""
+		if source is None:
+			return self.root / "incoming" / f"{uuid4().hex}-{file_name}"
+		return self.root / "incoming" / f"{hashlib.sha256(source.encode()).hexdigest()[:16]}-{file_name}"
+
+	def link(self, sha256: str, dest: Path) -> bool:
+		"""Places the object sha256 at dest, replacing anything already there.
+
+		A hard link is used when possible, otherwise the object is copied (for example when dest is on another drive).
+
+		Returns:
+			bool: True if dest was hard linked, False if it was copied.
+		"""
+		obj = self.object_path(sha256)
+		tmp = dest.parent / f".{dest.name}.{uuid4().hex}.tmp"
+
+		try:
+			os.link(str(obj), str(tmp))
+			linked = True
+		except OSError:
+			shutil_copyfile(str(obj), str(tmp))
+			linked = False
+
+		replace_file(tmp, dest, self)
+		return linked
+
+	def legacy_profile_dir(self, profile: str) -> Union[Path, None]:
+		"""Returns the folder in which profiles downloaded before the jar store existed keep a private copy of their jars.
+
+		None is returned for profiles whose name clashes with the store's own folders.
+		"""
+		if profile in (self.objects_dir.name, self.manifests_dir.name, "incoming"):
+			return None
+		return self.root / profile
+
+	def sync(self, mods_folder: Path, jars: List[Dict], stats: RunStats = None) -> SyncResult:
+		"""Makes the jars in mods_folder match jars (a manifest's "jars" list), only touching the jars that differ.
+
+		All new and changed jars are staged in a folder inside mods_folder first and only then renamed
+		into place, so a failure while linking or copying leaves mods_folder as it was. Renaming is done
+		one jar at a time though, so a failure while renaming (or removing the jars that are no longer
+		wanted) leaves some jars of the old and some of the new profile, which the next sync fixes.
+		The time spent comparing, linking, replacing and removing each jar is recorded in stats.
+		"""
+		if stats is None:
+			stats = RunStats()
+
+		wanted = {jar["file_name"]: jar for jar in jars}
+		present = {file.name: file for file in mods_folder.glob("*.jar")}
+
+		to_write = []
+		for name, jar in wanted.items():
+			with stats.timed("compare", name):
+				if name not in present or not self._matches(present[name], jar):
+					to_write.append(jar)
+		to_remove = [file for name, file in present.items() if name not in wanted]
+
+		staging_dir = mods_folder / STAGING_DIR_NAME
+		shutil_rmtree(str(staging_dir), ignore_errors=True)
+		staging_dir.mkdir(parents=True)
+
+		bytes_written = 0
+		try:
+			for jar in to_write:
+				with stats.timed("link", jar["file_name"]):
+					if not self.link(jar["sha256"], staging_dir / jar["file_name"]):
+						bytes_written += jar["size"]
+
+			for jar in to_write:
+				with stats.timed("replace", jar["file_name"]):
+					replace_file(staging_dir / jar["file_name"], mods_folder / jar["file_name"], self)
+		finally:
+			shutil_rmtree(str(staging_dir), ignore_errors=True)
+
+		for file in to_remove:
+			with stats.timed("remove", file.name):
+				remove_file(file, self)
+
+		return SyncResult(len(wanted) - len(to_write), len(to_write), len(to_remove), bytes_written)
+
+	def _matches(self, file: Path, jar: Dict) -> bool:
+		try:
+			if file.stat().st_size != jar["size"]:
+				return False
+
+			# Jars that were hard linked from the store are the object itself, so there is nothing to hash.
+			if os.path.samefile(str(file), str(self.object_path(jar["sha256"]))):
+				return True
+		except OSError:
+			return False
+
+		return hash_file(file, "sha256") == jar["sha256"]
+
+	def manifest_path(self, profile: str) -> Path:
+		return self.manifests_dir / f"{profile}.json"
+
+	def load_manifest(self, profile: str) -> Union[Dict, None]:
+		"""Returns the manifest of profile or None if the profile has not been downloaded into the store yet.
+		"""
+		manifest_file = self.manifest_path(profile)
+		if not manifest_file.exists():
+			return None
+
+		with manifest_file.open("r") as f:
+			return load(f)
+
+	def save_manifest(self, profile: str, jars: List[Dict]) -> None:
+		"""Writes the manifest of profile.
+
+		Arguments:
+			jars {List[Dict]} -- One {"file_name": str, "sha256": str, "size": int} dict per jar
+		"""
+		manifest_file = self.manifest_path(profile)
+		manifest_file.parent.mkdir(parents=True, exist_ok=True)
+
+		tmp = manifest_file.parent / f".{manifest_file.name}.{uuid4().hex}.tmp"
+		with tmp.open("w") as f:
+			dump({"version": MANIFEST_VERSION, "jars": jars}, f, indent=4)
+		os.replace(str(tmp), str(manifest_file))
+
+	def referenced_objects(self, lock_files: Iterable[Path] = ()) -> Set[str]:
+		"""Returns the objects that a manifest or one of lock_files (profile lock files, see lockfile.py) points to.
+
+		Lock files that can not be read are skipped, since they only keep jars that can be fetched again.
+		"""
+		referenced = set()
+		for manifest_file in self.manifests_dir.glob("*.json"):
+			with manifest_file.open("r") as f:
+				for jar in load(f)["jars"]:
+					referenced.add(jar["sha256"])
+
+		for lock_file in lock_files:
+			try:
+				with lock_file.open("r") as f:
+					referenced.update(mod["sha256"] for mod in load(f)["mods"])
+			except (OSError, ValueError, KeyError, TypeError):
+				continue
+
+		return referenced
+
+	def gc(self, lock_files: Iterable[Path] = ()) -> int:
+		"""Removes every object that no manifest or lock file points to and returns how many were removed.
+
+		The jars that lock and mirror fetch are only pinned by lock files until a download puts them in a manifest.
+		"""
+		referenced = self.referenced_objects(lock_files)
+		removed = 0
+
+		for obj in self.objects():
+			if obj.name not in referenced:
+				remove_file(obj)
+				removed += 1
+
+		return removed
+
+def remove_file(file: Path, store: JarStore = None) -> None:
+	"""Removes file, even if it is a read-only jar from the store (which Windows refuses to delete).
+
+	The mode of a file is shared by all of its hard links, so making file writable to remove it also makes
+	the object of store that it is linked to writable. That object is made read-only again afterwards.
+	"""
+	try:
+		file.unlink()
+	except PermissionError:
+		st = file.stat()
+		obj = _linked_object(file, st, store)
+		os.chmod(str(file), stat.S_IWUSR | stat.S_IRUSR)
+		try:
+			file.unlink()
+		except OSError:
+			os.chmod(str(file), stat.S_IMODE(st.st_mode))
+			raise
+		if obj is not None:
+			os.chmod(str(obj), stat.S_IMODE(st.st_mode))
+
+def _linked_object(file: Path, st: os.stat_result, store: Union[JarStore, None]) -> Union[Path, None]:
+	"""Returns the object of store that file is a hard link of (st being its stat), or None if it is not one.
+	"""
+	if store is None or st.st_nlink < 2:
+		return None
+
+	# Only the read-only jars that Windows refuses to remove get here, so hashing them costs nothing elsewhere
+	obj = store.object_path(hash_file(file, "sha256"))
+	try:
+		return obj if obj != file and os.path.samefile(str(obj), str(file)) else None
+	except OSError:
+		return None
+
+def replace_file(src: Path, dest: Path, store: JarStore = None) -> None:
+	"""Renames src to dest like os.replace, even if dest is a read-only jar from the store (which Windows refuses to replace).
+
+	See remove_file for store.
+	"""
+	try:
+		os.replace(str(src), str(dest))
+	except PermissionError:
+		remove_file(dest, store)
+		os.replace(str(src), str(dest))
@@ -0,0 +1,80 @@
+"""verify.py checks jars against the sizes and hashes that Mod Providers publish for them ("size" and "hashes" in a resolution).
+
+Downloads are checked as soon as they are fetched, and `mcmm verify` checks the jars that are already in the jar store.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Union
+
+from .fetch import FetchResult, hash_file, hash_file_multi
+from .store import JarStore
+
+# The hashes that providers publish, strongest first. A jar is checked against the strongest one its provider publishes.
+UPSTREAM_HASHES = ["sha512", "sha256", "sha1"]
+
+class VerifyResult(NamedTuple):
+	jar: Dict
+	problems: List[str]
+
+def upstream_hash(resolution: Union[Dict, None], free_hash: str = None) -> Union[Dict, None]:
+	"""Returns {"name": hash name, "digest": hex digest} of the hash to check a jar of resolution against, or None if there is none.
+
+	free_hash names a hash that is already known for the jar (like the SHA-256 that every download computes),
+	which is used over a stronger one, since checking it costs nothing.
+	"""
+	hashes = {name.lower(): digest for name, digest in ((resolution or {}).get("hashes") or {}).items() if digest}
+	if free_hash in hashes:
+		return {"name": free_hash, "digest": hashes[free_hash]}
+
+	for name in UPSTREAM_HASHES:
+		if name in hashes:
+			return {"name": name, "digest": hashes[name]}
+
+	return None
+
+def check_download(result: FetchResult, resolution: Dict) -> str:
+	"""Returns an error if a fetched jar does not have the size and hash that its resolution publishes, otherwise "".
+	"""
+	size = resolution.get("size")
+	if size is not None and result.size != size:
+		return f"{result.path.name} is {result.size} bytes, but its Mod Provider published a size of {size} bytes. The download is incomplete or corrupted."
+
+	expected = upstream_hash(resolution, result.hash_name)
+	if expected is None:
+		return ""
+
+	digest = result.digest if expected["name"] == result.hash_name else hash_file(result.path, expected["name"])
+	if digest.lower() != expected["digest"].lower():
+		return f"{result.path.name} has {expected['name']} {digest}, but its Mod Provider published {expected['digest']}. The download is corrupted."
+
+	return ""
+
+def verify_jar(store: JarStore, jar: Dict) -> VerifyResult:
+	"""Checks that the store object of jar (a manifest entry) still has its SHA-256 and size, and the hash its Mod Provider published.
+	"""
+	obj = store.object_path(jar["sha256"])
+	try:
+		size = obj.stat().st_size
+	except OSError:
+		return VerifyResult(jar, ["missing from the jar store"])
+
+	problems = []
+	if size != jar["size"]:
+		problems.append(f"is {size} bytes instead of {jar['size']}")
+
+	expected = upstream_hash(jar.get("resolution"), "sha256")
+	hash_names = ["sha256"] if expected is None or expected["name"] == "sha256" else ["sha256", expected["name"]]
+	digests = hash_file_multi(obj, hash_names)
+
+	if digests["sha256"] != jar["sha256"]:
+		problems.append(f"has SHA-256 {digests['sha256']} instead of {jar['sha256']}")
+	if expected is not None and digests[expected["name"]].lower() != expected["digest"].lower():
+		problems.append(f"has {expected['name']} {digests[expected['name']]}, but its Mod Provider published {expected['digest']}")
+
+	return VerifyResult(jar, problems)
+
+def verify_jars(store: JarStore, jars: List[Dict], jobs: int) -> List[VerifyResult]:
+	"""Verifies jars with up to jobs threads, returning one VerifyResult per jar in order.
+	"""
+	with ThreadPoolExecutor(max_workers=jobs) as executor:
+		return list(executor.map(lambda jar: verify_jar(store, jar), jars))
@@ -0,0 +1,116 @@
+import os, time
+
+import requests
+
+from standin import redirect_session
+
+from mcmm.cache import ResponseCache
+from mcmm.session import ProviderSession
+
+URL = "https://api.modrinth.com/v2/projects?ids=%5B%22benchmod1%22%5D"
+
+def _session(standin, cache: ResponseCache) -> ProviderSession:
+	session = ProviderSession(cache=cache)
+	redirect_session(session, standin)
+	return session
+
+def test_fresh_responses_are_not_requested(standin, tmp_path):
+	"""Responses are answered from the cache until their time-to-live is over.
+	"""
+	session = _session(standin, ResponseCache(tmp_path / "http", ttl=60))
+	standin.reset_stats()
+
+	first = session.get_cached(URL)
+	second = session.get_cached(URL)
+
+	assert second.json() == first.json()
+	assert standin.requests == 1
+	assert session.http_stats.cache == {"hits": 1, "revalidated": 0, "misses": 1}
+
+def test_expired_responses_are_revalidated(standin, tmp_path):
+	"""Expired responses are revalidated with their ETag, which the server answers with an empty 304 if nothing changed.
+	"""
+	session = _session(standin, ResponseCache(tmp_path / "http", ttl=0))
+	first = session.get_cached(URL)
+	standin.reset_stats()
+
+	second = session.get_cached(URL)
+	assert second.status_code == 200
+	assert second.json() == first.json()
+	assert standin.requests == 1
+	assert standin.bytes_sent == 0
+	assert session.http_stats.cache["revalidated"] == 1
+
+	session.refresh_cache = True
+	session.cache.ttl = 60
+	session.get_cached(URL)
+	assert session.http_stats.cache["revalidated"] == 2
+
+def test_post_cached_keys_on_body(standin, tmp_path):
+	"""Read-only POST lookups are cached per JSON body.
+	"""
+	session = _session(standin, ResponseCache(tmp_path / "http", ttl=60))
+	url = "https://api.modrinth.com/v2/version_files/update"
+	body = {"hashes": [], "algorithm": "sha1", "loaders": ["fabric"], "game_versions": ["1.18.1"]}
+	standin.reset_stats()
+
+	session.post_cached(url, body)
+	session.post_cached(url, dict(body))
+	session.post_cached(url, dict(body, loaders=["forge"]))
+	assert standin.requests == 2
+
+def _response(url: str, body: bytes) -> requests.Response:
+	r = requests.Response()
+	r.status_code = 200
+	r.url = url
+	r.headers["ETag"] = '"1"'
+	r._content = body
+	return r
+
+def test_eviction(tmp_path):
+	"""The least recently used entries are removed once the cache outgrows max_size, and loading an entry counts as using it.
+	"""
+	cache = ResponseCache(tmp_path / "http", max_size=10 ** 9)
+	for i in range(3):
+		cache.save(f"https://example.com/{i}", _response(f"https://example.com/{i}", b"x" * 1000))
+	entry_size = cache._entry_path("https://example.com/0").stat().st_size
+
+	# Make 0 the oldest entry and use it, so that 1 is the least recently used one
+	past = time.time() - 100
+	for i in range(3):
+		os.utime(str(cache._entry_path(f"https://example.com/{i}")), (past + i, past + i))
+	assert cache.load("https://example.com/0") is not None
+
+	cache.max_size = entry_size * 2 + entry_size // 2
+	cache.evict()
+	assert cache.load("https://example.com/1") is None
+	assert cache.load("https://example.com/0") is not None
+	assert cache.load("https://example.com/2") is not None
+
+	entry = cache.load("https://example.com/2")
+	assert cache.to_response(entry).content == b"x" * 1000
+	assert cache.to_response(entry).headers["etag"] == '"1"'
+
+def test_save_tracks_size(tmp_path):
+	"""Saving only scans the cache dir the first time and once the saved responses outgrow max_size.
+	"""
+	cache = ResponseCache(tmp_path / "http", max_size=10 ** 9)
+	scans = []
+	evict = cache.evict
+	cache.evict = lambda: scans.append(1) or evict()
+
+	for i in range(10):
+		cache.save(f"https://example.com/{i}", _response(f"https://example.com/{i}", b"x" * 1000))
+	assert len(scans) == 1
+	entry_size = cache._entry_path("https://example.com/0").stat().st_size
+
+	# Entries differ in size by a few bytes (their URL and time), which half an entry of room leaves no say in when eviction starts
+	cache.max_size = entry_size * 12 + entry_size // 2
+	cache.save("https://example.com/0", _response("https://example.com/0", b"x" * 1000))
+	cache.save("https://example.com/10", _response("https://example.com/10", b"x" * 1000))
+	assert len(scans) == 1
+
+	for i in range(11, 14):
+		cache.save(f"https://example.com/{i}", _response(f"https://example.com/{i}", b"x" * 1000))
+	assert len(scans) == 2
+	assert len(list(cache.cache_dir.glob("*.json"))) <= 12
@@ -0,0 +1,111 @@
+import hashlib
+
+import pytest
+import requests
+
+from mcmm import fetch
+from mcmm.fetch import NO_RETRY, RetryPolicy, RetryStats, stream_to_file
+
+JAR_SIZE = 4096
+
+@pytest.fixture
+def faults(standin):
+	"""The stand-in server with no queued faults, and the URL and contents of its jar.
+	"""
+	standin.faults, standin.faults_etag, standin.faults_requests = [], '"1"', []
+	yield standin
+	standin.faults = []
+
+def _url(server) -> str:
+	return f"{server.url}/faults/flaky.jar"
+
+def _content(server) -> bytes:
+	return server.jar(f"flaky.jar{server.faults_etag}")
+
+@pytest.fixture
+def sleeps(monkeypatch):
+	"""Records the delays between retries instead of sleeping.
+	"""
+	delays = []
+	monkeypatch.setattr(fetch.time, "sleep", delays.append)
+	return delays
+
+def test_resume_after_drop(faults, tmp_path, sleeps):
+	"""A transfer that breaks off is retried from where it stopped, if the jar is still the same.
+	"""
+	faults.faults = [("drop", 1024)]
+	session = requests.Session()
+	session.retry_stats = RetryStats()
+
+	result = stream_to_file(_url(faults), tmp_path / "flaky.jar", session=session, chunk_size=256, retry=RetryPolicy(retries=1))
+
+	assert result.path.read_bytes() == _content(faults)
+	assert result.size == JAR_SIZE
+	assert result.digest == hashlib.sha256(_content(faults)).hexdigest()
+	assert faults.faults_requests[1]["Range"] == "bytes=1024-"
+	assert faults.faults_requests[1]["If-Range"] == '"1"'
+	assert (session.retry_stats.retries, session.retry_stats.resumed, session.retry_stats.resumed_bytes) == (1, 1, 1024)
+	assert not (tmp_path / "flaky.jar.part").exists()
+	assert not (tmp_path / "flaky.jar.part.json").exists()
+
+def test_resume_in_next_run(faults, tmp_path):
+	"""A .part file left by a failed download is resumed by the next download of the same jar.
+	"""
+	faults.faults = [("drop", 1024)]
+	with pytest.raises(requests.RequestException):
+		stream_to_file(_url(faults), tmp_path / "flaky.jar", chunk_size=256, retry=NO_RETRY)
+	assert (tmp_path / "flaky.jar.part").stat().st_size == 1024
+	assert not (tmp_path / "flaky.jar").exists()
+
+	result = stream_to_file(_url(faults), tmp_path / "flaky.jar", chunk_size=256, retry=NO_RETRY)
+	assert result.path.read_bytes() == _content(faults)
+	assert faults.faults_requests[1]["Range"] == "bytes=1024-"
+
+def test_changed_validator_restarts(faults, tmp_path):
+	"""A .part file of a jar that changed since is thrown away and the jar downloaded from the start.
+	"""
+	faults.faults = [("drop", 1024)]
+	with pytest.raises(requests.RequestException):
+		stream_to_file(_url(faults), tmp_path / "flaky.jar", chunk_size=256, retry=NO_RETRY)
+
+	old_content = _content(faults)
+	faults.faults_etag = '"2"'
+	result = stream_to_file(_url(faults), tmp_path / "flaky.jar", chunk_size=256, retry=NO_RETRY)
+
+	assert faults.faults_requests[1]["If-Range"] == '"1"'
+	assert result.path.read_bytes() == _content(faults) != old_content
+	assert result.digest == hashlib.sha256(_content(faults)).hexdigest()
+
+def test_retry_after(faults, tmp_path, sleeps):
+	"""429 and 503 responses are retried after the server's Retry-After, up to the policy's max_backoff.
+	"""
+	faults.faults = [("status", 429, "3"), ("status", 503, "120"), ("status", 503, None)]
+	result = stream_to_file(_url(faults), tmp_path / "flaky.jar", retry=RetryPolicy(retries=3, backoff=0.5, max_backoff=30.0))
+
+	assert result.path.read_bytes() == _content(faults)
+	assert sleeps[:2] == [3.0, 30.0]
+	assert 0 <= sleeps[2] <= 2.0
+	assert len(faults.faults_requests) == 4
+
+def test_final_status(faults, tmp_path, sleeps):
+	"""Error statuses that retrying can't fix fail at once, and so does the last allowed retry.
+	"""
+	faults.faults = [("status", 404, None)]
+	with pytest.raises(requests.HTTPError):
+		stream_to_file(_url(faults), tmp_path / "flaky.jar", retry=RetryPolicy(retries=3))
+	assert sleeps == []
+
+	faults.faults = [("status", 503, "1")] * 3
+	with pytest.raises(requests.HTTPError):
+		stream_to_file(_url(faults), tmp_path / "flaky.jar", retry=RetryPolicy(retries=2))
+	assert sleeps == [1.0, 1.0]
+	assert not (tmp_path / "flaky.jar").exists()
+
+def test_retry_policy_delay():
+	"""Delays without Retry-After are jittered below an exponentially growing cap.
+	"""
+	policy = RetryPolicy(retries=5, backoff=1.0, max_backoff=6.0)
+	for attempt, cap in ((1, 1.0), (2, 2.0), (3, 4.0), (4, 6.0), (10, 6.0)):
+		assert all(0 <= policy.delay(attempt) <= cap for _ in range(50))
+	assert policy.delay(1, retry_after=2.5) == 2.5
+	assert policy.delay(1, retry_after=60) == 6.0
@@ -0,0 +1,92 @@
+import subprocess, sys
+
+import pytest
+
+from mcmm import github
+from mcmm.github import GitHubModProvider
+
+REPO = "owner/repo"
+
+BUILD_SCRIPT = """
+import pathlib, sys
+out = pathlib.Path(sys.argv[1])
+out.mkdir(parents=True, exist_ok=True)
+for name in sys.argv[2:]:
+	(out / name).write_bytes(name.encode())
+print("built", sys.argv[2:])
+"""
+
+def _git(*args, cwd):
+	subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com"] + list(args), cwd=str(cwd), check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+@pytest.fixture
+def commit(tmp_path, monkeypatch) -> str:
+	"""A commit of REPO with a build script, already in the provider's mirror of REPO, so building it needs no network.
+	"""
+	save_dir = tmp_path / "github"
+	monkeypatch.setattr(github, "save_dir", save_dir)
+	monkeypatch.setattr(github, "repos_dir", save_dir / "repos")
+	monkeypatch.setattr(github, "builds_dir", save_dir / "builds")
+	monkeypatch.setattr(github, "worktrees_dir", save_dir / "worktrees")
+	monkeypatch.setattr(github, "build_logs_dir", save_dir / "logs")
+
+	source = tmp_path / "source"
+	source.mkdir()
+	(source / "build.py").write_text(BUILD_SCRIPT)
+	_git("init", "-q", cwd=source)
+	_git("add", "build.py", cwd=source)
+	_git("commit", "-q", "-m", "build script", cwd=source)
+
+	mirror = save_dir / "repos" / (REPO.replace("/", "__") + ".git")
+	mirror.parent.mkdir(parents=True)
+	_git("clone", "-q", "--bare", str(source), str(mirror), cwd=tmp_path)
+	return subprocess.run(["git", "rev-parse", "HEAD"], cwd=str(source), stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout.strip()
+
+@pytest.fixture
+def provider():
+	"""A provider made without a ProviderRunner, so it has no options.
+	"""
+	return GitHubModProvider()
+
+def _info(dir: str, *jars: str) -> dict:
+	return {"branch": "main", "command": [sys.executable, "build.py", dir] + list(jars), "dir": dir, "must_contain": [], "must_not_contain": []}
+
+def test_compile(provider, commit, tmp_path):
+	"""A commit is built once per command and dir, and each build has its own log.
+	"""
+	first, err_str = provider._compile(REPO, _info("out", "mod-1.0.jar"), commit, tmp_path / "incoming/a-mod.jar")
+	assert err_str == ""
+	assert first.name == "mod-1.0.jar"
+	assert first.read_bytes() == b"mod-1.0.jar"
+
+	second, err_str = provider._compile(REPO, _info("build/libs", "mod-1.0.jar"), commit, tmp_path / "incoming/b-mod.jar")
+	assert err_str == ""
+	assert second != first
+
+	assert len(list(github.builds_dir.iterdir())) == 2
+	logs = sorted(github.build_logs_dir.iterdir())
+	assert len(logs) == 2
+	assert all("built ['mod-1.0.jar']" in log.read_text() for log in logs)
+
+	# An unchanged build is reused
+	again, err_str = provider._compile(REPO, _info("out", "mod-1.0.jar"), commit, tmp_path / "incoming/c-mod.jar")
+	assert err_str == ""
+	assert len(list(github.build_logs_dir.iterdir())) == 2
+	assert list(github.worktrees_dir.iterdir()) == []
+
+def test_compile_without_jars(provider, commit, tmp_path):
+	"""A build that succeeds without leaving any jars fails its entry and is not kept for the next run.
+	"""
+	builds = []
+	run_build = provider._run_build
+	provider._run_build = lambda *args: builds.append(args) or run_build(*args)
+
+	_, err_str = provider._compile(REPO, _info("out"), commit, tmp_path / "incoming/a-mod.jar")
+	assert "left no jars in out" in err_str
+	assert list(github.builds_dir.glob("*")) == []
+
+	# The next run builds the commit again
+	_, err_str = provider._compile(REPO, _info("out"), commit, tmp_path / "incoming/b-mod.jar")
+	assert "left no jars" in err_str
+	assert len(builds) == 2
+	assert list(github.worktrees_dir.iterdir()) == []
@@ -0,0 +1,94 @@
+import zipfile
+from json import dumps
+
+from mcmm.jarindex import JarIndex, parse_toml_subset, read_jar_metadata
+from mcmm.store import JarStore
+
+MODS_TOML = '''
+modLoader = "javafml" # the loader
+loaderVersion = "[40,)"
+license = "MIT"
+
+[[mods]]
+modId = "forgemod"
+version = "${file.jarVersion}"
+displayName = "Forge Mod"
+description = \'\'\'
+A description
+over = several lines
+\'\'\'
+
+[[dependencies.forgemod]]
+modId = "forge"
+versionRange = "[40.1,)"
+
+[[dependencies.forgemod]]
+modId = "minecraft"
+versionRange = "[1.18.2,1.19)"
+'''
+
+def _jar(path, files):
+	with zipfile.ZipFile(str(path), "w") as zf:
+		for name, content in files.items():
+			zf.writestr(name, content)
+	return path
+
+def _fabric_jar(path, mod_id="fabricmod"):
+	return _jar(path, {"fabric.mod.json": dumps({
+		"id": mod_id,
+		"name": "Fabric Mod",
+		"version": "1.2.3",
+		"depends": {"minecraft": ["1.18.1", "1.18.2"], "fabricloader": ">=0.12"},
+	})})
+
+def test_read_jar_metadata(tmp_path):
+	entries, mods, error = read_jar_metadata(_fabric_jar(tmp_path / "fabric.jar"))
+	assert (entries, error) == (1, None)
+	assert [tuple(mod) for mod in mods] == [("fabric", "fabricmod", "Fabric Mod", "1.2.3", "1.18.1 || 1.18.2", ">=0.12")]
+
+	forge_jar = _jar(tmp_path / "forge.jar", {
+		"META-INF/mods.toml": MODS_TOML,
+		"META-INF/MANIFEST.MF": "Manifest-Version: 1.0\nImplementation-Version: 4.5.6\n",
+	})
+	_, mods, error = read_jar_metadata(forge_jar)
+	assert error is None
+	assert [tuple(mod) for mod in mods] == [("forge", "forgemod", "Forge Mod", "4.5.6", "[1.18.2,1.19)", "[40.1,)")]
+
+	(tmp_path / "broken.jar").write_bytes(b"not a zip")
+	entries, mods, error = read_jar_metadata(tmp_path / "broken.jar")
+	assert (entries, mods) == (0, [])
+	assert error.startswith("BadZipFile")
+
+def test_parse_toml_subset():
+	toml = parse_toml_subset(MODS_TOML)
+	assert toml["loaderVersion"] == "[40,)"
+	assert toml["modLoader"] == "javafml"
+	assert "over" not in toml["mods"][0]
+	assert [dependency["modId"] for dependency in toml["dependencies"]["forgemod"]] == ["forge", "minecraft"]
+	assert parse_toml_subset('a = 1\nb = 1.5\nc = true\nd = \'x # y\'\ne = "q\\"r"') == {"a": 1, "b": 1.5, "c": True, "d": "x # y", "e": 'q"r'}
+
+def test_update_and_find(tmp_path):
+	"""Jars are indexed once, and only indexed again or dropped when the store changes.
+	"""
+	store = JarStore(tmp_path / "store")
+	sha256, size = store.add(_fabric_jar(tmp_path / "fabric.jar"))
+	store.save_manifest("profile", [{"file_name": "fabric-1.2.3.jar", "sha256": sha256, "size": size}])
+
+	index = JarIndex(tmp_path / "index.sqlite3")
+	try:
+		assert tuple(index.update(store)) == (1, 0, 1)
+		assert tuple(index.update(store)) == (0, 0, 1)
+		assert index.counts() == (1, 1)
+
+		found = index.find_mod("FABRICMOD")
+		assert [(row["profile"], row["file_name"], row["version"]) for row in found] == [("profile", "fabric-1.2.3.jar", "1.2.3")]
+		assert index.find_mod("fabric mod", version="9.9") == []
+		assert [row["mod_id"] for row in index.find_jar("fabric-1.2")] == ["fabricmod"]
+		assert [row["mod_id"] for row in index.find_jar(sha256[:8])] == ["fabricmod"]
+
+		store.manifest_path("profile").unlink()
+		store.gc()
+		assert tuple(index.update(store)) == (0, 1, 0)
+		assert index.counts() == (0, 0)
+	finally:
+		index.close()
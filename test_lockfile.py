@@ -0,0 +1,74 @@
+from json import dump
+
+import pytest
+
+from mcmm.commands import _jar_store, download, lock
+from mcmm.lockfile import load_lock, lock_path, profile_digest
+
+def test_lock_and_download_locked(home, switch_home, provider_runner, standin, profile):
+	"""A lock file pins every jar, so download --locked only fetches the jars and asks no Mod Provider's API.
+	"""
+	lock(profile, provider_runner)
+	lock_file = lock_path(home / ".config/mcmm", profile)
+	lock_obj = load_lock(lock_file)
+	assert len(lock_obj["mods"]) == 4
+	assert all(len(mod["sha256"]) == 64 for mod in lock_obj["mods"])
+
+	# In a new home, with the same profile and lock file but nothing downloaded
+	new_home = switch_home(home.parent / "new_home")
+	(new_home / ".config/mcmm/profiles").mkdir(parents=True)
+	for file in (f"{profile}.json", f"{profile}.lock.json"):
+		(new_home / ".config/mcmm/profiles" / file).write_bytes((home / ".config/mcmm/profiles" / file).read_bytes())
+
+	standin.reset_stats()
+	download(profile, provider_runner, locked=True)
+	assert standin.requests == 4
+	jars = _jar_store().load_manifest(profile)["jars"]
+	assert sorted(jar["sha256"] for jar in jars) == sorted(mod["sha256"] for mod in lock_obj["mods"])
+
+	standin.reset_stats()
+	download(profile, provider_runner, locked=True)
+	assert standin.requests == 0
+
+def test_profile_digest():
+	"""Only the Minecraft version and entries of a profile change its digest.
+	"""
+	profile_obj = {"minecraft_version": "1.18.1", "mods": [{"provider": "modrinth", "metadata": {"id": "a"}}]}
+	assert profile_digest(profile_obj) == profile_digest(dict(profile_obj, description="unrelated"))
+	assert profile_digest(profile_obj) != profile_digest(dict(profile_obj, minecraft_version="1.18.2"))
+
+def test_unsupported_lock_version(tmp_path):
+	lock_file = tmp_path / "profile.lock.json"
+	with lock_file.open("w") as f:
+		dump({"version": 99, "mods": []}, f)
+	with pytest.raises(ValueError):
+		load_lock(lock_file)
+
+def test_download_keeps_locked_jars(provider_runner, profile):
+	"""The jars that lock fetched survive the garbage collection of a download that does not use them.
+	"""
+	from mcmm.commands import _config_dir
+
+	lock(profile, provider_runner)
+	locked = [mod["sha256"] for mod in load_lock(lock_path(_config_dir(), profile))["mods"]]
+
+	with (_config_dir() / "profiles/other.json").open("w") as f:
+		dump({"minecraft_version": "1.18.1", "mods": []}, f)
+	download("other", provider_runner)
+
+	assert all(_jar_store().has_object(sha256) for sha256 in locked)
+
+def test_lock_without_minecraft_version(home, provider_runner, capsys):
+	"""A profile without a Minecraft version is not locked, unless --mc-version gives one.
+	"""
+	profile_file = home / ".config/mcmm/profiles/versionless.json"
+	profile_file.parent.mkdir(parents=True)
+	with profile_file.open("w") as f:
+		dump({"mods": []}, f)
+
+	lock("versionless", provider_runner)
+	assert "does not define a Minecraft version" in capsys.readouterr().out
+	assert not lock_path(home / ".config/mcmm", "versionless").exists()
+
+	lock("versionless", provider_runner, mc_version_override="1.18.1")
+	assert load_lock(lock_path(home / ".config/mcmm", "versionless"))["mods"] == []
@@ -0,0 +1,71 @@
+import pytest
+
+from mcmm.commands import _jar_store, download, mirror
+from mcmm.mirror import MirrorSource, object_path
+
+def _mirrored_profile(profile, provider_runner, mirror_dir):
+	"""Mirrors profile into mirror_dir and returns its manifest.
+	"""
+	mirror([profile], provider_runner, mirror_dir=mirror_dir)
+	download(profile, provider_runner)
+	return sorted(_jar_store().load_manifest(profile)["jars"], key=lambda jar: jar["file_name"])
+
+def _download_in_new_home(home, switch_home, provider_runner, source, standin):
+	new_home = switch_home(home.parent / "new_home")
+
+	standin.reset_stats()
+	download("standin", provider_runner, mirror=source)
+	return new_home
+
+def _check_jars(expected):
+	manifest = _jar_store().load_manifest("standin")
+	assert manifest is not None
+	jars = sorted(manifest["jars"], key=lambda jar: jar["file_name"])
+	assert [(jar["file_name"], jar["sha256"]) for jar in jars] == [(jar["file_name"], jar["sha256"]) for jar in expected]
+	assert all(_jar_store().object_path(jar["sha256"]).exists() for jar in jars)
+
+def test_mirror_folder_round_trip(home, switch_home, provider_runner, standin, profile, tmp_path):
+	"""A profile mirrored into a folder downloads from that folder alone, and is added to the config dir.
+	"""
+	mirror_dir = tmp_path / "mirror"
+	expected = _mirrored_profile(profile, provider_runner, mirror_dir)
+	assert len(expected) == 4
+
+	new_home = _download_in_new_home(home, switch_home, provider_runner, MirrorSource(str(mirror_dir)), standin)
+	assert (new_home / ".config/mcmm/profiles/standin.json").exists()
+	assert standin.requests == 0
+	_check_jars(expected)
+
+def test_mirror_http_round_trip(home, switch_home, provider_runner, standin, profile, tmp_path):
+	"""A mirror served over HTTP downloads the same jars as the folder it was made in.
+	"""
+	mirror_dir = tmp_path / "mirror"
+	expected = _mirrored_profile(profile, provider_runner, mirror_dir)
+
+	standin.mirror_dir = mirror_dir
+	try:
+		_download_in_new_home(home, switch_home, provider_runner, MirrorSource(f"{standin.url}/mirror", session=provider_runner.session), standin)
+	finally:
+		standin.mirror_dir = None
+	# index.json is not needed for a single profile, so only its file and jars are requested
+	assert standin.requests == 1 + len(expected)
+	_check_jars(expected)
+
+def test_mirror_rejects_paths(provider_runner, profile, tmp_path):
+	"""Names and hashes from a mirror never reach a path outside of it.
+	"""
+	mirror_dir = tmp_path / "mirror"
+	_mirrored_profile(profile, provider_runner, mirror_dir)
+	source = MirrorSource(str(mirror_dir))
+
+	for name in ("../standin", "a/b", "a\\b", ".."):
+		with pytest.raises(ValueError):
+			source.load_profile(name)
+	for sha256 in ("../" * 20 + "abcd", "A" * 64, "0" * 63):
+		with pytest.raises(ValueError):
+			object_path(sha256)
+
+	profile_file = mirror_dir / "profiles/standin.json"
+	profile_file.write_text(profile_file.read_text().replace('"sha256": "', '"sha256": "../', 1))
+	with pytest.raises(ValueError):
+		source.load_profile("standin")
@@ -0,0 +1,229 @@
+from json import loads
+from urllib.parse import parse_qs, urlparse
+
+from mcmm.commands import _dependency_entries, _mod_key, _split_dependencies
+from mcmm.modrinth import ModrinthModProvider
+
+MC_VERSION = "1.20.1"
+
+def _version(version_id, project_id, dependencies=(), date="2023-01-01"):
+	return {
+		"id": version_id,
+		"project_id": project_id,
+		"name": project_id,
+		"version_number": version_id,
+		"version_type": "release",
+		"loaders": ["fabric"],
+		"game_versions": [MC_VERSION],
+		"date_published": date,
+		"dependencies": list(dependencies),
+		"files": [{"filename": f"{version_id}.jar", "url": f"https://cdn.example/{version_id}.jar", "size": 1, "hashes": {}}],
+	}
+
+def _required(project_id=None, version_id=None):
+	return {"project_id": project_id, "version_id": version_id, "dependency_type": "required"}
+
+def _incompatible(project_id):
+	return {"project_id": project_id, "version_id": None, "dependency_type": "incompatible"}
+
+class _Response:
+	def __init__(self, obj, status_code=200):
+		self.obj = obj
+		self.status_code = status_code
+
+	def json(self):
+		return self.obj
+
+	def raise_for_status(self):
+		pass
+
+class _CannedSession:
+	"""Answers /projects, /versions and /project/{id}/version from canned versions, and /version_files/update with nothing.
+	"""
+	def __init__(self, versions):
+		self.versions = {version["id"]: version for version in versions}
+		self.projects = {}
+		for version in versions:
+			project = self.projects.setdefault(version["project_id"], {"id": version["project_id"], "slug": f"{version['project_id']}-slug", "versions": []})
+			project["versions"].append(version["id"])
+		self.urls = []
+
+	def get_cached(self, url):
+		self.urls.append(url)
+		parsed = urlparse(url)
+		query = {key: loads(value[0]) for key, value in parse_qs(parsed.query).items()}
+		if parsed.path.endswith("/version"):
+			_id = parsed.path.split("/")[-2]
+			project = self.projects.get(_id) or {project["slug"]: project for project in self.projects.values()}.get(_id)
+			if project is None:
+				return _Response(None, 404)
+			return _Response([
+				version for version in (self.versions[v] for v in project["versions"])
+				if set(version["loaders"]) & set(query["loaders"]) and set(version["game_versions"]) & set(query["game_versions"])
+			])
+
+		ids = query["ids"]
+		if parsed.path.endswith("/projects"):
+			by_slug = {project["slug"]: project for project in self.projects.values()}
+			return _Response([self.projects.get(_id) or by_slug[_id] for _id in ids if _id in self.projects or _id in by_slug])
+		return _Response([self.versions[_id] for _id in ids if _id in self.versions])
+
+	def post_cached(self, url, json):
+		return _Response({})
+
+def _entry(project_id):
+	return {
+		"provider": "modrinth",
+		"metadata": {
+			"id": project_id,
+			"allow_prereleases": False,
+			"mod_loader": "fabric",
+			"must_contain": [],
+			"must_not_contain": [],
+			"dependencies": True,
+		},
+	}
+
+def _resolve(versions, mods):
+	provider = ModrinthModProvider()
+	provider.session = _CannedSession(versions)
+	return provider.resolve_batch([{"mc_version": MC_VERSION, "metadata": mod["metadata"], "previous": None} for mod in mods])
+
+def _profile(versions, mods):
+	"""Resolves mods like download does, returning (dependency entries, conflicts by key, results).
+	"""
+	results = _resolve(versions, mods)
+	keys = [_mod_key(mod, MC_VERSION) for mod in mods]
+	dependencies, conflicts = _dependency_entries(mods, dict(zip(keys, _split_dependencies(results))), MC_VERSION)
+	return (dependencies, {mods[keys.index(key)]["metadata"]["id"]: err for key, err in conflicts.items()}, results)
+
+def test_cycle():
+	"""Mods that require each other are each resolved once.
+	"""
+	versions = [
+		_version("a1", "a", [_required("b")]),
+		_version("b1", "b", [_required("a")]),
+	]
+	(resolution, err), = _resolve(versions, [_entry("a")])
+
+	assert err == ""
+	assert [dependency["resolution"]["version_id"] for dependency in resolution["dependencies"]] == ["b1"]
+	assert resolution["dependencies"][0]["provides"] == ["b", "b-slug", "b1"]
+	assert resolution["dependencies"][0]["metadata"]["dependencies"] == False
+
+def test_shared_dependency():
+	"""A mod that two entries require is downloaded once, and not at all if the profile has an entry for it.
+	"""
+	versions = [
+		_version("a1", "a", [_required("c")]),
+		_version("b1", "b", [_required("c")]),
+		_version("c0", "c", date="2022-01-01"),
+		_version("c1", "c"),
+	]
+	dependencies, conflicts, results = _profile(versions, [_entry("a"), _entry("b")])
+	assert conflicts == {}
+	assert [resolution["version_id"] for _, resolution in dependencies] == ["c1"]
+	assert all("dependencies" not in resolution for resolution, _ in results)
+
+	dependencies, conflicts, _ = _profile(versions, [_entry("a"), _entry("b"), _entry("c")])
+	assert conflicts == {}
+	assert dependencies == []
+
+def test_pinned_version_conflict():
+	"""Two mods that pin different versions of the same mod conflict, both within an entry and between entries.
+	"""
+	versions = [
+		_version("a1", "a", [_required(version_id="c1"), _required("b")]),
+		_version("b1", "b", [_required(version_id="c2")]),
+		_version("c1", "c"),
+		_version("c2", "c"),
+		_version("d1", "d", [_required(version_id="c1")]),
+		_version("e1", "e", [_required(version_id="c2")]),
+	]
+	(_, err), = _resolve(versions, [_entry("a")])
+	assert "requires c c2" in err
+
+	dependencies, conflicts, _ = _profile(versions, [_entry("d"), _entry("e"), _entry("b")])
+	assert set(conflicts) == {"d", "e", "b"}
+	assert dependencies == []
+
+def test_incompatibility():
+	"""A mod that declares another one incompatible fails the entries that would install both.
+	"""
+	versions = [
+		_version("a1", "a", [_required("b")]),
+		_version("b1", "b", [_incompatible("a")]),
+		_version("c1", "c", [_incompatible("d")]),
+		_version("d1", "d"),
+		_version("e1", "e", [_required("f")]),
+		_version("f1", "f"),
+	]
+	(_, err), = _resolve(versions, [_entry("a")])
+	assert "incompatible" in err
+
+	dependencies, conflicts, _ = _profile(versions, [_entry("c"), _entry("d"), _entry("e")])
+	assert set(conflicts) == {"c", "d"}
+	assert [resolution["version_id"] for _, resolution in dependencies] == ["f1"]
+
+def test_dependencies_are_opt_in():
+	"""Entries without "dependencies" (like those of profiles made before they were resolved) get none.
+	"""
+	versions = [
+		_version("a1", "a", [_required("b")]),
+		_version("b1", "b"),
+	]
+	mod = _entry("a")
+	del mod["metadata"]["dependencies"]
+	(resolution, err), = _resolve(versions, [mod])
+
+	assert err == ""
+	assert "dependencies" not in resolution
+	assert resolution["provides"] == ["a", "a1"]
+
+def test_only_matching_versions_are_listed():
+	"""Entries and dependencies are resolved from listings that Modrinth filters by loader and Minecraft version, never from a project's whole history.
+	"""
+	versions = [
+		_version("a0", "a", date="2022-01-01"),
+		dict(_version("a1", "a", [_required("b")]), game_versions=["1.19.2"]),
+		_version("a2", "a", [_required("b")]),
+		_version("b1", "b"),
+		dict(_version("b2", "b"), loaders=["forge"]),
+	]
+	provider = ModrinthModProvider()
+	provider.session = _CannedSession(versions)
+	(resolution, err), = provider.resolve_batch([{"mc_version": MC_VERSION, "metadata": _entry("a")["metadata"], "previous": None}])
+
+	assert err == ""
+	assert resolution["version_id"] == "a2"
+	assert [dependency["resolution"]["version_id"] for dependency in resolution["dependencies"]] == ["b1"]
+
+	listings = [parse_qs(urlparse(url).query) for url in provider.session.urls if urlparse(url).path.endswith("/version")]
+	assert len(listings) == 2
+	assert all(loads(query["loaders"][0]) == ["fabric"] and loads(query["game_versions"][0]) == [MC_VERSION] for query in listings)
+	assert not any(urlparse(url).path.endswith("/versions") for url in provider.session.urls)
+
+def test_shared_dependency_of_different_entries():
+	"""Entries that differ in more than their id share one copy of a dependency, which is a release even for entries that allow
+	prereleases, and entries that need different jars of the same dependency conflict.
+	"""
+	versions = [
+		_version("a1", "a", [_required("c")]),
+		_version("b1", "b", [_required("c")]),
+		_version("c1", "c"),
+		dict(_version("c2", "c", date="2023-02-01"), version_type="beta"),
+		dict(_version("d1", "d", [_required("c")]), loaders=["forge"]),
+		dict(_version("c1-forge", "c"), loaders=["forge"]),
+	]
+	a, b, d = _entry("a"), _entry("b"), _entry("d")
+	b["metadata"]["allow_prereleases"] = True
+	d["metadata"]["mod_loader"] = "forge"
+
+	dependencies, conflicts, _ = _profile(versions, [a, b])
+	assert conflicts == {}
+	assert [resolution["version_id"] for _, resolution in dependencies] == ["c1"]
+	assert dependencies[0][0]["metadata"]["allow_prereleases"] == False
+
+	dependencies, conflicts, _ = _profile(versions, [a, d])
+	assert set(conflicts) == {"a", "d"}
+	assert dependencies == []
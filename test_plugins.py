@@ -0,0 +1,228 @@
+import textwrap, time, types
+
+import pytest
+
+from standin import MC_VERSION
+
+from mcmm.plugin import AsyncFetchHandler, AsyncResolveHandler
+from mcmm.plugin_internal import load_providers
+
+PROPERTY_ID_PROVIDER = """
+from mcmm.plugin import MCMMPlugin, PluginBase, ResolveHandler
+
+@MCMMPlugin
+class PropertyIdProvider(PluginBase):
+	help_string = "A provider whose id is a property"
+
+	@property
+	def id(self):
+		return "property_id"
+
+	@ResolveHandler
+	def resolve(self, mc_version, metadata):
+		return ({"file_name": "a.jar", "url": "https://example.com/a.jar"}, "")
+
+	def broken(self):
+		pass
+	broken._is_mcmm_handler = True
+	broken._mcmm_event = "not_an_event"
+"""
+
+def test_registry_of_cached_module(tmp_path, monkeypatch, capsys):
+	"""A provider whose id is a property is registered under it, and the errors of its module are shown whether it was cached or not.
+	"""
+	(tmp_path / "property_id_provider.py").write_text(textwrap.dedent(PROPERTY_ID_PROVIDER))
+	monkeypatch.syspath_prepend(str(tmp_path))
+	registry_file = tmp_path / "providers.json"
+
+	for _ in range(2):
+		runner = load_providers(["property_id_provider"], registry_file=registry_file)
+		assert runner.can_resolve("property_id")
+		assert runner.resolve("property_id", "1.18.1", {}) == ({"file_name": "a.jar", "url": "https://example.com/a.jar"}, "")
+		runner.close()
+		assert "invalid event type 'not_an_event'" in capsys.readouterr().out
+
+def test_fetch_handlers_write_to_out_file(provider_runner, tmp_path):
+	"""The fetch handlers of the internal providers write to the path they are given, never to a shared one.
+	"""
+	entries = [
+		("optifine", {"allow_prerelease": False}),
+		("github", {"repo": "bench/ghmod10", "releases": {"latest": True, "tag": None, "must_contain": [], "must_not_contain": []}, "compile": None}),
+	]
+	for provider_id, metadata in entries:
+		resolution, err_str = provider_runner.resolve(provider_id, MC_VERSION, metadata)
+		assert err_str == ""
+
+		results = [provider_runner.fetch(provider_id, resolution, tmp_path / provider_id / f"{i}.jar") for i in range(2)]
+		assert [err_str for _, err_str in results] == ["", ""]
+		assert [result.path for result, _ in results] == [tmp_path / provider_id / "0.jar", tmp_path / provider_id / "1.jar"]
+		assert results[0][0].digest == results[1][0].digest
+
+def test_file_fetch_same_name(provider_runner, tmp_path):
+	"""Local files with the same name are fetched to their own out_file, so neither overwrites the other.
+	"""
+	results = []
+	for source in ("a", "b"):
+		file = tmp_path / source / "mod.jar"
+		file.parent.mkdir()
+		file.write_bytes(source.encode())
+		resolution, err_str = provider_runner.resolve("file", MC_VERSION, {"file_path": str(file)})
+		assert err_str == ""
+		results.append(provider_runner.fetch("file", resolution, tmp_path / "incoming" / f"{source}.jar"))
+
+	assert [err_str for _, err_str in results] == ["", ""]
+	assert [result.path.read_bytes() for result, _ in results] == [b"a", b"b"]
+
+OLD_FETCH_PROVIDER = """
+from pathlib import Path
+from mcmm.plugin import FetchHandler, MCMMPlugin, PluginBase, ResolveHandler
+
+@MCMMPlugin
+class OldFetchProvider(PluginBase):
+	id = "old_fetch"
+	help_string = "A provider whose fetch handler does not take out_file"
+
+	@ResolveHandler
+	def resolve(self, mc_version, metadata):
+		return ({"file_name": "old.jar", "url": None, "version_id": "1"}, "")
+
+	@FetchHandler
+	def fetch(self, resolution):
+		out_file = Path(OUT_DIR) / resolution["file_name"]
+		out_file.write_bytes(b"old")
+		return (out_file, "")
+"""
+
+def test_fetch_handler_without_out_file(tmp_path, monkeypatch):
+	"""Fetch handlers written before out_file was added still work.
+	"""
+	(tmp_path / "old_fetch_provider.py").write_text(OLD_FETCH_PROVIDER.replace("OUT_DIR", repr(str(tmp_path))))
+	monkeypatch.syspath_prepend(str(tmp_path))
+
+	runner = load_providers(["old_fetch_provider"], registry_file=tmp_path / "providers.json")
+	try:
+		result, err_str = runner.fetch("old_fetch", {"file_name": "old.jar", "url": None, "version_id": "1"}, tmp_path / "unused.jar")
+	finally:
+		runner.close()
+	assert err_str == ""
+	assert result.path == tmp_path / "old.jar"
+	assert result.size == 3
+
+ASYNC_PROVIDERS = """
+import asyncio, threading, time
+from mcmm.plugin import AsyncFetchHandler, AsyncResolveHandler, BatchResolveHandler, MCMMPlugin, PluginBase, ResolveHandler
+
+@MCMMPlugin
+class AsyncProvider(PluginBase):
+	id = "async_provider"
+	help_string = "A provider with async handlers"
+
+	@AsyncResolveHandler
+	async def resolve(self, mc_version, metadata):
+		await asyncio.sleep(0.2)
+		return ({"file_name": f"{metadata['id']}.jar", "url": None, "version_id": threading.current_thread().name}, "")
+
+	@AsyncFetchHandler
+	async def fetch(self, resolution, out_file):
+		await asyncio.sleep(0)
+		out_file.parent.mkdir(parents=True, exist_ok=True)
+		out_file.write_bytes(resolution["file_name"].encode())
+		return (out_file, "")
+
+@MCMMPlugin
+class SyncProvider(PluginBase):
+	id = "sync_provider"
+	help_string = "A provider with plain handlers"
+
+	@ResolveHandler
+	def resolve(self, mc_version, metadata):
+		time.sleep(0.2)
+		return ({"file_name": f"{metadata['id']}.jar", "url": None, "version_id": threading.current_thread().name}, "")
+
+@MCMMPlugin
+class BatchProvider(PluginBase):
+	id = "batch_provider"
+	help_string = "A provider with a plain batch resolve handler"
+
+	@BatchResolveHandler
+	def resolve_batch(self, entries):
+		return [({"file_name": "batch.jar", "url": None, "version_id": threading.current_thread().name}, "") for _ in entries]
+
+@MCMMPlugin
+class ShortBatchProvider(PluginBase):
+	id = "short_batch_provider"
+	help_string = "A provider whose batch resolve handler loses an entry"
+
+	@BatchResolveHandler
+	def resolve_batch(self, entries):
+		return [({"file_name": "batch.jar", "url": None, "version_id": "1"}, "") for _ in entries[1:]]
+"""
+
+def _async_runner(tmp_path):
+	module = types.ModuleType("async_providers")
+	exec(ASYNC_PROVIDERS, module.__dict__)
+	return load_providers([module], registry_file=tmp_path / "providers.json")
+
+def test_async_handlers(tmp_path):
+	"""Async handlers all wait on the runner's event loop at once, no matter how few jobs there are.
+	"""
+	runner = _async_runner(tmp_path)
+	try:
+		start = time.perf_counter()
+		results = runner.resolve_many([("async_provider", "1.18.1", {"id": f"mod{i}"}, None) for i in range(20)], jobs=1)
+		assert time.perf_counter() - start < 2.0
+		assert [resolution["file_name"] for resolution, _ in results] == [f"mod{i}.jar" for i in range(20)]
+		assert {resolution["version_id"] for resolution, _ in results} == {"mcmm-provider-loop"}
+
+		result, err_str = runner.fetch("async_provider", results[0][0], tmp_path / "out" / "mod0.jar")
+		assert err_str == ""
+		assert result.path.read_bytes() == b"mod0.jar"
+		assert result.size == len(b"mod0.jar")
+	finally:
+		runner.close()
+
+def test_sync_handlers_run_in_executor(tmp_path):
+	"""Plain handlers run on the executor's threads, jobs at a time, and batch resolve handlers get all of their entries at once.
+	"""
+	runner = _async_runner(tmp_path)
+	try:
+		entries = [("sync_provider", "1.18.1", {"id": f"mod{i}"}, None) for i in range(4)]
+		entries += [("batch_provider", "1.18.1", {"id": f"mod{i}"}, None) for i in range(3)]
+		start = time.perf_counter()
+		results = runner.resolve_many(entries, jobs=4)
+		assert time.perf_counter() - start < 0.6
+		assert all(resolution["version_id"].startswith("ThreadPoolExecutor") for resolution, _ in results)
+		assert [resolution["file_name"] for resolution, _ in results] == ["mod0.jar", "mod1.jar", "mod2.jar", "mod3.jar"] + ["batch.jar"] * 3
+
+		assert runner.resolve("sync_provider", "1.18.1", {"id": "single"})[0]["file_name"] == "single.jar"
+	finally:
+		runner.close()
+
+def test_batch_handler_missing_results(tmp_path):
+	"""A batch resolve handler that returns fewer results than it got entries fails all of them instead of leaving empty resolutions.
+	"""
+	runner = _async_runner(tmp_path)
+	try:
+		results = runner.resolve_many([("short_batch_provider", "1.18.1", {"id": f"mod{i}"}, None) for i in range(3)])
+	finally:
+		runner.close()
+	assert [resolution for resolution, _ in results] == [{}, {}, {}]
+	assert all("returned 2 results for 3 entries" in err for _, err in results)
+
+def test_async_handler_must_be_coroutine_function():
+	def resolve(self, mc_version, metadata):
+		return ({}, "")
+
+	for decorator in (AsyncResolveHandler, AsyncFetchHandler):
+		with pytest.raises(TypeError):
+			decorator(resolve)
+
+def test_runner_assigns_session_and_options(provider_runner):
+	"""Providers share the session and options of their runner, never a class-level default.
+	"""
+	from mcmm.plugin import PluginBase
+
+	instance = provider_runner._provider("github")["instance"]
+	assert instance.session is provider_runner.session
+	assert instance.options is provider_runner.options
+	assert PluginBase.session is None and PluginBase.options is None
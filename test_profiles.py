@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from mcmm.profiles import JSONProfileStore, SQLiteProfileStore, copy_profiles, entry_id
+
+PROFILES = {
+	"fabric": {"minecraft_version": "1.18.1", "mods": [
+		{"provider": "modrinth", "metadata": {"id": "Sodium"}},
+		{"provider": "github", "metadata": {"repo": "owner/repo"}},
+	]},
+	"forge": {"minecraft_version": "1.19.2", "mods": [
+		{"provider": "curse_forge", "metadata": {"name": "jei", "id": "238222"}},
+		{"provider": "file", "metadata": {"path": "/jars/local.jar"}},
+	]},
+}
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+	if request.param == "json":
+		store = JSONProfileStore(tmp_path / "profiles")
+	else:
+		store = SQLiteProfileStore(tmp_path / "profiles.sqlite3")
+	for name, profile_obj in PROFILES.items():
+		store.save(name, profile_obj)
+	yield store
+	store.close()
+
+def test_entry_id():
+	assert entry_id({"metadata": {"name": "jei", "id": 238222}}) == "238222"
+	assert entry_id({"metadata": {"repo": "owner/repo"}}) == "owner/repo"
+	assert entry_id({"metadata": {}}) is None
+
+def test_load_and_save(store, tmp_path):
+	assert store.names() == ["fabric", "forge"]
+	assert store.exists("fabric") and not store.exists("quilt")
+	assert store.load("forge") == PROFILES["forge"]
+	assert store.load("quilt") is None
+
+	store.save("fabric", {"minecraft_version": "1.18.2", "mods": []})
+	assert store.load("fabric") == {"minecraft_version": "1.18.2", "mods": []}
+	assert store.find(mc_version="1.18.2") == ["fabric"]
+
+	# Lock files next to the profiles are not profiles
+	(tmp_path / "profiles").mkdir(exist_ok=True)
+	(tmp_path / "profiles/fabric.lock.json").write_text("{}")
+	assert store.names() == ["fabric", "forge"]
+
+def test_find(store):
+	assert store.find(mod_id="sodium") == ["fabric"]
+	assert store.find(provider="curse_forge", mod_id="238222") == ["forge"]
+	assert store.find(provider="modrinth", mod_id="238222") == []
+	assert store.find(provider="github") == ["fabric"]
+	assert store.find(mod_id="owner/repo", mc_version="1.19.2") == []
+	assert store.find() == ["fabric", "forge"]
+
+def test_copy_profiles(store, tmp_path):
+	"""Profiles are copied between the backends unchanged, and names the source does not have are skipped.
+	"""
+	dest = SQLiteProfileStore(tmp_path / "copy.sqlite3") if isinstance(store, JSONProfileStore) else JSONProfileStore(tmp_path / "copy")
+	try:
+		assert copy_profiles(store, dest, ["forge", "quilt"]) == ["forge"]
+		assert copy_profiles(store, dest) == ["fabric", "forge"]
+		assert {name: dest.load(name) for name in dest.names()} == PROFILES
+		assert dest.find(mod_id="jei") == []
+		assert dest.find(mod_id="/jars/local.jar") == ["forge"]
+	finally:
+		dest.close()
+
+def test_unsupported_database_version(tmp_path):
+	db = sqlite3.connect(str(tmp_path / "profiles.sqlite3"))
+	db.execute("PRAGMA user_version = 99")
+	db.close()
+	with pytest.raises(ValueError):
+		SQLiteProfileStore(tmp_path / "profiles.sqlite3")
@@ -0,0 +1,147 @@
+import pytest
+import requests
+
+from mcmm import ratelimit
+from mcmm.ratelimit import DEFAULT_THROTTLE_PAUSE, MIN_RATE, RateLimiter
+from mcmm.session import ProviderSession, _authorizations
+
+GITHUB = "https://api.github.com/repos/owner/repo"
+MODRINTH = "https://api.modrinth.com/v2/project/abc"
+
+class _Clock:
+	"""Stands in for the time module of ratelimit, so that waiting only moves the clock forward.
+	"""
+	def __init__(self):
+		self.now = 1700000000.0
+		self.sleeps = []
+
+	def time(self) -> float:
+		return self.now
+
+	def monotonic(self) -> float:
+		return self.now
+
+	def sleep(self, seconds: float) -> None:
+		self.sleeps.append(seconds)
+		self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+	clock = _Clock()
+	monkeypatch.setattr(ratelimit, "time", clock)
+	return clock
+
+def _response(status_code: int = 200, **headers) -> requests.Response:
+	r = requests.Response()
+	r.status_code = status_code
+	r.headers.update({name.replace("_", "-"): str(value) for name, value in headers.items()})
+	r._content = b""
+	return r
+
+def test_reset_timestamp_and_seconds(clock):
+	"""GitHub's reset is a POSIX timestamp and Modrinth's is seconds from now, and both hosts wait for the same 30 s.
+	"""
+	limiter = RateLimiter()
+	limiter.update(GITHUB, _response(X_RateLimit_Remaining=2, X_RateLimit_Reset=int(clock.now) + 30))
+	limiter.update(MODRINTH, _response(X_RateLimit_Remaining=2, X_RateLimit_Reset=30))
+
+	for url in (GITHUB, MODRINTH):
+		assert limiter.acquire(url) == 0
+		assert limiter.acquire(url) == 0
+	assert limiter.acquire(GITHUB) == 30
+	assert limiter.acquire(MODRINTH) == 0
+	assert clock.sleeps == [30]
+
+	exhausted = {"X_RateLimit_Remaining": 0}
+	assert limiter.rate_limit_wait(_response(403, X_RateLimit_Reset=int(clock.now) + 20, **exhausted)) == 20
+	assert limiter.rate_limit_wait(_response(403, X_RateLimit_Reset=20, **exhausted)) == 20
+	# Any other 403 is not about the rate limit
+	assert limiter.rate_limit_wait(_response(403)) is None
+
+def test_retry_after_pauses_host(clock):
+	"""A Retry-After pauses every request to its host, but not the requests to other hosts.
+	"""
+	limiter = RateLimiter()
+	r = _response(429, Retry_After=5)
+	limiter.update(MODRINTH, r)
+
+	assert limiter.rate_limit_wait(r) == 5
+	assert limiter.acquire(GITHUB) == 0
+	assert limiter.acquire("https://api.modrinth.com/v2/version/def") == 5
+	assert clock.sleeps == [5]
+
+def test_throttled_without_headers(clock):
+	"""A 429 without rate limit headers pauses the host and halves its rate, down to MIN_RATE.
+	"""
+	limiter = RateLimiter(hosts={"api.modrinth.com": {"requests_per_second": 4.0}})
+	r = _response(429)
+	assert limiter.rate_limit_wait(r) == DEFAULT_THROTTLE_PAUSE
+
+	limiter.update(MODRINTH, r)
+	assert limiter.acquire(MODRINTH) >= DEFAULT_THROTTLE_PAUSE
+
+	# Once the pause is over, requests are spaced out by the halved rate of 2 per second
+	clock.sleeps.clear()
+	for _ in range(4):
+		limiter.acquire(MODRINTH)
+	assert sum(clock.sleeps) == pytest.approx(1.5)
+
+	for _ in range(10):
+		limiter.update(MODRINTH, r)
+	clock.now += 60
+	clock.sleeps.clear()
+	limiter.acquire(MODRINTH)
+	limiter.acquire(MODRINTH)
+	assert clock.sleeps[-1] == pytest.approx(1 / MIN_RATE)
+
+def test_max_wait(clock, capsys):
+	"""A request that would wait longer than max_wait goes through right away, with one warning per host.
+	"""
+	limiter = RateLimiter(max_wait=60)
+	r = _response(403, X_RateLimit_Remaining=0, X_RateLimit_Reset=600)
+	limiter.update(GITHUB, r)
+
+	assert limiter.acquire(GITHUB) == 0
+	assert limiter.acquire(GITHUB) == 0
+	assert clock.sleeps == []
+	assert capsys.readouterr().out.count("api.github.com") == 2
+
+	# The session does not retry it either
+	assert limiter.rate_limit_wait(r) > limiter.max_wait
+
+def test_tokens_stay_on_their_host(monkeypatch):
+	"""Every token is only sent to its own host, even to other hosts of the same provider.
+	"""
+	monkeypatch.setenv("GITHUB_TOKEN", "from-env")
+	config = {"tokens": {"modrinth": "mr", "example.org": "ex"}}
+	authorizations = _authorizations(config)
+	assert authorizations == {
+		"api.github.com": "Bearer from-env",
+		"api.modrinth.com": "mr",
+		"example.org": "Bearer ex",
+	}
+	assert _authorizations({"tokens": {"github": "gh"}}) == {"api.github.com": "Bearer gh"}
+
+	sent = {}
+	def request(self, method, url, **kwargs):
+		sent[url] = (kwargs.get("headers") or {}).get("Authorization")
+		return _response()
+	monkeypatch.setattr(requests.Session, "request", request)
+
+	session = ProviderSession(authorizations=authorizations)
+	for url in (
+		GITHUB,
+		MODRINTH,
+		"https://example.org/file.jar",
+		"https://github.com/owner/repo/releases/download/v1/mod.jar",
+		"https://cdn.modrinth.com/data/abc/mod.jar",
+		"https://api.github.com.example.net/repos",
+		"https://sub.example.org/file.jar",
+	):
+		session.get(url)
+
+	assert {url: header for url, header in sent.items() if header is not None} == {
+		GITHUB: "Bearer from-env",
+		MODRINTH: "mr",
+		"https://example.org/file.jar": "Bearer ex",
+	}
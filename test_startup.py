@@ -0,0 +1,23 @@
+import json, subprocess, sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).parent
+
+# Modules that only the commands talking to Mod Providers should import
+NETWORK_MODULES = ["requests", "urllib3", "bs4", "dateutil"]
+
+def _run_cli(home: Path, *args: str) -> subprocess.CompletedProcess:
+	code = f"import json, sys; sys.argv = {['mcmm'] + list(args)!r}; from mcmm import cli; cli(); print(json.dumps(sorted(sys.modules)))"
+	env = {"HOME": str(home), "LOCALAPPDATA": str(home), "APPDATA": str(home), "PATH": ""}
+	return subprocess.run([sys.executable, "-c", code], cwd=str(REPO_DIR), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+def test_cheap_commands_skip_network_libraries_and_side_effects(tmp_path):
+	for args in [("list",), ("deactivate",), ("--version",)]:
+		p = _run_cli(tmp_path, *args)
+		assert p.returncode == 0, p.stderr
+
+		modules = json.loads(p.stdout.splitlines()[-1])
+		for module in NETWORK_MODULES:
+			assert module not in modules, f"'mcmm {' '.join(args)}' imported {module}"
+
+		assert list(tmp_path.iterdir()) == [], f"'mcmm {' '.join(args)}' created {list(tmp_path.iterdir())}"
@@ -0,0 +1,118 @@
+import hashlib, os, stat
+from pathlib import Path
+
+from mcmm.store import STAGING_DIR_NAME, JarStore
+
+def _add(store: JarStore, tmp_path, name: str, content: bytes) -> dict:
+	file = tmp_path / f"{name}.download"
+	file.write_bytes(content)
+	sha256, size = store.add(file)
+	return {"file_name": name, "sha256": sha256, "size": size}
+
+def test_add(tmp_path):
+	"""Jars are stored once by their SHA-256, read-only.
+	"""
+	store = JarStore(tmp_path / "store")
+	jar = _add(store, tmp_path, "a.jar", b"a")
+	again = _add(store, tmp_path, "copy-of-a.jar", b"a")
+
+	assert jar["sha256"] == again["sha256"] == hashlib.sha256(b"a").hexdigest()
+	assert store.object_path(jar["sha256"]).read_bytes() == b"a"
+	assert stat.S_IMODE(store.object_path(jar["sha256"]).stat().st_mode) & 0o222 == 0
+	assert not (tmp_path / "copy-of-a.jar.download").exists()
+	assert len(list(store.objects_dir.glob("*/*"))) == 1
+
+def test_sync(tmp_path):
+	"""Only the jars that differ are written, jars the manifest does not list are removed and other files are left alone.
+	"""
+	store = JarStore(tmp_path / "store")
+	mods_folder = tmp_path / "mods"
+	mods_folder.mkdir()
+	(mods_folder / "notes.txt").write_text("not a jar")
+	a, b, c = (_add(store, tmp_path, name, name.encode()) for name in ("a.jar", "b.jar", "c.jar"))
+
+	result = store.sync(mods_folder, [a, b])
+	assert (result.unchanged, result.written, result.removed, result.bytes_written) == (0, 2, 0, 0)
+	assert os.path.samefile(str(mods_folder / "a.jar"), str(store.object_path(a["sha256"])))
+
+	# A jar with the right name but other contents is replaced
+	os.remove(str(mods_folder / "b.jar"))
+	(mods_folder / "b.jar").write_bytes(b"changed")
+	result = store.sync(mods_folder, [a, b, c])
+	assert (result.unchanged, result.written, result.removed) == (1, 2, 0)
+	assert (mods_folder / "b.jar").read_bytes() == b"b.jar"
+
+	result = store.sync(mods_folder, [c])
+	assert (result.unchanged, result.written, result.removed) == (1, 0, 2)
+	assert sorted(file.name for file in mods_folder.iterdir()) == ["c.jar", "notes.txt"]
+	assert not (mods_folder / STAGING_DIR_NAME).exists()
+
+def test_sync_read_only(tmp_path, monkeypatch):
+	"""Replacing and removing hard linked jars where read-only files can not be deleted (like on Windows) keeps their objects read-only.
+	"""
+	def writable(path) -> bool:
+		return not os.path.exists(str(path)) or os.stat(str(path)).st_mode & stat.S_IWUSR != 0
+
+	unlink, replace = Path.unlink, os.replace
+	def windows_unlink(self):
+		if not writable(self):
+			raise PermissionError(f"read-only: {self}")
+		unlink(self)
+	def windows_replace(src, dest):
+		if not writable(dest):
+			raise PermissionError(f"read-only: {dest}")
+		replace(src, dest)
+	monkeypatch.setattr(Path, "unlink", windows_unlink)
+	monkeypatch.setattr(os, "replace", windows_replace)
+
+	store = JarStore(tmp_path / "store")
+	mods_folder = tmp_path / "mods"
+	mods_folder.mkdir()
+	a, b = _add(store, tmp_path, "a.jar", b"a"), _add(store, tmp_path, "b.jar", b"b")
+	store.sync(mods_folder, [a, b])
+
+	result = store.sync(mods_folder, [dict(b, file_name="a.jar")])
+	assert (result.written, result.removed) == (1, 1)
+	assert (mods_folder / "a.jar").read_bytes() == b"b"
+	assert not (mods_folder / "b.jar").exists()
+	for jar in (a, b):
+		assert store.object_path(jar["sha256"]).stat().st_mode & 0o222 == 0
+
+def test_gc(tmp_path):
+	"""gc removes the objects that no manifest points to.
+	"""
+	store = JarStore(tmp_path / "store")
+	a, b = _add(store, tmp_path, "a.jar", b"a"), _add(store, tmp_path, "b.jar", b"b")
+	store.save_manifest("profile", [a])
+
+	assert store.referenced_objects() == {a["sha256"]}
+	assert store.gc() == 1
+	assert store.has_object(a["sha256"])
+	assert not store.has_object(b["sha256"])
+	assert store.gc() == 0
+
+def test_gc_keeps_locked_jars(tmp_path):
+	"""Jars that only a lock file points to (fetched by lock or mirror) are kept.
+	"""
+	from mcmm.lockfile import save_lock
+
+	store = JarStore(tmp_path / "store")
+	a, b = _add(store, tmp_path, "a.jar", b"a"), _add(store, tmp_path, "b.jar", b"b")
+	save_lock(tmp_path / "profile.lock.json", {"mods": []}, "1.18.1", [dict(b, provider="modrinth", metadata={}, key="b", resolution={})])
+	(tmp_path / "broken.lock.json").write_text("{")
+
+	assert store.gc(tmp_path.glob("*.lock.json")) == 1
+	assert store.has_object(b["sha256"])
+	assert not store.has_object(a["sha256"])
+
+def test_gc_skips_temporary_files(tmp_path):
+	"""Files that add is still writing next to the objects are not objects, so gc leaves them alone.
+	"""
+	store = JarStore(tmp_path / "store")
+	a = _add(store, tmp_path, "a.jar", b"a")
+	tmp = store.object_path(a["sha256"]).parent / f".{'0' * 64}.1234.tmp"
+	tmp.write_bytes(b"half written")
+
+	assert list(store.objects()) == [store.object_path(a["sha256"])]
+	assert store.gc() == 1
+	assert tmp.exists()
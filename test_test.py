@@ -1,4 +0,0 @@
-def test_the_test():
-	"""Just a simple test so that pytest doesn't fail
-	"""
-	assert True == True
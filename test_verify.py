@@ -0,0 +1,46 @@
+import hashlib, os, stat
+
+from mcmm.fetch import FetchResult
+from mcmm.store import JarStore
+from mcmm.verify import check_download, upstream_hash, verify_jar, verify_jars
+
+CONTENT = b"jar contents"
+HASHES = {name: hashlib.new(name, CONTENT).hexdigest() for name in ("sha1", "sha256", "sha512")}
+
+def test_upstream_hash():
+	"""The strongest published hash is used, unless the hash that is already known for the jar is published too.
+	"""
+	assert upstream_hash({"hashes": {"SHA1": "a", "sha512": "b"}}) == {"name": "sha512", "digest": "b"}
+	assert upstream_hash({"hashes": {"sha1": "a", "sha512": "b"}}, "sha1") == {"name": "sha1", "digest": "a"}
+	assert upstream_hash({"hashes": {"sha512": ""}}) is None
+	assert upstream_hash(None) is None
+
+def test_check_download(tmp_path):
+	file = tmp_path / "a.jar"
+	file.write_bytes(CONTENT)
+	result = FetchResult(file, len(CONTENT), "sha256", HASHES["sha256"])
+
+	assert check_download(result, {"size": len(CONTENT), "hashes": {"sha1": HASHES["sha1"], "sha512": HASHES["sha512"]}}) == ""
+	assert check_download(result, {}) == ""
+	assert "bytes" in check_download(result, {"size": len(CONTENT) + 1})
+	assert "sha512" in check_download(result, {"hashes": {"sha512": HASHES["sha1"]}})
+
+def test_verify_jar(tmp_path):
+	"""Store objects are checked against their SHA-256, size and published hash.
+	"""
+	store = JarStore(tmp_path / "store")
+	file = tmp_path / "a.jar"
+	file.write_bytes(CONTENT)
+	sha256, size = store.add(file)
+	jar = {"file_name": "a.jar", "sha256": sha256, "size": size, "resolution": {"hashes": {"sha512": HASHES["sha512"]}}}
+	missing = dict(jar, sha256="0" * 64)
+
+	assert [result.problems for result in verify_jars(store, [jar, missing], 2)] == [[], ["missing from the jar store"]]
+
+	obj = store.object_path(sha256)
+	os.chmod(str(obj), stat.S_IWUSR | stat.S_IRUSR)
+	obj.write_bytes(b"corrupted")
+	problems = verify_jar(store, jar).problems
+	assert len(problems) == 3
+	assert any(problem.startswith("has SHA-256") for problem in problems)
+	assert any(problem.startswith("has sha512") for problem in problems)